@@ -0,0 +1,106 @@
+import random
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from billing.models import Billing
+from meal.models import (COMPONENT_GROUP_CHOICES_MAIN_DISH,
+                         COMPONENT_GROUP_CHOICES_SIDES)
+from member.models import Client, Member, Route
+from order.models import Order, Order_item, ORDER_STATUS_DELIVERED
+
+
+# Delivered orders of each client in a month.
+ORDERS_PER_CLIENT = 3
+
+
+class Command(BaseCommand):
+    help = 'Measure Billing.summary on generated monthly billings. \
+            The generated data is rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'orders',
+            help='The numbers of delivered orders in a month to measure.',
+            nargs='*',
+            default=[5000, 20000],
+            type=int
+        )
+        parser.add_argument(
+            '--seed',
+            help='The seed of the random sizes and quantities.',
+            default=0,
+            type=int
+        )
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        with transaction.atomic():
+            for i, count in enumerate(options['orders']):
+                billing = self.create_billing(
+                    date(2000 + i, 1, 1), count)
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.time()
+                    summary = billing.summary
+                    elapsed = time.time() - start
+                self.stdout.write(
+                    "{0} orders: {1} clients, {2} queries, "
+                    "{3:.3f}s.".format(
+                        count, len(summary), len(queries), elapsed))
+            transaction.set_rollback(True)
+
+    def create_billing(self, month, count):
+        """
+        Create the delivered orders of a month, ORDERS_PER_CLIENT per
+        client, of a main dish and sides, and their billing.
+        """
+        last_member = Member.objects.order_by('-pk').first()
+        Member.objects.bulk_create(
+            Member(firstname='Client {}'.format(i), lastname='Benchmark')
+            for i in range(-(-count // ORDERS_PER_CLIENT)))
+        members = Member.objects.filter(
+            pk__gt=last_member.pk if last_member else 0).order_by('pk')
+        route = Route.objects.create(name='Benchmark {}'.format(month))
+        last_client = Client.objects.order_by('-pk').first()
+        Client.objects.bulk_create(
+            Client(member=member, billing_member=member, route=route,
+                   status=Client.ACTIVE)
+            for member in members)
+        client_ids = list(Client.objects.filter(
+            pk__gt=last_client.pk if last_client else 0
+        ).order_by('pk').values_list('pk', flat=True))
+
+        last_order = Order.objects.order_by('-pk').first()
+        Order.objects.bulk_create(
+            Order(client_id=client_ids[i // ORDERS_PER_CLIENT],
+                  delivery_date=month.replace(day=1 + i % 28),
+                  status=ORDER_STATUS_DELIVERED)
+            for i in range(count))
+        order_ids = list(Order.objects.filter(
+            pk__gt=last_order.pk if last_order else 0
+        ).values_list('pk', flat=True))
+        items = []
+        for order_id in order_ids:
+            items.append(Order_item(
+                order_id=order_id, price=4, billable_flag=True,
+                size=random.choice('RL'), order_item_type='meal_component',
+                total_quantity=random.choice([1, 1, 1, 2]),
+                component_group=COMPONENT_GROUP_CHOICES_MAIN_DISH))
+            items.append(Order_item(
+                order_id=order_id, price=1,
+                billable_flag=random.random() < 0.5,
+                size=None, order_item_type='meal_component',
+                total_quantity=1,
+                component_group=COMPONENT_GROUP_CHOICES_SIDES))
+        Order_item.objects.bulk_create(items)
+
+        billing = Billing.objects.create(
+            total_amount=0, billing_month=month.month,
+            billing_year=month.year, detail={})
+        Billing.orders.through.objects.bulk_create(
+            Billing.orders.through(billing_id=billing.pk, order_id=order_id)
+            for order_id in order_ids)
+        return billing
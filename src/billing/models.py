@@ -1,14 +1,30 @@
 import collections
-from django.db import models
-from django.db.models import Q, Sum, Prefetch
+import copy
+from django.db import connections, models, transaction
+from django.db.models import (Case, Count, DecimalField, IntegerField, Q,
+                              Sum, When)
 from member.models import Client
 from order.models import Order, Order_item
 from datetime import datetime, date
+from decimal import Decimal
 from annoying.fields import JSONField
 from django.utils.translation import ugettext_lazy as _
 from django_filters import FilterSet, CharFilter
 
 
+CENTS = Decimal('0.01')
+
+
+def format_amount(amount):
+    """
+    Return an amount as it is stored in `Billing.detail`: a string of the
+    amount rounded to the cent, e.g. '12.00', and '0.00' for no amount.
+    The JSON encoder would give a string for a Decimal but a number for
+    an integer zero.
+    """
+    return str(Decimal(amount).quantize(CENTS))
+
+
 class BillingManager(models.Manager):
 
     def billing_create_new(self, year, month):
@@ -16,36 +32,33 @@ class BillingManager(models.Manager):
         Create a new billing for the given period.
         A period is a month.
          """
-        # Get all billable orders for the given period
+        # Get all billable orders for the given period, never loaded:
+        # the billing is made by the database, whatever their number
         billable_orders = Order.objects.get_billable_orders(
             year, month
-        ).select_related(
-            'client__member'
-        ).only(
-            'client__member__firstname',
-            'client__member__lastname'
-        ).prefetch_related(Prefetch(
-            'orders',
-            queryset=Order_item.objects.all().only(
-                'order__id',
-                'price',
-                'billable_flag'
+        ).order_by()
+
+        with transaction.atomic(using=self.db):
+            total_amount = Order_item.objects.filter(
+                order__in=billable_orders,
+                billable_flag=True
+            ).aggregate(total=Sum('price'))['total'] or 0
+
+            # Create the Billing object
+            billing = Billing.objects.create(
+                total_amount=total_amount,
+                billing_month=month,
+                billing_year=year,
+                created=datetime.today(),
+                detail={},
             )
-        ))
 
-        total_amount = calculate_amount_total(billable_orders)
+            # Attach the orders
+            attach_orders(billing, billable_orders)
 
-        # Create the Billing object
-        billing = Billing.objects.create(
-            total_amount=total_amount,
-            billing_month=month,
-            billing_year=year,
-            created=datetime.today(),
-            detail={},
-        )
-
-        # Attach the orders
-        billing.orders.add(*billable_orders)
+            # Freeze the summary of the orders
+            billing.detail = billing.make_detail()
+            billing.save(update_fields=['detail'])
 
         return billing
 
@@ -104,44 +117,133 @@ class Billing(models.Model):
         """
         Return a summary of every client.
         Format: dictionary {client: info}
+
+        The statistics are aggregated by the database, grouped by client:
+        a constant number of queries whatever the number of orders.
         """
-        # collect orders by clients
-        kvpairs = map(
-            lambda o: (o.client, o),
-            self.orders.all()
-        )
-        d = collections.defaultdict(list)
-        for k, v in kvpairs:
-            d[k].append(v)
+        main_dish = Q(component_group='main_dish')
+        items = Order_item.objects.filter(order__billing=self).values(
+            'order__client_id'
+        ).annotate(
+            main_dishes_R=Sum(Case(
+                When(main_dish & Q(size='R'), then='total_quantity'),
+                output_field=IntegerField())),
+            main_dishes_L=Sum(Case(
+                When(main_dish & Q(size='L'), then='total_quantity'),
+                output_field=IntegerField())),
+            billable_sides=Sum(Case(
+                When((Q(component_group__isnull=True) | ~main_dish) &
+                     Q(billable_flag=True), then='total_quantity'),
+                output_field=IntegerField())),
+            amount=Sum(Case(
+                When(billable_flag=True, then='price'),
+                output_field=DecimalField(max_digits=8, decimal_places=2))),
+        ).order_by()
+        items = {row['order__client_id']: row for row in items}
+        orders = self.orders.values('client_id').annotate(
+            count=Count('id')).order_by()
+        clients = Client.objects.select_related('member').in_bulk(
+            [row['client_id'] for row in orders])
+
         result = {}
-        for client, orders in d.items():
-            result[client] = {
-                'total_orders': len(orders),
+        for row in orders:
+            statistics = items.get(row['client_id'], {})
+            result[clients[row['client_id']]] = {
+                'total_orders': row['count'],
                 'total_main_dishes': {
-                    'R': 0,  # to be counted
-                    'L': 0
+                    'R': statistics.get('main_dishes_R') or 0,
+                    'L': statistics.get('main_dishes_L') or 0
                 },
-                'total_billable_sides': 0,  # to be counted
-                'total_amount': sum(map(lambda o: o.price, orders))
+                'total_billable_sides': statistics.get('billable_sides') or 0,
+                'total_amount': statistics.get('amount') or 0
             }
-            for o in orders:
-                for o_item in o.orders.all():
-                    if o_item.component_group == 'main_dish':
-                        if o_item.size == 'R':
-                            result[client][
-                                'total_main_dishes'
-                            ]['R'] += o_item.total_quantity
-                        elif o_item.size == 'L':
-                            result[client][
-                                'total_main_dishes'
-                            ]['L'] += o_item.total_quantity
-                    else:
-                        if o_item.billable_flag is True:
-                            result[client][
-                                'total_billable_sides'
-                            ] += o_item.total_quantity
         return result
 
+    def make_detail(self):
+        """
+        Return the snapshot of the summary stored in `detail`: the
+        statistics of every client, grouped by payment type, and their
+        subtotals and totals. The clients are identified by their id,
+        names, payment type and rate type.
+        Format: dictionary {
+            'total_main_dishes': {'R': int, 'L': int},
+            'total_billable_sides': int,
+            'total_amount': str,
+            'payment_types': [(payment type, statistics), ...]
+        }, where the statistics of a payment type have the same totals
+        and a list of 'clients' sorted by name.
+        Every amount is a string given by format_amount, e.g. '12.00',
+        so that it is rendered the same before and after being saved.
+        """
+        zero_statistics = {
+            'total_main_dishes': {
+                'R': 0,
+                'L': 0
+            },
+            'total_billable_sides': 0,
+            'total_amount': 0
+        }
+        detail = copy.deepcopy(zero_statistics)
+        payment_types = collections.defaultdict(
+            lambda: dict(clients=[], **copy.deepcopy(zero_statistics))
+        )
+        for client, client_summary in self.summary.items():
+            t = client.billing_payment_type
+            for statistics in (payment_types[t], detail):
+                statistics['total_main_dishes']['R'] += (
+                    client_summary['total_main_dishes']['R']
+                )
+                statistics['total_main_dishes']['L'] += (
+                    client_summary['total_main_dishes']['L']
+                )
+                statistics['total_billable_sides'] += (
+                    client_summary['total_billable_sides']
+                )
+                statistics['total_amount'] += (
+                    client_summary['total_amount']
+                )
+            payment_types[t]['clients'].append({
+                'id': client.id,
+                'firstname': client.member.firstname,
+                'lastname': client.member.lastname,
+                'payment_type': client.billing_payment_type,
+                'rate_type': client.rate_type,
+                'total_orders': client_summary['total_orders'],
+                'total_main_dishes': client_summary['total_main_dishes'],
+                'total_billable_sides': client_summary['total_billable_sides'],
+                'total_amount': format_amount(client_summary['total_amount'])
+            })
+
+        # sort clients in each payment type group
+        for payment_type, statistics in payment_types.items():
+            statistics['clients'].sort(
+                key=lambda c: (c['lastname'], c['firstname'])
+            )
+            statistics['total_amount'] = format_amount(
+                statistics['total_amount'])
+        detail['total_amount'] = format_amount(detail['total_amount'])
+
+        # reorder the display for supported & non-supported payment types
+        detail['payment_types'] = sorted(
+            payment_types.items(),
+            key=lambda tup: {
+                ' ': 0,      # 0th position
+                'credit': 1,    # 1st position
+                'eft': 2,     # 2nd position
+                '3rd': 3,  # 3rd position
+            }.get(tup[0], 99)  # last position(s)
+        )
+        return detail
+
+    def recompute(self):
+        """
+        Rebuild the snapshot of the summary and the total amount from the
+        orders, e.g. after they have been corrected.
+        """
+        self.detail = self.make_detail()
+        self.total_amount = Decimal(self.detail['total_amount'])
+        self.save(update_fields=['detail', 'total_amount'])
+
 
 class BillingFilter(FilterSet):
     name = CharFilter(
@@ -186,6 +288,32 @@ class BillingFilter(FilterSet):
         return queryset.filter(billing_year=year, billing_month=month)
 
 
+def attach_orders(billing, orders):
+    """
+    Attach orders to a billing with a single INSERT ... SELECT into the
+    table of Billing.orders, without loading them.
+
+    Args:
+        billing: A saved Billing.
+        orders: A queryset of Order.
+    """
+    through = Billing.orders.through
+    connection = connections[billing._state.db or 'default']
+    quote_name = connection.ops.quote_name
+    sql, params = orders.values_list('pk').order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {table} ({billing}, {order}) '
+            'SELECT %s, {pk} FROM ({orders}) billable_orders'.format(
+                table=quote_name(through._meta.db_table),
+                billing=quote_name(
+                    through._meta.get_field('billing').column),
+                order=quote_name(through._meta.get_field('order').column),
+                pk=quote_name(Order._meta.pk.column),
+                orders=sql),
+            (billing.pk,) + tuple(params))
+
+
 # get the total amount from a list of orders
 def calculate_amount_total(orders):
     total = 0
@@ -1,8 +1,13 @@
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.template.loader import render_to_string
 from order.factories import OrderFactory, OrderItemFactory
 from billing.models import Billing, calculate_amount_total, BillingManager
 import datetime
 import importlib
+import io
 from member.factories import ClientFactory, RouteFactory
 from order.models import Order
 from django.contrib.auth.models import User
@@ -75,12 +80,134 @@ class BillingManagerTestCase(TestCase):
         # We created 10 orders, with one billable 10$ value item each
         self.assertEqual(50.00, billing.total_amount)
 
+    def test_billing_create_new_queries(self):
+        """The orders are neither loaded nor attached one by one."""
+        with CaptureQueriesContext(connection) as queries:
+            Billing.objects.billing_create_new(
+                self.today.year, self.today.month)
+        OrderFactory.create_batch(
+            20, delivery_date=self.today, status="D", )
+        with self.assertNumQueries(len(queries)):
+            billing = Billing.objects.billing_create_new(
+                self.today.year, self.today.month)
+        self.assertEqual(30, billing.orders.count())
+        self.assertEqual(150, billing.total_amount)
+        # orders of other months or not delivered are not attached
+        OrderFactory(delivery_date=self.today - datetime.timedelta(days=40),
+                     status="D")
+        OrderFactory(delivery_date=self.today, status="O")
+        billing = Billing.objects.billing_create_new(
+            self.today.year, self.today.month)
+        self.assertEqual(30, billing.orders.count())
+
     def test_billing_get_period(self):
         billing = Billing.objects.billing_get_period(
             self.today.year, self.today.month)
         self.assertEqual(None, billing)
 
 
+class BillingSummaryTestCase(TestCase):
+
+    fixtures = ['routes.json']
+
+    def setUp(self):
+        self.today = datetime.datetime.today()
+        for client in ClientFactory.create_batch(3):
+            for order in OrderFactory.create_batch(
+                    3, delivery_date=self.today, status="D", client=client):
+                for size in ('R', 'L'):
+                    OrderItemFactory(
+                        order=order, size=size, component_group='main_dish',
+                        order_item_type='meal_component', total_quantity=1)
+                OrderItemFactory(
+                    order=order, component_group='dessert',
+                    order_item_type='meal_component', total_quantity=2)
+        # a client without any billable item
+        OrderFactory(delivery_date=self.today, status="D",
+                     order_item__billable_flag=False)
+        self.billing = Billing.objects.billing_create_new(
+            self.today.year, self.today.month)
+
+    def python_summary(self):
+        """The summary aggregated in Python, item by item."""
+        result = {}
+        for order in self.billing.orders.all():
+            info = result.setdefault(order.client, {
+                'total_orders': 0,
+                'total_main_dishes': {'R': 0, 'L': 0},
+                'total_billable_sides': 0,
+                'total_amount': 0})
+            info['total_orders'] += 1
+            info['total_amount'] += order.price
+            for item in order.orders.all():
+                if item.component_group == 'main_dish':
+                    if item.size in ('R', 'L'):
+                        info['total_main_dishes'][item.size] += \
+                            item.total_quantity
+                elif item.billable_flag is True:
+                    info['total_billable_sides'] += item.total_quantity
+        return result
+
+    def test_summary(self):
+        with self.assertNumQueries(3):
+            summary = self.billing.summary
+        self.assertEqual(len(summary), 4)
+        self.assertEqual(summary, self.python_summary())
+        self.assertEqual(
+            sum(info['total_amount'] for info in summary.values()),
+            self.billing.total_amount)
+
+    def test_detail(self):
+        detail = Billing.objects.get(pk=self.billing.pk).detail
+        self.assertEqual(
+            str(self.billing.total_amount), detail['total_amount'])
+        clients = [client
+                   for payment_type, statistics in detail['payment_types']
+                   for client in statistics['clients']]
+        self.assertEqual(
+            sorted(client['id'] for client in clients),
+            sorted(client.id for client in self.python_summary()))
+        self.assertEqual(detail['total_main_dishes'], {'R': 9, 'L': 9})
+        self.assertEqual(
+            sum(client['total_billable_sides'] for client in clients),
+            detail['total_billable_sides'])
+
+    def test_detail_renders_as_saved(self):
+        def render(summary):
+            return render_to_string('billing/partials/summary.html', {
+                'billing': self.billing, 'summary': summary})
+
+        saved = Billing.objects.get(pk=self.billing.pk).detail
+        self.assertEqual(render(self.billing.make_detail()), render(saved))
+        # the client without any billable item
+        self.assertIn('$0.00<', render(saved))
+        self.assertNotIn('$0<', render(saved))
+
+    def test_recompute(self):
+        # an order corrected after the billing was created
+        item = OrderItemFactory(
+            order=self.billing.orders.first(), price=100,
+            billable_flag=True, component_group='main_dish', size='R',
+            order_item_type='meal_component', total_quantity=1)
+        total_amount = self.billing.total_amount
+        billing = Billing.objects.get(pk=self.billing.pk)
+        self.assertEqual(billing.detail['total_main_dishes']['R'], 9)
+        billing.recompute()
+        billing = Billing.objects.get(pk=self.billing.pk)
+        self.assertEqual(billing.detail['total_main_dishes']['R'], 10)
+        self.assertEqual(billing.total_amount, total_amount + 100)
+
+    def test_benchmarkbilling(self):
+        out = io.StringIO()
+        orders_count = Order.objects.count()
+        call_command('benchmarkbilling', 30, 60, stdout=out)
+        output = out.getvalue()
+        self.assertIn("30 orders: 10 clients, 3 queries", output)
+        self.assertIn("60 orders: 20 clients, 3 queries", output)
+        # The generated data is rolled back.
+        self.assertEqual(Order.objects.count(), orders_count)
+
+
 class RedirectAnonymousUserTestCase(SousChefTestMixin, TestCase):
 
     fixtures = ['routes.json']
@@ -203,6 +330,39 @@ class BillingSummaryViewTestCase(SousChefTestMixin, TestCase):
         self.assertEqual(response.status_code, 200)
 
 
+class BillingRecomputeViewTestCase(SousChefTestMixin, TestCase):
+
+    fixtures = ['routes.json']
+
+    def setUp(self):
+        self.today = datetime.datetime.today()
+        self.orders = OrderFactory.create_batch(
+            3, delivery_date=self.today, status="D",
+            order_item__price=5)
+        self.billing = Billing.objects.billing_create_new(
+            self.today.year, self.today.month)
+        self.url = reverse('billing:recompute', args=(self.billing.id, ))
+
+    def test_redirects_users_who_do_not_have_edit_permission(self):
+        User.objects.create_user(
+            username='foo', email='foo@example.com', password='secure')
+        self.client.login(username='foo', password='secure')
+        self.assertRedirectsWithAllMethods(self.url)
+
+    def test_summary_is_rendered_from_the_snapshot(self):
+        self.force_login()
+        view_url = reverse('billing:view', args=(self.billing.id, ))
+        response = self.client.get(view_url)
+        self.assertEqual(response.context['summary']['total_amount'], '15.00')
+        OrderItemFactory(order=self.orders[0], price=10, billable_flag=True)
+        response = self.client.get(view_url)
+        self.assertEqual(response.context['summary']['total_amount'], '15.00')
+        response = self.client.post(self.url)
+        self.assertRedirects(response, view_url)
+        response = self.client.get(view_url)
+        self.assertEqual(response.context['summary']['total_amount'], '25.00')
+
+
 class BillingDeleteViewTestCase(SousChefTestMixin, TestCase):
     def test_redirects_users_who_do_not_have_edit_permission(self):
         # Setup
@@ -1,7 +1,7 @@
 from django.conf.urls import url
 from billing.views import (
     BillingList, BillingCreate, BillingDelete,
-    BillingSummaryView, BillingOrdersView, BillingAdd
+    BillingSummaryView, BillingOrdersView, BillingAdd, BillingRecompute
 )
 from django.utils.translation import ugettext_lazy as _
 
@@ -15,5 +15,7 @@ urlpatterns = [
         BillingSummaryView.as_view(), name="view"),
     url(_(r'^view/(?P<pk>\d+)/orders/$'),
         BillingOrdersView.as_view(), name="view_orders"),
+    url(_(r'^view/(?P<pk>\d+)/recompute/$'),
+        BillingRecompute.as_view(), name="recompute"),
     url(_(r'^delete/(?P<pk>\d+)/$'), BillingDelete.as_view(), name='delete'),
 ]
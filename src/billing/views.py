@@ -1,6 +1,3 @@
-import copy
-import collections
-
 from django.db.models import Q, Count, Prefetch
 from django.views import generic
 from django.utils.translation import string_concat
@@ -16,7 +13,8 @@ from order.models import DeliveredOrdersByMonth
 from django.urls import reverse_lazy
 from order.models import Order, Order_item
 from django.http import HttpResponseRedirect
-from member.models import Client
+from django.shortcuts import get_object_or_404
+from member.models import Client, PAYMENT_TYPE, RATE_TYPE
 
 
 class BillingList(
@@ -125,27 +123,6 @@ class BillingSummaryView(
     permission_required = 'sous_chef.read'
     template_name = "billing/view.html"
     context_object_name = "billing"
-    queryset = Billing.objects.prefetch_related(Prefetch(
-        'orders',
-        queryset=Order.objects.all().select_related(
-            'client__member'
-        ).only(
-            'client__member__firstname',
-            'client__member__lastname',
-            'client__rate_type',
-            'client__billing_payment_type'
-        ).prefetch_related(Prefetch(
-            'orders',
-            queryset=Order_item.objects.all().only(
-                'order__id',
-                'price',
-                'billable_flag',
-                'size',
-                'component_group',
-                'total_quantity'
-            )
-        ))
-    ))
 
     def get_template_names(self):
         if self.request.method == "GET" and \
@@ -158,75 +135,19 @@ class BillingSummaryView(
         context = super(BillingSummaryView, self).get_context_data(**kwargs)
         billing = self.object
 
-        # generate a summary
-        zero_statistics = {
-            'total_main_dishes': {
-                'R': 0,
-                'L': 0
-            },
-            'total_billable_sides': 0,
-            'total_amount': 0
-        }
-        # target dict
-        summary = copy.deepcopy(zero_statistics)
-        summary['payment_types_dict'] = collections.defaultdict(
-            lambda: dict(clients=[], **copy.deepcopy(zero_statistics))
-        )
-        for client, client_summary in billing.summary.items():
-            t = client.billing_payment_type
-            summary['payment_types_dict'][t]['total_main_dishes']['R'] += (
-                client_summary['total_main_dishes']['R']
-            )
-            summary['payment_types_dict'][t]['total_main_dishes']['L'] += (
-                client_summary['total_main_dishes']['L']
-            )
-            summary['payment_types_dict'][t]['total_billable_sides'] += (
-                client_summary['total_billable_sides']
-            )
-            summary['payment_types_dict'][t]['total_amount'] += (
-                client_summary['total_amount']
-            )
-            summary['payment_types_dict'][t]['clients'].append({
-                'id': client.id,
-                'firstname': client.member.firstname,
-                'lastname': client.member.lastname,
-                'payment_type': client.get_billing_payment_type_display() if (
-                    client.billing_payment_type is not None) else '',
-                'rate_type': client.get_rate_type_display() if (
-                    client.rate_type != 'default') else '',
-                'total_main_dishes': client_summary['total_main_dishes'],
-                'total_billable_sides': client_summary['total_billable_sides'],
-                'total_amount': client_summary['total_amount']
-            })
-            summary['total_main_dishes']['R'] += (
-                client_summary['total_main_dishes']['R']
-            )
-            summary['total_main_dishes']['L'] += (
-                client_summary['total_main_dishes']['L']
-            )
-            summary['total_billable_sides'] += (
-                client_summary['total_billable_sides']
-            )
-            summary['total_amount'] += (
-                client_summary['total_amount']
-            )
-
-        # sort clients in each payment type group
-        for payment_type, statistics in summary['payment_types_dict'].items():
-            statistics['clients'].sort(
-                key=lambda c: (c['lastname'], c['firstname'])
-            )
-
-        # reorder the display for supported & non-supported payment types
-        summary['payment_types'] = sorted(
-            summary['payment_types_dict'].items(),
-            key=lambda tup: {
-                ' ': 0,      # 0th position
-                'credit': 1,    # 1st position
-                'eft': 2,     # 2nd position
-                '3rd': 3,  # 3rd position
-            }.get(tup[0], 99)  # last position(s)
-        )
+        # render the summary frozen when the billing was created, or
+        # recomputed since
+        summary = billing.detail or billing.make_detail()
+        payment_type_names = dict(PAYMENT_TYPE)
+        rate_type_names = dict(RATE_TYPE)
+        for payment_type, statistics in summary['payment_types']:
+            for client in statistics['clients']:
+                client['payment_type'] = payment_type_names.get(
+                    client['payment_type'], client['payment_type']) if (
+                    client['payment_type'] is not None) else ''
+                client['rate_type'] = rate_type_names.get(
+                    client['rate_type'], client['rate_type']) if (
+                    client['rate_type'] != 'default') else ''
 
         context['summary'] = summary
 
@@ -269,6 +190,23 @@ class BillingSummaryView(
         return context
 
 
+class BillingRecompute(
+        LoginRequiredMixin, PermissionRequiredMixin, generic.View):
+    # Rebuild the summary of a billing after its orders were corrected
+    permission_required = 'sous_chef.edit'
+
+    def post(self, request, pk):
+        billing = get_object_or_404(Billing, pk=pk)
+        billing.recompute()
+        messages.add_message(
+            self.request, messages.SUCCESS,
+            _("The billing with the identifier #%s "
+              "has been successfully recomputed.") % billing.id
+        )
+        return HttpResponseRedirect(
+            reverse_lazy('billing:view', kwargs={'pk': billing.id}))
+
+
 class BillingOrdersView(
         LoginRequiredMixin, PermissionRequiredMixin, generic.DetailView):
     # Display orders detail of billing
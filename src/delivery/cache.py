@@ -0,0 +1,145 @@
+# Cache of the distance matrices of the routes.
+#
+# A matrix is keyed by a hash of the sorted (client id, latitude,
+# longitude) of its stops, so that the matrix of a stable route is
+# computed once. The last matrix of a group of stops (e.g. a route) is
+# also kept: when a few clients are added to the group or moved from
+# another one, only their rows and columns are computed, the others are
+# copied. Saving new coordinates of an address changes the version of
+# all the matrices (see delivery/signals.py). Matrices and versions are
+# in the default Django cache, like the kitchen counts (see
+# order/cache.py).
+#
+# The distances are measured by the travel cost provider configured in
+# settings.ROUTE_COST_PROVIDER (see get_provider).
+import hashlib
+import threading
+
+import numpy
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+from order.cache import get_version, invalidate
+
+
+DISTANCE_MATRIX_TIMEOUT = 7 * 24 * 60 * 60  # seconds
+DISTANCE_MATRIX_VERSION = 'distance_matrix:version'
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def get_provider():
+    """
+    Returns the travel cost provider of settings.ROUTE_COST_PROVIDER, a
+    dictionary of the dotted path of its class, 'BACKEND', and of the
+    keyword arguments it is created with, 'OPTIONS'. Providers are
+    created once per process.
+    """
+    backend = settings.ROUTE_COST_PROVIDER['BACKEND']
+    options = settings.ROUTE_COST_PROVIDER.get('OPTIONS', {})
+    key = backend, repr(sorted(options.items()))
+    with _providers_lock:
+        if key not in _providers:
+            _providers[key] = import_string(backend)(**options)
+        return _providers[key]
+
+
+def invalidate_distance_matrices():
+    """
+    Invalidate the distance matrices of all the routes.
+    """
+    invalidate(DISTANCE_MATRIX_VERSION)
+
+
+def distance_matrix_key(version, costs, origin, stops):
+    digest = hashlib.sha1(repr((origin, stops)).encode()).hexdigest()
+    return 'distance_matrix:{}:{}:{}'.format(version, costs, digest)
+
+
+def group_key(version, costs, group):
+    return 'distance_matrix:{}:{}:group:{}'.format(version, costs, group)
+
+
+def get_distance_matrix(stops, origin, group=None, vehicle=None):
+    """
+    Returns the matrix of the travel costs of a route, measured by the
+    provider of settings.ROUTE_COST_PROVIDER (see get_provider), from the
+    cache if its stops have not changed.
+
+    Args:
+        stops: A list of tuples (client id, latitude, longitude).
+        origin: A tuple (latitude, longitude), the starting point of the
+            route: the points are projected around it.
+        group: A name, e.g. of the route, under which the matrix is kept
+            to compute the next matrix of the group incrementally.
+        vehicle: The vehicle of the route (see member.ROUTE_VEHICLES).
+
+    Returns:
+        A float32 array, the costs (e.g. kilometres, see the unit of the
+        provider) between the origin, node 0, and the stops: stops[i] is
+        node i + 1.
+    """
+    provider = get_provider()
+    costs = '{}:{}'.format(provider.key, vehicle)
+    stops = [(pk, float(latitude), float(longitude))
+             for pk, latitude, longitude in stops]
+    origin = tuple(float(degrees) for degrees in origin)
+    canonical = sorted(stops)
+    version = get_version(DISTANCE_MATRIX_VERSION)
+    key = distance_matrix_key(version, costs, origin, canonical)
+    entry = cache.get(key)
+    if entry is None:
+        previous = None
+        if group is not None:
+            previous_key = cache.get(group_key(version, costs, group))
+            if previous_key is not None:
+                previous = cache.get(previous_key)
+        entry = canonical, build_matrix(
+            provider, canonical, origin, vehicle, previous)
+        cache.set(key, entry, DISTANCE_MATRIX_TIMEOUT)
+    if group is not None:
+        cache.set(group_key(version, costs, group), key,
+                  DISTANCE_MATRIX_TIMEOUT)
+    matrix = entry[1]
+    positions = {stop: i + 1 for i, stop in enumerate(canonical)}
+    nodes = [0] + [positions[stop] for stop in stops]
+    return matrix[numpy.ix_(nodes, nodes)]
+
+
+def build_matrix(provider, stops, origin, vehicle=None, previous=None):
+    """
+    Returns the cost matrix of the origin and the stops.
+
+    Args:
+        provider: The travel cost provider.
+        stops: A list of tuples (client id, latitude, longitude).
+        origin: A tuple (latitude, longitude).
+        vehicle: The vehicle travelling.
+        previous: A tuple (stops, matrix) of a matrix of the same origin:
+            the distances between its stops are copied, only the rows and
+            columns of the other stops are computed.
+    """
+    latitudes = [origin[0]] + [latitude for _, latitude, _ in stops]
+    longitudes = [origin[1]] + [longitude for _, _, longitude in stops]
+    if previous is None:
+        return provider.matrix(latitudes, longitudes, origin, vehicle)
+    previous_stops, previous_matrix = previous
+    positions = {stop: i + 1 for i, stop in enumerate(previous_stops)}
+    known, sources, new = [0], [0], []
+    for i, stop in enumerate(stops, 1):
+        if stop in positions:
+            known.append(i)
+            sources.append(positions[stop])
+        else:
+            new.append(i)
+    matrix = numpy.empty((len(stops) + 1,) * 2, dtype=numpy.float32)
+    matrix[numpy.ix_(known, known)] = \
+        previous_matrix[numpy.ix_(sources, sources)]
+    rows = provider.costs(
+        ([latitudes[i] for i in new], [longitudes[i] for i in new]),
+        (latitudes, longitudes), origin, vehicle)
+    matrix[new, :] = rows
+    matrix[:, new] = rows.T
+    return matrix
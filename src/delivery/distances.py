@@ -0,0 +1,138 @@
+# Distance matrices between geographic points, computed with NumPy.
+#
+# The matrices are float32 arrays of distances in kilometres, consumed
+# by the route solvers (see tsp.py).
+import numpy
+
+
+# Mean radius of the Earth in kilometres.
+EARTH_RADIUS = 6371.0088
+
+HAVERSINE = 'haversine'
+EQUIRECTANGULAR = 'equirectangular'
+
+
+def haversine_matrix(latitudes, longitudes):
+    """Returns the great-circle distances between all the points.
+
+    Args:
+        latitudes, longitudes: Sequences of coordinates in degrees.
+
+    Returns:
+        A float32 array of shape (N, N), in kilometres.
+    """
+    phi = numpy.radians(numpy.asarray(latitudes, dtype=numpy.float64))
+    lam = numpy.radians(numpy.asarray(longitudes, dtype=numpy.float64))
+    d_phi = phi[:, numpy.newaxis] - phi
+    d_lam = lam[:, numpy.newaxis] - lam
+    a = (numpy.sin(d_phi / 2) ** 2 +
+         numpy.cos(phi)[:, numpy.newaxis] * numpy.cos(phi) *
+         numpy.sin(d_lam / 2) ** 2)
+    distances = 2 * EARTH_RADIUS * numpy.arcsin(
+        numpy.sqrt(numpy.clip(a, 0, 1)))
+    return distances.astype(numpy.float32)
+
+
+def project(latitudes, longitudes, origin):
+    """Returns the points projected on a plane tangent at `origin`.
+
+    The equirectangular projection is accurate at the scale of a city.
+
+    Args:
+        latitudes, longitudes: Sequences of coordinates in degrees.
+        origin: A tuple (latitude, longitude) in degrees.
+
+    Returns:
+        A float64 array of shape (N, 2) of (x, y) in kilometres.
+    """
+    latitude, longitude = origin
+    phi = numpy.radians(
+        numpy.asarray(latitudes, dtype=numpy.float64) - latitude)
+    lam = numpy.radians(
+        numpy.asarray(longitudes, dtype=numpy.float64) - longitude)
+    return EARTH_RADIUS * numpy.stack(
+        (lam * numpy.cos(numpy.radians(latitude)), phi), axis=-1)
+
+
+def equirectangular_matrix(latitudes, longitudes, origin):
+    """Returns the distances between all the points projected around
+    `origin` (see project).
+
+    Returns:
+        A float32 array of shape (N, N), in kilometres.
+    """
+    points = project(latitudes, longitudes, origin)
+    differences = points[:, numpy.newaxis, :] - points
+    return numpy.sqrt(
+        (differences ** 2).sum(axis=-1)).astype(numpy.float32)
+
+
+def equirectangular_distances(a, b, origin):
+    """Returns the distances from the points `a` to the points `b`,
+    projected around `origin` (see project).
+
+    Args:
+        a, b: Tuples (latitudes, longitudes) of sequences of coordinates
+            in degrees.
+        origin: A tuple (latitude, longitude) in degrees.
+
+    Returns:
+        A float32 array of shape (len(a[0]), len(b[0])), in kilometres.
+    """
+    differences = (project(*a, origin=origin)[:, numpy.newaxis, :] -
+                   project(*b, origin=origin))
+    return numpy.sqrt(
+        (differences ** 2).sum(axis=-1)).astype(numpy.float32)
+
+
+def distance_matrix(latitudes, longitudes, metric=EQUIRECTANGULAR,
+                    origin=None):
+    """Returns the distances between all the points.
+
+    Args:
+        latitudes, longitudes: Sequences of coordinates in degrees.
+        metric: HAVERSINE or EQUIRECTANGULAR.
+        origin: The (latitude, longitude) around which the points are
+            projected with EQUIRECTANGULAR. Defaults to the first point.
+
+    Returns:
+        A float32 array of shape (N, N), in kilometres.
+    """
+    if len(latitudes) == 0:
+        return numpy.zeros((0, 0), dtype=numpy.float32)
+    if metric == HAVERSINE:
+        return haversine_matrix(latitudes, longitudes)
+    if metric == EQUIRECTANGULAR:
+        if origin is None:
+            origin = (latitudes[0], longitudes[0])
+        return equirectangular_matrix(latitudes, longitudes, origin)
+    raise ValueError("Unknown metric: {}".format(metric))
+
+
+def nodes_distance_matrix(nodes, metric=EQUIRECTANGULAR, origin=None):
+    """Returns the distances between all the nodes (tsp.Node)."""
+    return distance_matrix([node.latitude for node in nodes],
+                           [node.longitude for node in nodes],
+                           metric, origin)
+
+
+class EquirectangularProvider:
+    """Straight-line distances in kilometres, the default travel costs
+    of the routes (see settings.ROUTE_COST_PROVIDER).
+
+    A travel cost provider has a `unit`, a `key` identifying its costs in
+    the cache (see cache.py), and the methods `matrix` and `costs`.
+    """
+    unit = 'km'
+    key = EQUIRECTANGULAR
+
+    def matrix(self, latitudes, longitudes, origin, vehicle=None):
+        """Returns the costs between all the points (see distance_matrix).
+        """
+        return distance_matrix(latitudes, longitudes, EQUIRECTANGULAR,
+                               origin)
+
+    def costs(self, a, b, origin, vehicle=None):
+        """Returns the costs from the points `a` to the points `b` (see
+        equirectangular_distances)."""
+        return equirectangular_distances(a, b, origin)
@@ -0,0 +1,131 @@
+# Background rendering of the delivery reports.
+#
+# A report job renders one PDF report of a delivery date into its own
+# file (see ReportJob.artifact), in a pool of worker threads of the
+# serving process. Identical requests share a job: the key of a job is
+# made of the report kind and of the kitchen count key of its date (see
+# order/cache.py), which changes whenever the report would.
+import datetime
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from order.cache import kitchen_count_key
+from .models import ReportJob
+
+
+logger = logging.getLogger(__name__)
+
+# Functions rendering each kind of report, registered by `renderer`.
+RENDERERS = {}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def renderer(kind):
+    """
+    Register the decorated function as the renderer of the reports of
+    `kind`. It is called as `render(delivery_date, filename)` and returns
+    the number of pages or labels written to `filename` (0 if it wrote
+    nothing).
+    """
+    def register(render):
+        RENDERERS[kind] = render
+        return render
+    return register
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.REPORT_JOB_WORKERS)
+        return _executor
+
+
+def job_key(kind, delivery_date):
+    return '{}:{}'.format(kind, kitchen_count_key(delivery_date))
+
+
+def submit(kind, delivery_date):
+    """
+    Returns the job rendering the report `kind` of a delivery date.
+
+    A pending, running or done job rendering the same report is reused;
+    otherwise a new job is created and started. Jobs not finished after
+    settings.REPORT_JOB_TIMEOUT seconds (e.g. lost with their process)
+    are considered failed.
+    """
+    key = job_key(kind, delivery_date)
+    now = timezone.now()
+    ReportJob.objects.filter(
+        key=key, status__in=(ReportJob.PENDING, ReportJob.RUNNING),
+        created_at__lt=now - datetime.timedelta(
+            seconds=settings.REPORT_JOB_TIMEOUT)
+    ).update(status=ReportJob.FAILED, key=None, finished_at=now,
+             error='Timed out.')
+    try:
+        with transaction.atomic():
+            job, created = ReportJob.objects.get_or_create(
+                key=key,
+                defaults={'kind': kind, 'delivery_date': delivery_date})
+    except IntegrityError:
+        # created by a concurrent request
+        job, created = ReportJob.objects.get(key=key), False
+    if created:
+        start(job)
+    return job
+
+
+def start(job):
+    if settings.REPORT_JOBS_ASYNC:
+        # the worker must see the committed job
+        transaction.on_commit(lambda: get_executor().submit(run, job.pk))
+    else:
+        run(job.pk)
+        job.refresh_from_db()
+
+
+def run(job_id):
+    """
+    Render the report of a job and record its outcome.
+    """
+    try:
+        ReportJob.objects.filter(pk=job_id).update(status=ReportJob.RUNNING)
+        job = ReportJob.objects.get(pk=job_id)
+        os.makedirs(os.path.dirname(job.artifact), exist_ok=True)
+        count = RENDERERS[job.kind](job.delivery_date, job.artifact)
+        ReportJob.objects.filter(pk=job_id).update(
+            status=ReportJob.DONE, count=count, finished_at=timezone.now())
+        prune(job)
+    except Exception as e:
+        logger.exception("Report job %s failed.", job_id)
+        ReportJob.objects.filter(pk=job_id).update(
+            status=ReportJob.FAILED, key=None, finished_at=timezone.now(),
+            error=str(e))
+    finally:
+        if settings.REPORT_JOBS_ASYNC:
+            # worker threads get their own connection
+            connection.close()
+
+
+def prune(job):
+    """
+    Delete the finished jobs, and their files, superseded by `job`.
+    """
+    superseded = ReportJob.objects.filter(
+        kind=job.kind, delivery_date=job.delivery_date, pk__lt=job.pk,
+        status__in=(ReportJob.DONE, ReportJob.FAILED))
+    for old_job in superseded:
+        try:
+            os.remove(old_job.artifact)
+        except FileNotFoundError:
+            pass
+    superseded.delete()
@@ -0,0 +1,220 @@
+# Meal labels sheets, rendered in worker processes.
+#
+# This module does not depend on Django, so that the worker processes
+# rendering the sheets only import it, pylabels and ReportLab.
+import collections
+import io
+import math
+import multiprocessing
+
+import labels  # package pylabels
+import PyPDF2
+
+from reportlab.graphics import shapes as rl_shapes
+from reportlab.pdfbase import pdfmetrics as rl_pdfmetrics
+
+
+# Sheet format is "Avery 5162" 8,5 X 11 inches, 2 cols X 7 lines.
+LABELS_PER_SHEET = 14
+# Number of chunks of sheets given to each worker process.
+CHUNKS_PER_PROCESS = 4
+
+
+meal_label_fields = [                         # Contents for Meal Labels.
+    # field name, default value
+    'sortkey', '',          # key for sorting
+    'route', '',            # String : Route name
+    'name', '',             # String : Last + First abbreviated
+    'date', '',             # String : Delivery date
+    'size', '',             # String : Regular or Large
+    'main_dish_name', '',   # String
+    'dish_clashes', [],   # List of strings
+    'preparations', [],   # List of strings
+    'sides_clashes', [],    # List of strings
+    'other_restrictions', [],   # List of strings
+    'ingredients', []]  # List of strings
+MealLabel = collections.namedtuple(
+    'MealLabel', meal_label_fields[0::2])
+
+
+def draw_label(label, width, height, data):
+    """Draw a single Meal Label on the sheet.
+
+    Callback function that is used by the labels generator.
+
+    Args:
+        label : Object passed by pylabels.
+        width : Single label width in font points.
+        height : Single label height in font points.
+        data : A MealLabel namedtuple.
+    """
+    # dimensions are in font points (72 points = 1 inch)
+    # Line 1
+    vertic_pos = height * 0.85
+    horiz_margin = 9  # distance from edge of label 9/72 = 1/8 inch
+    if data.name:
+        label.add(rl_shapes.String(
+            horiz_margin, vertic_pos, data.name,
+            fontName="Helvetica-Bold", fontSize=12))
+    if data.route:
+        label.add(rl_shapes.String(
+            width / 2.0, vertic_pos, data.route,
+            fontName="Helvetica-Oblique", fontSize=10, textAnchor="middle"))
+    if data.date:
+        label.add(rl_shapes.String(
+            width - horiz_margin, vertic_pos, data.date,
+            fontName="Helvetica", fontSize=10, textAnchor="end"))
+    # Line 2
+    vertic_pos -= 14
+    if data.main_dish_name:
+        label.add(rl_shapes.String(
+            horiz_margin, vertic_pos, data.main_dish_name,
+            fontName="Helvetica-Bold", fontSize=10))
+    if data.size:
+        label.add(rl_shapes.String(
+            width - horiz_margin, vertic_pos, data.size,
+            fontName="Helvetica-Bold", fontSize=10, textAnchor="end"))
+    # Line(s) 3
+    vertic_pos -= 12
+    if data.dish_clashes:
+        for line in data.dish_clashes:
+            label.add(rl_shapes.String(
+                horiz_margin, vertic_pos, line,
+                fontName="Helvetica", fontSize=9))
+            vertic_pos -= 10
+    # Line(s) 4
+    if data.preparations:
+        # draw prefix
+        label.add(rl_shapes.String(
+            horiz_margin, vertic_pos, data.preparations[0],
+            fontName="Helvetica", fontSize=9))
+        # measure prefix length to offset first line
+        offset = rl_pdfmetrics.stringWidth(
+            data.preparations[0], fontName="Helvetica", fontSize=9)
+        for line in data.preparations[1:]:
+            label.add(rl_shapes.String(
+                horiz_margin + offset, vertic_pos, line,
+                fontName="Helvetica-Bold", fontSize=9))
+            offset = 0.0  # Only first line is offset at right of prefix
+            vertic_pos -= 10
+    # Line(s) 5
+    if data.sides_clashes:
+        # draw prefix
+        label.add(rl_shapes.String(
+            horiz_margin, vertic_pos, data.sides_clashes[0],
+            fontName="Helvetica", fontSize=9))
+        # measure prefix length to offset first line
+        offset = rl_pdfmetrics.stringWidth(
+            data.sides_clashes[0], fontName="Helvetica", fontSize=9)
+        for line in data.sides_clashes[1:]:
+            label.add(rl_shapes.String(
+                horiz_margin + offset, vertic_pos, line,
+                fontName="Helvetica-Bold", fontSize=9))
+            offset = 0.0  # Only first line is offset at right of prefix
+            vertic_pos -= 10
+    # Line(s) 6
+    if data.other_restrictions:
+        for line in data.other_restrictions:
+            label.add(rl_shapes.String(
+                horiz_margin, vertic_pos, line,
+                fontName="Helvetica", fontSize=9))
+            vertic_pos -= 10
+    # Line(s) 7
+    if data.ingredients:
+        for line in data.ingredients:
+            label.add(rl_shapes.String(
+                horiz_margin, vertic_pos, line,
+                fontName="Helvetica", fontSize=8))
+            vertic_pos -= 9
+
+
+def specification():
+    """Returns the pylabels specification of an Avery 5162 sheet."""
+    # dimensions are in millimeters; 1 inch = 25.4 mm
+    # Sheet format is Avery 5162 : 2 columns * 7 rows
+    sheet_height = 11.0 * 25.4
+    sheet_width = 8.5 * 25.4
+    vertic_margin = 21.0
+    horiz_margin = 4.0
+    columns = 2
+    rows = 7
+    gutter = 3.0 / 16.0 * 25.4
+    return labels.Specification(
+        sheet_width=sheet_width,
+        sheet_height=sheet_height,
+        columns=columns,
+        rows=rows,
+        column_gap=gutter,
+        label_width=(sheet_width - 2.0 * horiz_margin - gutter) / columns,
+        label_height=(sheet_height - 2.0 * vertic_margin) / rows,
+        top_margin=vertic_margin,
+        bottom_margin=vertic_margin,
+        left_margin=horiz_margin,
+        right_margin=horiz_margin,
+        corner_radius=1.5)
+
+
+def render_sheets(meal_labels):
+    """Render Meal Labels on sheets, in their order.
+
+    Args:
+        meal_labels : A list of MealLabel objects.
+
+    Returns:
+        A bytes object : The PDF document.
+    """
+    sheet = labels.Sheet(specification(), draw_label, border=False)
+    for label in meal_labels:
+        sheet.add_label(label)
+    pdf = io.BytesIO()
+    sheet.save(pdf)
+    return pdf.getvalue()
+
+
+def render(meal_labels, filelike, processes=1):
+    """Render Meal Labels into a PDF document, in their order.
+
+    The labels are split into chunks of whole sheets, rendered by a pool
+    of worker processes when `processes` > 1, then concatenated.
+
+    Args:
+        meal_labels : A list of MealLabel objects.
+        filelike : A file name or a binary file object.
+        processes : An integer, the number of worker processes.
+
+    Returns:
+        An integer : The number of sheets generated.
+    """
+    sheets = math.ceil(len(meal_labels) / LABELS_PER_SHEET)
+    chunk_size = LABELS_PER_SHEET * max(
+        1, math.ceil(sheets / (processes * CHUNKS_PER_PROCESS)))
+    chunks = [meal_labels[i:i + chunk_size]
+              for i in range(0, len(meal_labels), chunk_size)]
+    if processes > 1 and len(chunks) > 1:
+        # A forkserver does not inherit the threads and connections of
+        # the server process.
+        context = multiprocessing.get_context('forkserver')
+        with context.Pool(min(processes, len(chunks))) as pool:
+            documents = pool.map(render_sheets, chunks)
+    else:
+        documents = [render_sheets(chunk) for chunk in chunks]
+
+    if isinstance(filelike, str):
+        with open(filelike, 'wb') as f:
+            write(documents, f)
+    else:
+        write(documents, filelike)
+    return sheets
+
+
+def write(documents, f):
+    """Write the concatenation of PDF documents to a binary file object."""
+    if len(documents) == 1:
+        f.write(documents[0])
+        return
+    writer = PyPDF2.PdfFileWriter()
+    for document in documents:
+        reader = PyPDF2.PdfFileReader(io.BytesIO(document))
+        for page in reader.pages:
+            writer.addPage(page)
+    writer.write(f)
@@ -0,0 +1,165 @@
+import json
+import math
+import random
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from delivery import distances, tsp
+from delivery.views import DELIVERY_STARTING_POINT_LAT_LONG
+
+
+UNIFORM = 'uniform'
+CLUSTERED = 'clustered'
+LAYOUTS = (UNIFORM, CLUSTERED)
+
+# Half the side of the square around the depot where the stops are
+# generated, in kilometres: the island of Montreal, roughly.
+AREA_RADIUS = 10.0
+# Number of neighbourhoods of a clustered layout, and their spread.
+CLUSTERS = 6
+CLUSTER_RADIUS = 0.8
+
+# The solver modes measured: functions of a distance matrix and of the
+# time budget returning a tour.
+MODES = (
+    ('two_opt', lambda matrix, budget: tsp.solve_matrix(matrix)),
+    ('local_search', lambda matrix, budget: tsp.optimize(matrix)),
+    ('iterated_local_search',
+     lambda matrix, budget: tsp.optimize(matrix, budget=budget)),
+)
+
+
+def generate_stops(layout, size, seed):
+    """
+    Returns the latitudes and longitudes of the depot, first, and of
+    `size` stops around it. The same arguments generate the same stops.
+    """
+    generator = random.Random('{}-{}-{}'.format(seed, layout, size))
+    if layout == UNIFORM:
+        offsets = [(generator.uniform(-AREA_RADIUS, AREA_RADIUS),
+                    generator.uniform(-AREA_RADIUS, AREA_RADIUS))
+                   for _ in range(size)]
+    else:
+        centers = [(generator.uniform(-AREA_RADIUS, AREA_RADIUS),
+                    generator.uniform(-AREA_RADIUS, AREA_RADIUS))
+                   for _ in range(CLUSTERS)]
+        offsets = []
+        for _ in range(size):
+            x, y = generator.choice(centers)
+            offsets.append((generator.gauss(x, CLUSTER_RADIUS),
+                            generator.gauss(y, CLUSTER_RADIUS)))
+    latitude, longitude = DELIVERY_STARTING_POINT_LAT_LONG
+    # kilometres to degrees, on a plane tangent at the depot
+    scale = 180 / (math.pi * distances.EARTH_RADIUS)
+    latitudes = [latitude] + [
+        latitude + y * scale for x, y in offsets]
+    longitudes = [longitude] + [
+        longitude + x * scale / math.cos(math.radians(latitude))
+        for x, y in offsets]
+    return latitudes, longitudes
+
+
+class Command(BaseCommand):
+    help = 'Measure the route solvers (delivery/tsp.py) on generated \
+            stops around the depot, and write the results to a JSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'sizes',
+            help='The numbers of stops to measure.',
+            nargs='*',
+            default=[10, 50, 100, 200, 500],
+            type=int
+        )
+        parser.add_argument(
+            '--seed',
+            help='The seed of the generated stops.',
+            default=0,
+            type=int
+        )
+        parser.add_argument(
+            '--budget',
+            help='The time allowed to the iterated local search, in '
+                 'seconds.',
+            default=1.0,
+            type=float
+        )
+        parser.add_argument(
+            '--output',
+            help='The JSON file the results are written to.',
+            default='benchmarkroutes.json'
+        )
+        parser.add_argument(
+            '--baseline',
+            help='A results file of a previous run: its shortest tours '
+                 'count as best known.',
+            default=None
+        )
+
+    def handle(self, *args, **options):
+        best_known = {}
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                for result in json.load(f)['results']:
+                    key = result['layout'], result['size']
+                    best_known[key] = min(
+                        best_known.get(key, math.inf), result['length'])
+
+        results = []
+        for layout in LAYOUTS:
+            for size in options['sizes']:
+                matrix = distances.distance_matrix(
+                    *generate_stops(layout, size, options['seed']),
+                    origin=DELIVERY_STARTING_POINT_LAT_LONG)
+                instance = [self.measure(matrix, mode, solver,
+                                         options['budget'])
+                            for mode, solver in MODES]
+                key = layout, size
+                best = min([best_known.get(key, math.inf)] +
+                           [result['length'] for result in instance])
+                for result in instance:
+                    result.update(layout=layout, size=size)
+                    result['gap'] = (
+                        result['length'] / best - 1 if best else 0.0)
+                    self.stdout.write(
+                        "{layout} {size} {mode}: {length:.3f} km, "
+                        "gap {gap:.2%}, {seconds:.3f}s, "
+                        "{peak_memory} bytes.".format(**result))
+                results.extend(instance)
+
+        with open(options['output'], 'w') as f:
+            json.dump({
+                'seed': options['seed'],
+                'budget': options['budget'],
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+        self.stdout.write(
+            "{0} results written to {1}.".format(
+                len(results), options['output']))
+
+    def measure(self, matrix, mode, solver, budget):
+        """
+        Solve a TSP, and returns the length of the tour in kilometres,
+        the wall time and the peak of the memory allocated by Python.
+        Tracing the allocations slows the solvers down: the memory is
+        measured in a second run.
+        """
+        start = time.perf_counter()
+        tour = solver(matrix, budget)
+        seconds = time.perf_counter() - start
+        if sorted(tour) != list(range(len(matrix))):
+            raise CommandError("{0} returned an invalid tour.".format(mode))
+        tracemalloc.start()
+        try:
+            solver(matrix, budget)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return {
+            'mode': mode,
+            'length': float(tsp.tour_distance(tour, matrix)),
+            'seconds': seconds,
+            'peak_memory': peak_memory,
+        }
@@ -0,0 +1,44 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from delivery.views import render_meal_labels
+
+
+class Command(BaseCommand):
+    help = 'Generate the meal labels of a given delivery date as PDF,\
+            in one file or in one file per route.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'delivery_date',
+            help='The date must be in the format YYYY-MM-DD',
+        )
+        parser.add_argument(
+            'output',
+            help=(
+                'The PDF file of the labels, or with --by-route the '
+                'directory of the PDF files of the routes.'
+            ),
+        )
+        parser.add_argument(
+            '--by-route',
+            help=(
+                'Write the labels of each route in a separate PDF file '
+                'named after the route, to be printed and packed route '
+                'by route.'
+            ),
+            action='store_true',
+            default=False
+        )
+
+    def handle(self, *args, **options):
+        delivery_date = datetime.strptime(
+            options['delivery_date'], '%Y-%m-%d'
+        ).date()
+        count = render_meal_labels(
+            delivery_date, options['output'], options['by_route'])
+        self.stdout.write(
+            "{0} meal label(s) for {1} written to {2}.".format(
+                count, delivery_date, options['output']
+            ))
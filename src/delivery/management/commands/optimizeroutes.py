@@ -0,0 +1,62 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from delivery.cache import get_provider
+from delivery.views import optimize_routes
+
+
+class Command(BaseCommand):
+    help = 'Optimize the sequences of all the routes with orders to be\
+            delivered on a given date, and save them as the deliveries\
+            of that date.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'delivery_date',
+            help='The date must be in the format YYYY-MM-DD',
+        )
+        parser.add_argument(
+            '--processes',
+            help=(
+                'The number of worker processes optimizing different '
+                'routes in parallel. Defaults to one per CPU.'
+            ),
+            default=None,
+            type=int
+        )
+        parser.add_argument(
+            '--budget',
+            help=(
+                'The time allowed to improve each route, in seconds. By '
+                'default, a route is optimized until no move improves it.'
+            ),
+            default=None,
+            type=float
+        )
+
+    def handle(self, *args, **options):
+        delivery_date = datetime.strptime(
+            options['delivery_date'], '%Y-%m-%d'
+        ).date()
+        unit = get_provider().unit
+        start = time.time()
+        optimisations = optimize_routes(
+            delivery_date, options['processes'], options['budget'])
+        for optimisation in optimisations:
+            self.stdout.write(
+                "{0}: {1} stops, {2:.2f} {5} -> {3:.2f} {5} "
+                "({4:.2f}s).".format(
+                    optimisation.route.name, optimisation.stops,
+                    optimisation.distance_before, optimisation.distance,
+                    optimisation.seconds, unit
+                ))
+        self.stdout.write(
+            "{0} route(s) optimized for {1}: {2:.2f} {5} -> {3:.2f} {5} "
+            "in {4:.2f}s.".format(
+                len(optimisations), delivery_date,
+                sum(o.distance_before for o in optimisations),
+                sum(o.distance for o in optimisations),
+                time.time() - start, unit
+            ))
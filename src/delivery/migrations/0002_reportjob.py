@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0001_fix004a'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('kitchen_count', 'Kitchen count'), ('meal_labels', 'Meal labels')], max_length=20, verbose_name='kind')),
+                ('delivery_date', models.DateField(verbose_name='delivery date')),
+                ('key', models.CharField(blank=True, max_length=200, null=True, unique=True, verbose_name='key')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10, verbose_name='status')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='finished at')),
+                ('count', models.IntegerField(default=0, verbose_name='count')),
+                ('error', models.TextField(blank=True, verbose_name='error')),
+            ],
+            options={
+                'verbose_name_plural': 'report jobs',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
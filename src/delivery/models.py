@@ -1,3 +1,6 @@
+import os
+
+from django.conf import settings
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 
@@ -10,3 +13,106 @@ class Delivery(models.Model):
         verbose_name_plural = _('deliveries')
 
     pass
+
+
+class ReportJob(models.Model):
+    """
+    The rendering of a PDF report of a delivery date, in the background
+    (see delivery/jobs.py).
+    """
+
+    class Meta:
+        verbose_name_plural = _('report jobs')
+        ordering = ['-created_at']
+
+    KITCHEN_COUNT = 'kitchen_count'
+    MEAL_LABELS = 'meal_labels'
+
+    KIND_CHOICES = (
+        (KITCHEN_COUNT, _('Kitchen count')),
+        (MEAL_LABELS, _('Meal labels')),
+    )
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = (
+        (PENDING, _('Pending')),
+        (RUNNING, _('Running')),
+        (DONE, _('Done')),
+        (FAILED, _('Failed')),
+    )
+
+    kind = models.CharField(
+        max_length=20,
+        choices=KIND_CHOICES,
+        verbose_name=_('kind')
+    )
+
+    delivery_date = models.DateField(
+        verbose_name=_('delivery date')
+    )
+
+    # Identifies the report rendered by the job, shared by identical
+    # requests; cleared when the job fails so that it can be retried.
+    key = models.CharField(
+        max_length=200,
+        unique=True,
+        null=True,
+        blank=True,
+        verbose_name=_('key')
+    )
+
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+        verbose_name=_('status')
+    )
+
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_('created at')
+    )
+
+    finished_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name=_('finished at')
+    )
+
+    # Number of pages or labels rendered.
+    count = models.IntegerField(
+        default=0,
+        verbose_name=_('count')
+    )
+
+    error = models.TextField(
+        blank=True,
+        verbose_name=_('error')
+    )
+
+    def __str__(self):
+        return "{} {} ({})".format(
+            self.get_kind_display(), self.delivery_date, self.status)
+
+    @property
+    def artifact(self):
+        """
+        The PDF file rendered by the job, in its delivery date directory
+        of settings.REPORTS_ROOT.
+        """
+        return os.path.join(
+            settings.REPORTS_ROOT,
+            self.delivery_date.isoformat(),
+            '{}-{}.pdf'.format(self.pk, self.kind))
+
+    @property
+    def is_finished(self):
+        return self.status in (ReportJob.DONE, ReportJob.FAILED)
+
+    @property
+    def has_artifact(self):
+        return self.status == ReportJob.DONE and self.count > 0
@@ -0,0 +1,281 @@
+# Travel times on a local road network, without any external service.
+#
+# A road network is a directed graph of street intersections, stored as
+# a compressed sparse row (CSR) adjacency array in a NumPy .npz file:
+#
+#   latitudes, longitudes: the coordinates of the nodes, in degrees.
+#   indptr: the edges leaving the node u are indptr[u]:indptr[u + 1].
+#   indices: the node each edge leads to.
+#   lengths: the length of each edge, in kilometres.
+#   speeds (optional): the speed limit of each edge, in km/h.
+#
+# Such a file is made from a street graph (e.g. extracted from
+# OpenStreetMap) with RoadNetwork.from_edges and RoadNetwork.save. Two-way
+# streets are two edges.
+import math
+import os
+
+import numpy
+
+from . import distances
+
+
+# Source-node pairs searched together by RoadNetwork.shortest_paths, 17
+# bytes each.
+SEARCH_SIZE = 4 * 1024 * 1024
+
+# Default speeds of the vehicles of member.ROUTE_VEHICLES, in km/h.
+VEHICLE_SPEEDS = {
+    'walking': 5.0,
+    'cycling': 15.0,
+    'driving': 30.0,
+}
+
+
+class RoadNetwork:
+
+    def __init__(self, latitudes, longitudes, indptr, indices, lengths,
+                 speeds=None):
+        self.latitudes = numpy.asarray(latitudes, dtype=numpy.float64)
+        self.longitudes = numpy.asarray(longitudes, dtype=numpy.float64)
+        self.indptr = numpy.asarray(indptr, dtype=numpy.int64)
+        self.indices = numpy.asarray(indices, dtype=numpy.int64)
+        self.lengths = numpy.asarray(lengths, dtype=numpy.float64)
+        self.speeds = (None if speeds is None else
+                       numpy.asarray(speeds, dtype=numpy.float64))
+
+    @classmethod
+    def from_edges(cls, latitudes, longitudes, edges):
+        """Returns the road network of nodes and of directed edges.
+
+        Args:
+            latitudes, longitudes: The coordinates of the nodes.
+            edges: A list of tuples (from node, to node, length in km) or
+                (from node, to node, length in km, speed limit in km/h).
+        """
+        edges = sorted(edges)
+        sources = numpy.array([edge[0] for edge in edges], dtype=numpy.int64)
+        indptr = numpy.searchsorted(
+            sources, numpy.arange(len(latitudes) + 1))
+        speeds = None
+        if edges and len(edges[0]) > 3:
+            speeds = [edge[3] for edge in edges]
+        return cls(latitudes, longitudes, indptr,
+                   [edge[1] for edge in edges],
+                   [edge[2] for edge in edges], speeds)
+
+    @classmethod
+    def load(cls, path):
+        with numpy.load(path) as arrays:
+            return cls(arrays['latitudes'], arrays['longitudes'],
+                       arrays['indptr'], arrays['indices'],
+                       arrays['lengths'],
+                       arrays['speeds'] if 'speeds' in arrays else None)
+
+    def save(self, path):
+        arrays = {
+            'latitudes': self.latitudes,
+            'longitudes': self.longitudes,
+            'indptr': self.indptr,
+            'indices': self.indices,
+            'lengths': self.lengths,
+        }
+        if self.speeds is not None:
+            arrays['speeds'] = self.speeds
+        numpy.savez_compressed(path, **arrays)
+
+    def reverse(self):
+        """Returns the network with every edge reversed."""
+        sources = numpy.repeat(
+            numpy.arange(len(self.latitudes)), numpy.diff(self.indptr))
+        order = numpy.lexsort((sources, self.indices))
+        indptr = numpy.searchsorted(
+            self.indices[order], numpy.arange(len(self.latitudes) + 1))
+        return RoadNetwork(
+            self.latitudes, self.longitudes, indptr, sources[order],
+            self.lengths[order],
+            None if self.speeds is None else self.speeds[order])
+
+    def nearest_nodes(self, latitudes, longitudes):
+        """Returns the nearest node of each point, and its distance in km.
+        """
+        origin = (float(numpy.mean(self.latitudes)),
+                  float(numpy.mean(self.longitudes)))
+        nodes = distances.project(self.latitudes, self.longitudes, origin)
+        points = distances.project(latitudes, longitudes, origin)
+        nearest, offsets = [], []
+        for x, y in points:
+            squares = (nodes[:, 0] - x) ** 2 + (nodes[:, 1] - y) ** 2
+            node = int(numpy.argmin(squares))
+            nearest.append(node)
+            offsets.append(math.sqrt(squares[node]))
+        return nearest, offsets
+
+    def edge_times(self, speed):
+        """Returns the time to travel each edge at `speed` km/h, or at its
+        speed limit if lower, in minutes."""
+        speeds = numpy.full(len(self.lengths), speed)
+        if self.speeds is not None:
+            speeds = numpy.minimum(speeds, self.speeds)
+        return 60 * self.lengths / speeds
+
+    def shortest_paths(self, sources, targets, weights):
+        """Returns the costs of the shortest paths from every source node
+        to every target node (many-to-many).
+
+        The sources are searched together, SEARCH_SIZE source-node pairs
+        at a time, by a Dijkstra search relaxing the edges of all the
+        nodes of a cost interval at once (delta-stepping). The search
+        from a source stops once all the targets are reached.
+
+        Args:
+            sources, targets: Lists of node indexes.
+            weights: The cost of each edge.
+
+        Returns:
+            A float64 array of shape (len(sources), len(targets)), inf
+            where a target cannot be reached.
+        """
+        weights = numpy.asarray(weights, dtype=numpy.float64)
+        targets = numpy.asarray(targets, dtype=numpy.int64)
+        unique, inverse = numpy.unique(
+            numpy.asarray(sources, dtype=numpy.int64), return_inverse=True)
+        costs = numpy.empty((len(unique), len(targets)))
+        # the width of the cost intervals: a few edges
+        width = 4 * float(numpy.mean(weights)) if len(weights) else 0.0
+        width = width or 1.0
+        rows = max(1, SEARCH_SIZE // max(1, len(self.latitudes)))
+        for start in range(0, len(unique), rows):
+            costs[start:start + rows] = self.search(
+                unique[start:start + rows], targets, weights, width)
+        return costs[inverse].reshape(len(sources), len(targets))
+
+    def search(self, sources, targets, weights, width):
+        """Returns the costs of the shortest paths from the sources to the
+        targets (see shortest_paths), searched together.
+
+        The cost of a node from each source is kept in a flat array of
+        source-node pairs. Every step relaxes the edges of the pending
+        pairs of the lowest cost interval of `width`, which may be
+        improved again in the same interval.
+        """
+        size = len(self.latitudes)
+        degrees = numpy.diff(self.indptr)
+        offsets = numpy.arange(len(sources)) * size
+        costs = numpy.full(len(sources) * size, numpy.inf)
+        pending = offsets + sources
+        costs[pending] = 0
+        queued = numpy.zeros(len(costs), dtype=bool)
+        queued[pending] = True
+        # the last candidate written for each pair, to find duplicates
+        written = numpy.zeros(len(costs), dtype=numpy.int64)
+        target_pairs = offsets[:, numpy.newaxis] + targets
+        while pending.size:
+            values = costs[pending]
+            lowest = values.min()
+            # the costs up to the lowest pending one are final: the
+            # sources whose targets are all reached are done
+            done = (costs[target_pairs] <= lowest).all(axis=1)
+            if done.any():
+                kept = ~done[pending // size]
+                pending, values = pending[kept], values[kept]
+                if not pending.size:
+                    break
+                lowest = values.min()
+            current = values < (math.floor(lowest / width) + 1) * width
+            pairs = pending[current]
+            pending = pending[~current]
+            queued[pairs] = False
+            nodes = pairs % size
+            counts = degrees[nodes]
+            total = int(counts.sum())
+            if not total:
+                continue
+            # the edges leaving the nodes, pair by pair
+            edges = numpy.arange(total) + numpy.repeat(
+                self.indptr[nodes] - (numpy.cumsum(counts) - counts), counts)
+            heads = numpy.repeat(pairs - nodes, counts) + self.indices[edges]
+            candidates = numpy.repeat(costs[pairs], counts) + weights[edges]
+            better = candidates < costs[heads]
+            heads, candidates = heads[better], candidates[better]
+            # one pair per improved head
+            improved = numpy.arange(len(heads))
+            written[heads] = improved
+            improved = heads[written[heads] == improved]
+            # the cheapest candidate of a pair reached several times
+            while heads.size:
+                costs[heads] = candidates
+                better = candidates < costs[heads]
+                heads, candidates = heads[better], candidates[better]
+            improved = improved[~queued[improved]]
+            queued[improved] = True
+            pending = numpy.concatenate((pending, improved))
+        return costs[target_pairs]
+
+
+class RoadNetworkProvider:
+    """Travel times on a road network file, in minutes.
+
+    The points are joined to their nearest node in a straight line. The
+    travel times between two points are averaged over both directions,
+    as the route solvers need symmetric costs, and replaced by the
+    straight-line time where no path joins them either way.
+
+    Args:
+        path: The road network file (see RoadNetwork.load).
+        speeds: The speed of each vehicle, in km/h, defaults to
+            VEHICLE_SPEEDS.
+    """
+    unit = 'min'
+
+    def __init__(self, path, speeds=None):
+        self.network = RoadNetwork.load(path)
+        self.reverse = self.network.reverse()
+        self.speeds = dict(VEHICLE_SPEEDS, **(speeds or {}))
+        # a new file gives new cache keys
+        self.key = 'road_network:{}:{}'.format(
+            os.path.abspath(path), os.path.getmtime(path))
+
+    def speed(self, vehicle):
+        return self.speeds.get(vehicle, self.speeds['driving'])
+
+    def costs(self, a, b, origin, vehicle=None):
+        """Returns the travel times from the points `a` to the points
+        `b`, tuples (latitudes, longitudes), in minutes."""
+        speed = self.speed(vehicle)
+        a_nodes, a_offsets = self.network.nearest_nodes(*a)
+        b_nodes, b_offsets = self.network.nearest_nodes(*b)
+        times = self.network.edge_times(speed)
+        reverse_times = self.reverse.edge_times(speed)
+        # from a to b, and from b to a, searched from the fewer nodes:
+        # from b to a on the network is from a to b on the reversed one
+        if a_nodes == b_nodes:
+            forward = self.network.shortest_paths(a_nodes, b_nodes, times)
+            backward = forward.T
+        elif len(set(a_nodes)) <= len(set(b_nodes)):
+            forward = self.network.shortest_paths(a_nodes, b_nodes, times)
+            backward = self.reverse.shortest_paths(
+                a_nodes, b_nodes, reverse_times)
+        else:
+            forward = self.reverse.shortest_paths(
+                b_nodes, a_nodes, reverse_times).T
+            backward = self.network.shortest_paths(
+                b_nodes, a_nodes, times).T
+        # averaged where both directions have a path
+        times = numpy.where(
+            numpy.isfinite(forward) & numpy.isfinite(backward),
+            (forward + backward) / 2, numpy.minimum(forward, backward))
+        access = 60 * (numpy.asarray(a_offsets)[:, numpy.newaxis] +
+                       numpy.asarray(b_offsets)) / speed
+        straight = 60 * distances.equirectangular_distances(
+            a, b, origin) / speed
+        times = numpy.where(numpy.isfinite(times), times + access, straight)
+        # a point is at no time from itself
+        same = (numpy.asarray(a[0])[:, numpy.newaxis] ==
+                numpy.asarray(b[0])) & (
+            numpy.asarray(a[1])[:, numpy.newaxis] == numpy.asarray(b[1]))
+        return numpy.where(same, 0, times).astype(numpy.float32)
+
+    def matrix(self, latitudes, longitudes, origin, vehicle=None):
+        return self.costs((latitudes, longitudes), (latitudes, longitudes),
+                          origin, vehicle)
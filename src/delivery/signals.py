@@ -0,0 +1,20 @@
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+
+from member.models import Address
+from .cache import invalidate_distance_matrices
+
+
+@receiver(pre_save, sender=Address,
+          dispatch_uid="pre_save.address_distance_matrices")
+def address_moved(sender, instance, raw, **kwargs):
+    if instance.pk is None or raw:
+        return
+    coordinates = ('latitude', 'longitude')
+    previous = Address.objects.filter(pk=instance.pk).values_list(
+        *coordinates).first()
+    current = tuple(
+        Address._meta.get_field(name).to_python(getattr(instance, name))
+        for name in coordinates)
+    if previous and previous != current:
+        invalidate_distance_matrices()
@@ -1,28 +1,58 @@
 import datetime
+import heapq
+import io
 import json
 import importlib
-
+import math
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.db.models import Q
 from django.test import RequestFactory
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 from django.urls import reverse_lazy, reverse
 from django.utils import timezone as tz
+from django.utils.text import slugify
 from django.utils.translation import ugettext_lazy, ugettext
 
+import numpy
+import PyPDF2
+
 from meal.models import (Menu, Component, Component_ingredient, Ingredient,
+                         COMPONENT_GROUP_CHOICES_MAIN_DISH,
                          COMPONENT_GROUP_CHOICES_SIDES)
 from meal.factories import (IngredientFactory, ComponentFactory,
                             ComponentIngredientFactory,
                             IncompatibilityFactory, RestrictedItemFactory)
-from order.models import Order
+from order.cache import get_kitchen_count, kitchen_count_key
+from order.factories import OrderFactory
+from order.models import (Order, Order_item, DeliveryClient, DeliveryItem,
+                          ORDER_STATUS_CANCELLED, ORDER_STATUS_ORDERED)
 from member.models import (Client, Member, Route, Restriction, DAYS_OF_WEEK,
                            Client_avoid_ingredient, DeliveryHistory)
 from member.factories import (AddressFactory, MemberFactory, ClientFactory,
                               RouteFactory, DeliveryHistoryFactory)
 from sous_chef.tests import TestMixin as SousChefTestMixin
 
+from . import distances, jobs, label_sheets, road_network, tsp, vrp
+from .management.commands import benchmarkroutes
+from .cache import get_distance_matrix, get_provider
 from .filters import KitchenCountOrderFilter
+from .label_sheets import MealLabel, meal_label_fields
+from .models import ReportJob
+from .views import (
+    DELIVERY_STARTING_POINT_LAT_LONG, MultiRouteReport, RouteSummaryLine,
+    calculateRoutePointsEuclidean, kcr_make_labels, kitchen_count,
+    optimize_routes, propose_routes)
 
 
 class KitchenCountReportTestCase(SousChefTestMixin, TestCase):
@@ -136,7 +166,7 @@ class KitchenCountReportTestCase(SousChefTestMixin, TestCase):
 
         self.client.get(reverse_lazy('delivery:kitchen_count'))
         response = self.client.get(reverse_lazy('delivery:mealLabels'))
-        self.assertTrue('ReportLab' in repr(response.content))
+        self.assertTrue('ReportLab' in repr(response.getvalue()))
 
     def test_pdf_report_show_restrictions(self):
         """An ingredient we know will clash must be in the pdf report"""
@@ -151,10 +181,21 @@ class KitchenCountReportTestCase(SousChefTestMixin, TestCase):
              'Green Salad', 'Fruit Salad',
              'Day s Dessert', 'Day s Diabetic Dessert',
              'Day s Pudding', 'Day s Compote'])
+        # confirm the ingredients of the main dish and sides today,
+        # otherwise no report is rendered
+        main_dish = Component.objects.get(name='Ginger pork')
+        for ing in Component.get_recipe_ingredients(main_dish.id):
+            Component_ingredient.objects.create(
+                component=main_dish, ingredient=ing, date=self.today)
+        Component_ingredient.objects.create(
+            component=Component.objects.get(
+                component_group=COMPONENT_GROUP_CHOICES_SIDES),
+            ingredient=Ingredient.objects.get(name='Brussel sprouts'),
+            date=self.today)
 
         self.client.get('/delivery/kitchen_count/')
         response = self.client.get('/delivery/viewDownloadKitchenCount/')
-        self.assertTrue('ReportLab' in repr(response.content))
+        self.assertTrue('ReportLab' in repr(response.getvalue()))
 
     def test_extra_similar_side_dishes(self):
         """Test cumulative quantities for similar side dishes."""
@@ -209,6 +250,799 @@ class KitchenCountReportTestCase(SousChefTestMixin, TestCase):
         self.assertTrue(b'Compote' in response.content)
 
 
+def create_kitchen_count(delivery_date):
+    """
+    Create the orders, menu and confirmed ingredients of a delivery date.
+    """
+    Order.objects.auto_create_orders(delivery_date, Client.active.all())
+    main_dish = Component.objects.get(name='Ginger pork')
+    for ingredient in Component.get_recipe_ingredients(main_dish.id):
+        Component_ingredient.objects.create(
+            component=main_dish, ingredient=ingredient, date=delivery_date)
+    Component_ingredient.objects.create(
+        component=Component.objects.get(
+            component_group=COMPONENT_GROUP_CHOICES_SIDES),
+        ingredient=Ingredient.objects.get(name='Cabbage'),
+        date=delivery_date)
+    Menu.create_menu_and_components(
+        delivery_date,
+        ['Ginger pork',
+         'Green Salad', 'Fruit Salad',
+         'Day s Dessert', 'Day s Diabetic Dessert',
+         'Day s Pudding', 'Day s Compote'])
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class KitchenCountCacheTestCase(SousChefTestMixin, TestCase):
+
+    fixtures = ['sample_data']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = datetime.date.today()
+        create_kitchen_count(cls.today)
+
+    def setUp(self):
+        cache.clear()
+        self.force_login()
+
+    def get_kitchen_count(self):
+        with patch.object(Order, 'get_kitchen_items',
+                          wraps=Order.get_kitchen_items) as get_items:
+            response = self.client.get(reverse('delivery:kitchen_count'))
+        self.assertEqual(response.status_code, 200)
+        return response, get_items.call_count
+
+    def test_repeated_views_are_cached(self):
+        response, computed = self.get_kitchen_count()
+        self.assertEqual(computed, 1)
+        response, computed = self.get_kitchen_count()
+        self.assertEqual(computed, 0)
+        # the kitchen count and meal labels were rendered from the cache
+        self.assertEqual(
+            response.context['kitchen_count_cache'],
+            {'hits': 3, 'misses': 1})
+        self.assertContains(response, 'Cache: 3 hits, 1 misses')
+
+    def test_order_change_invalidates(self):
+        self.get_kitchen_count()
+        item = Order_item.objects.filter(
+            order__delivery_date=self.today,
+            component_group=COMPONENT_GROUP_CHOICES_MAIN_DISH).first()
+        item.total_quantity += 1
+        item.save()
+        response, computed = self.get_kitchen_count()
+        self.assertEqual(computed, 1)
+
+    def test_status_change_invalidates(self):
+        self.get_kitchen_count()
+        order = Order.objects.filter(delivery_date=self.today).first()
+        Order.objects.update_orders_status(
+            Order.objects.filter(pk=order.pk), ORDER_STATUS_CANCELLED)
+        response, computed = self.get_kitchen_count()
+        self.assertEqual(computed, 1)
+
+    def test_other_date_does_not_invalidate(self):
+        self.get_kitchen_count()
+        Order.objects.auto_create_orders(
+            self.today + datetime.timedelta(days=1), Client.active.all())
+        response, computed = self.get_kitchen_count()
+        self.assertEqual(computed, 0)
+
+    def test_restriction_change_invalidates(self):
+        self.get_kitchen_count()
+        Restriction.objects.filter(client__in=Order.objects.filter(
+            delivery_date=self.today).values('client_id')).first().delete()
+        response, computed = self.get_kitchen_count()
+        self.assertEqual(computed, 1)
+
+    def test_client_member_change_invalidates(self):
+        self.get_kitchen_count()
+        member = Order.objects.filter(
+            delivery_date=self.today).first().client.member
+        member.firstname = 'Changed'
+        member.save()
+        response, computed = self.get_kitchen_count()
+        self.assertEqual(computed, 1)
+
+    def test_unrelated_member_change_does_not_invalidate(self):
+        tomorrow = self.today + datetime.timedelta(days=1)
+        client = Client.objects.exclude(
+            pk__in=Order.objects.filter(
+                delivery_date=self.today).values('client_id')).first()
+        OrderFactory(client=client, delivery_date=tomorrow)
+        self.get_kitchen_count()
+        key = kitchen_count_key(tomorrow)
+        client.member.firstname = 'Changed'
+        client.member.save()
+        response, computed = self.get_kitchen_count()
+        self.assertEqual(computed, 0)
+        # only the dates of the client's orders are invalidated
+        self.assertNotEqual(kitchen_count_key(tomorrow), key)
+
+    def test_change_of_fields_not_shown_does_not_invalidate(self):
+        self.get_kitchen_count()
+        client = Order.objects.filter(
+            delivery_date=self.today).first().client
+        client.member.work_information = 'Changed'
+        client.member.save(update_fields=['work_information'])
+        client.route.client_id_sequence = []
+        client.route.save(update_fields=['client_id_sequence'])
+        response, computed = self.get_kitchen_count()
+        self.assertEqual(computed, 0)
+        client.route.name = 'Changed'
+        client.route.save(update_fields=['name'])
+        response, computed = self.get_kitchen_count()
+        self.assertEqual(computed, 1)
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ReportJobTestCase(SousChefTestMixin, TestCase):
+
+    fixtures = ['sample_data']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = datetime.date.today()
+        create_kitchen_count(cls.today)
+
+    def setUp(self):
+        cache.clear()
+        self.force_login()
+
+    def get_jobs(self):
+        response = self.client.get(reverse('delivery:kitchen_count'))
+        self.assertEqual(response.status_code, 200)
+        return (response.context['kitchen_count_job'],
+                response.context['meal_labels_job'])
+
+    def test_kitchen_count_renders_reports(self):
+        for job in self.get_jobs():
+            self.assertEqual(job.status, ReportJob.DONE)
+            self.assertEqual(job.delivery_date, self.today)
+            self.assertGreater(job.count, 0)
+            response = self.client.get(
+                reverse('delivery:report_job_download', args=(job.pk,)))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'application/pdf')
+            self.assertIn(self.today.strftime('%Y%m%d'),
+                          response['Content-Disposition'])
+            self.assertTrue(response.getvalue().startswith(b'%PDF'))
+
+    def test_download_is_streamed_with_length_and_etag(self):
+        kitchen_count_job, meal_labels_job = self.get_jobs()
+        url = reverse('delivery:report_job_download',
+                      args=(meal_labels_job.pk,))
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        content = response.getvalue()
+        self.assertEqual(int(response['Content-Length']), len(content))
+        self.assertTrue(response['ETag'])
+        response = self.client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_status(self):
+        kitchen_count_job, meal_labels_job = self.get_jobs()
+        response = self.client.get(
+            reverse('delivery:report_job', args=(meal_labels_job.pk,)))
+        status = json.loads(response.content.decode())
+        self.assertEqual(status['status'], ReportJob.DONE)
+        self.assertEqual(status['kind'], ReportJob.MEAL_LABELS)
+        self.assertEqual(status['delivery_date'], self.today.isoformat())
+        self.assertEqual(
+            status['download_url'],
+            reverse('delivery:report_job_download',
+                    args=(meal_labels_job.pk,)))
+
+    def test_pending_job_cannot_be_downloaded(self):
+        job = ReportJob.objects.create(
+            kind=ReportJob.KITCHEN_COUNT, delivery_date=self.today)
+        response = self.client.get(
+            reverse('delivery:report_job', args=(job.pk,)))
+        status = json.loads(response.content.decode())
+        self.assertEqual(status['status'], ReportJob.PENDING)
+        self.assertIsNone(status['download_url'])
+        response = self.client.get(
+            reverse('delivery:report_job_download', args=(job.pk,)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_download_report_of_date(self):
+        self.get_jobs()
+        tomorrow = self.today + datetime.timedelta(days=1)
+        for name in ('downloadKitchenCount', 'mealLabels'):
+            for url in (reverse('delivery:' + name),
+                        reverse('delivery:' + name + '_date', kwargs={
+                            'year': self.today.strftime('%Y'),
+                            'month': self.today.strftime('%m'),
+                            'day': self.today.strftime('%d')})):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn(self.today.strftime('%Y%m%d'),
+                              response['Content-Disposition'])
+            # not the report of another date, without orders
+            response = self.client.get(
+                reverse('delivery:' + name + '_date', kwargs={
+                    'year': tomorrow.strftime('%Y'),
+                    'month': tomorrow.strftime('%m'),
+                    'day': tomorrow.strftime('%d')}))
+            self.assertEqual(response.status_code, 404)
+
+    def test_download_report_being_rendered(self):
+        tomorrow = self.today + datetime.timedelta(days=1)
+        job = ReportJob.objects.create(
+            kind=ReportJob.MEAL_LABELS, delivery_date=tomorrow,
+            key=jobs.job_key(ReportJob.MEAL_LABELS, tomorrow))
+        response = self.client.get(reverse('delivery:mealLabels_date', kwargs={
+            'year': tomorrow.strftime('%Y'),
+            'month': tomorrow.strftime('%m'),
+            'day': tomorrow.strftime('%d')}))
+        self.assertEqual(response.status_code, 202)
+        status = json.loads(response.content.decode())
+        self.assertEqual(status['id'], job.pk)
+        self.assertEqual(status['status'], ReportJob.PENDING)
+        # the report rendered before the orders changed is outdated
+        kitchen_count_job, meal_labels_job = self.get_jobs()
+        Order_item.objects.filter(order__delivery_date=self.today).first(
+        ).save()
+        response = self.client.get(reverse('delivery:mealLabels'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(
+            ReportJob.objects.filter(pk=meal_labels_job.pk).exists())
+
+    def test_identical_requests_share_jobs(self):
+        first = self.get_jobs()
+        with patch.dict(jobs.RENDERERS, {}):
+            # no job is rendered again
+            second = self.get_jobs()
+        self.assertEqual([job.pk for job in first],
+                         [job.pk for job in second])
+        self.assertEqual(ReportJob.objects.count(), 2)
+
+    def test_change_renders_new_jobs(self):
+        first = self.get_jobs()
+        item = Order_item.objects.filter(
+            order__delivery_date=self.today,
+            component_group=COMPONENT_GROUP_CHOICES_MAIN_DISH).first()
+        item.total_quantity += 1
+        item.save()
+        second = self.get_jobs()
+        for old_job, job in zip(first, second):
+            self.assertNotEqual(old_job.pk, job.pk)
+            self.assertEqual(job.status, ReportJob.DONE)
+            # the superseded jobs are deleted with their files
+            self.assertFalse(
+                ReportJob.objects.filter(pk=old_job.pk).exists())
+            self.assertFalse(os.path.exists(old_job.artifact))
+        self.assertEqual(second[1].count, first[1].count + 1)
+
+    def test_failed_job_is_retried(self):
+        def fail(delivery_date, filename):
+            raise ValueError('Broken renderer')
+
+        with patch.dict(jobs.RENDERERS, {ReportJob.KITCHEN_COUNT: fail}), \
+                self.assertLogs('delivery.jobs', 'ERROR'):
+            failed_job = jobs.submit(ReportJob.KITCHEN_COUNT, self.today)
+        self.assertEqual(failed_job.status, ReportJob.FAILED)
+        self.assertEqual(failed_job.error, 'Broken renderer')
+        self.assertIsNone(failed_job.key)
+        job = jobs.submit(ReportJob.KITCHEN_COUNT, self.today)
+        self.assertNotEqual(job.pk, failed_job.pk)
+        self.assertEqual(job.status, ReportJob.DONE)
+
+    def test_stale_job_is_replaced(self):
+        job = jobs.submit(ReportJob.MEAL_LABELS, self.today)
+        ReportJob.objects.filter(pk=job.pk).update(
+            status=ReportJob.RUNNING,
+            created_at=tz.now() - datetime.timedelta(hours=1))
+        new_job = jobs.submit(ReportJob.MEAL_LABELS, self.today)
+        self.assertNotEqual(new_job.pk, job.pk)
+        self.assertEqual(new_job.status, ReportJob.DONE)
+        # failed, then superseded by the new job
+        self.assertFalse(ReportJob.objects.filter(pk=job.pk).exists())
+
+
+class MealLabelsRenderingTestCase(TestCase):
+
+    fixtures = ['sample_data']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = datetime.date.today()
+        create_kitchen_count(cls.today)
+
+    def make_labels(self, filename, **kwargs):
+        report = kitchen_count(self.today)
+        return kcr_make_labels(
+            self.today, report['kitchen_list'],
+            report['component_lines'][0].name,
+            report['component_lines'][0].ingredients,
+            filename, **kwargs)
+
+    def test_chunks_are_concatenated_in_order(self):
+        meal_labels = [
+            MealLabel(*meal_label_fields[1::2])._replace(
+                name='Client {:02}'.format(i))
+            for i in range(2 * label_sheets.LABELS_PER_SHEET + 3)]
+        pdf = io.BytesIO()
+        sheets = label_sheets.render(meal_labels, pdf, processes=2)
+        self.assertEqual(sheets, 3)
+        reader = PyPDF2.PdfFileReader(pdf)
+        self.assertEqual(reader.getNumPages(), 3)
+        for number, page in enumerate(reader.pages):
+            text = page.extractText()
+            first = number * label_sheets.LABELS_PER_SHEET
+            self.assertIn('Client {:02}'.format(first), text)
+            self.assertNotIn('Client {:02}'.format(first - 1), text)
+
+    def test_one_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'labels.pdf')
+            count = self.make_labels(filename)
+            self.assertEqual(count, kitchen_count(self.today)['num_labels'])
+            self.assertEqual(
+                PyPDF2.PdfFileReader(filename).getNumPages(),
+                math.ceil(count / label_sheets.LABELS_PER_SHEET))
+
+    def test_one_file_per_route(self):
+        with tempfile.TemporaryDirectory() as directory:
+            count = self.make_labels(directory, by_route=True)
+            routes = {
+                kititm.routename for kititm in
+                kitchen_count(self.today)['kitchen_list'].values()}
+            self.assertEqual(
+                sorted(os.listdir(directory)),
+                sorted('{}.pdf'.format(slugify(route.upper()))
+                       for route in routes))
+            self.assertEqual(count, kitchen_count(self.today)['num_labels'])
+
+    def test_command_by_route(self):
+        report = kitchen_count(self.today)
+        routes = {kititm.routename
+                  for kititm in report['kitchen_list'].values()}
+        with tempfile.TemporaryDirectory() as directory:
+            out = io.StringIO()
+            call_command('makelabels', self.today.strftime('%Y-%m-%d'),
+                         directory, by_route=True, stdout=out)
+            self.assertIn('{} meal label(s)'.format(report['num_labels']),
+                          out.getvalue())
+            self.assertEqual(
+                sorted(os.listdir(directory)),
+                sorted('{}.pdf'.format(slugify(route.upper()))
+                       for route in routes))
+            # all the labels of a route are in its file
+            for route in routes:
+                labels = sum(
+                    kititm.meal_qty
+                    for kititm in report['kitchen_list'].values()
+                    if kititm.routename == route)
+                self.assertEqual(
+                    PyPDF2.PdfFileReader(os.path.join(
+                        directory, '{}.pdf'.format(slugify(route.upper())))
+                    ).getNumPages(),
+                    math.ceil(labels / label_sheets.LABELS_PER_SHEET))
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'labels.pdf')
+            call_command('makelabels', self.today.strftime('%Y-%m-%d'),
+                         filename, stdout=io.StringIO())
+            self.assertEqual(
+                PyPDF2.PdfFileReader(filename).getNumPages(),
+                math.ceil(kitchen_count(self.today)['num_labels'] /
+                          label_sheets.LABELS_PER_SHEET))
+
+
+class DistancesTestCase(SimpleTestCase):
+
+    def setUp(self):
+        random.seed(0)
+        self.latitudes = [45.5 + random.random() * 0.1 for i in range(20)]
+        self.longitudes = [-73.6 + random.random() * 0.1 for i in range(20)]
+
+    def test_haversine(self):
+        matrix = distances.distance_matrix(
+            [45.0, 46.0, 45.0], [-73.0, -73.0, -72.0], distances.HAVERSINE)
+        self.assertEqual(matrix.dtype, numpy.float32)
+        # one degree of latitude
+        self.assertAlmostEqual(float(matrix[0, 1]), 111.195, places=2)
+        # one degree of longitude at 45 degrees of latitude
+        self.assertAlmostEqual(float(matrix[0, 2]), 78.626, places=2)
+        self.assertEqual(float(matrix[1, 0]), float(matrix[0, 1]))
+
+    def test_equirectangular_is_close_in_a_city(self):
+        haversine = distances.distance_matrix(
+            self.latitudes, self.longitudes, distances.HAVERSINE)
+        projected = distances.distance_matrix(
+            self.latitudes, self.longitudes, distances.EQUIRECTANGULAR,
+            origin=(45.516564, -73.575145))
+        self.assertEqual(projected.shape, (20, 20))
+        self.assertEqual(projected.dtype, numpy.float32)
+        self.assertTrue(numpy.all(projected.diagonal() == 0))
+        self.assertTrue(numpy.allclose(projected, haversine, rtol=5e-3))
+
+    def test_empty(self):
+        self.assertEqual(distances.distance_matrix([], []).shape, (0, 0))
+
+    def test_unknown_metric(self):
+        with self.assertRaises(ValueError):
+            distances.distance_matrix([45.0], [-73.0], 'manhattan')
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DistanceMatrixCacheTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        random.seed(0)
+        self.origin = (45.5, -73.6)
+        self.stops = [
+            (pk, 45.5 + random.random() / 10, -73.6 + random.random() / 10)
+            for pk in range(1, 31)]
+
+    def expected(self, stops):
+        return distances.distance_matrix(
+            [self.origin[0]] + [stop[1] for stop in stops],
+            [self.origin[1]] + [stop[2] for stop in stops],
+            origin=self.origin)
+
+    def get_matrix(self, stops, group=None):
+        with patch('delivery.distances.distance_matrix',
+                   wraps=distances.distance_matrix) as full, \
+                patch('delivery.distances.equirectangular_distances',
+                      wraps=distances.equirectangular_distances) as rows:
+            matrix = get_distance_matrix(stops, self.origin, group)
+        numpy.testing.assert_allclose(matrix, self.expected(stops),
+                                      atol=1e-5)
+        return full.call_count, rows.call_count and \
+            len(rows.call_args[0][0][0])
+
+    def test_stable_stops_are_cached(self):
+        self.assertEqual(self.get_matrix(self.stops), (1, 0))
+        shuffled = list(self.stops)
+        random.shuffle(shuffled)
+        self.assertEqual(self.get_matrix(shuffled), (0, 0))
+
+    def test_added_and_moved_stops_are_computed_incrementally(self):
+        self.assertEqual(self.get_matrix(self.stops[:25], 'route'), (1, 0))
+        # 5 clients added to the route, one removed
+        self.assertEqual(self.get_matrix(self.stops[1:], 'route'), (0, 5))
+        # a client moved, i.e. new coordinates
+        stops = self.stops[1:-1] + [(30, 45.55, -73.55)]
+        self.assertEqual(self.get_matrix(stops, 'route'), (0, 1))
+        # other groups are not affected
+        self.assertEqual(self.get_matrix(self.stops[:3], 'other'), (1, 0))
+
+    def test_invalidated_when_an_address_moves(self):
+        address = AddressFactory()
+        self.get_matrix(self.stops, 'route')
+        address.street = 'Another street'
+        address.save()
+        self.assertEqual(self.get_matrix(self.stops, 'route'), (0, 0))
+        address.latitude = '45.1'
+        address.save()
+        self.assertEqual(self.get_matrix(self.stops, 'route'), (1, 0))
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class RoadNetworkTestCase(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        # Four intersections along a street, 1 km apart: a slow two-way
+        # block between 1 and 2, a one-way block from 2 to 3. Node 4 is
+        # not connected.
+        self.latitudes = [45.5, 45.509, 45.518, 45.527, 45.6]
+        self.longitudes = [-73.6] * 5
+        self.network = road_network.RoadNetwork.from_edges(
+            self.latitudes, self.longitudes, [
+                (0, 1, 1.0, 50.0), (1, 0, 1.0, 50.0),
+                (1, 2, 1.0, 10.0), (2, 1, 1.0, 10.0),
+                (2, 3, 1.0, 50.0),
+            ])
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'network.npz')
+        self.network.save(self.path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_shortest_paths(self):
+        network = road_network.RoadNetwork.load(self.path)
+        numpy.testing.assert_array_equal(network.indptr, [0, 1, 3, 5, 5, 5])
+        inf = numpy.inf
+        numpy.testing.assert_array_equal(
+            network.shortest_paths([0, 3, 0], [3, 0, 4], network.lengths),
+            [[3, 0, inf], [0, inf, inf], [3, 0, inf]])
+        # minutes driving, the block between 1 and 2 at its speed limit
+        numpy.testing.assert_allclose(
+            network.shortest_paths([0], [1, 2, 3], network.edge_times(30)),
+            [[2, 8, 10]])
+        numpy.testing.assert_allclose(
+            network.reverse().shortest_paths(
+                [3], [2, 1, 0], network.reverse().edge_times(30)),
+            [[2, 8, 10]])
+
+    def test_shortest_paths_match_dijkstra(self):
+        generator = random.Random(0)
+        size = 200
+        edges = {(generator.randrange(size), generator.randrange(size)):
+                 generator.choice([0, generator.uniform(0.1, 2)])
+                 for _ in range(600)}
+        network = road_network.RoadNetwork.from_edges(
+            [45.5] * size, [-73.6] * size,
+            [(u, v, length) for (u, v), length in edges.items()])
+
+        def dijkstra(source):
+            costs = {}
+            heap = [(0.0, source)]
+            while heap:
+                cost, u = heapq.heappop(heap)
+                if u in costs:
+                    continue
+                costs[u] = cost
+                for (a, v), length in edges.items():
+                    if a == u and v not in costs:
+                        heapq.heappush(heap, (cost + length, v))
+            return costs
+
+        sources = [generator.randrange(size) for _ in range(12)] + [0, 0]
+        targets = [generator.randrange(size) for _ in range(15)]
+        expected = [[dijkstra(source).get(target, numpy.inf)
+                     for target in targets] for source in sources]
+        # a few sources searched together at a time
+        with patch.object(road_network, 'SEARCH_SIZE', 3 * size):
+            numpy.testing.assert_allclose(
+                network.shortest_paths(sources, targets, network.lengths),
+                expected)
+
+    def test_provider_costs_are_symmetric(self):
+        provider = road_network.RoadNetworkProvider(self.path)
+        a = (self.latitudes[:1], self.longitudes[:1])
+        b = (self.latitudes[1:4], self.longitudes[1:4])
+        # searched from a, then from b
+        numpy.testing.assert_allclose(
+            provider.costs(a, b, (45.5, -73.6), 'walking'),
+            provider.costs(b, a, (45.5, -73.6), 'walking').T)
+
+    def test_provider_costs(self):
+        provider = road_network.RoadNetworkProvider(self.path)
+        matrix = provider.matrix(self.latitudes[:4], self.longitudes[:4],
+                                 (45.5, -73.6), 'walking')
+        # 12 minutes per block, below the speed limits; 3 -> 2 is the
+        # time of the one-way 2 -> 3
+        numpy.testing.assert_allclose(matrix, [
+            [0, 12, 24, 36],
+            [12, 0, 12, 24],
+            [24, 12, 0, 12],
+            [36, 24, 12, 0],
+        ], atol=0.1)
+        # off the network, in a straight line
+        costs = provider.costs(
+            ([45.5], [-73.6]), ([45.6], [-73.6]), (45.5, -73.6), 'walking')
+        self.assertAlmostEqual(
+            float(costs[0, 0]),
+            60 * distances.equirectangular_distances(
+                ([45.5], [-73.6]), ([45.6], [-73.6]),
+                (45.5, -73.6))[0, 0] / 5, places=3)
+
+    def test_provider_setting(self):
+        self.assertEqual(get_provider().unit, 'km')
+        with override_settings(ROUTE_COST_PROVIDER={
+                'BACKEND': 'delivery.road_network.RoadNetworkProvider',
+                'OPTIONS': {'path': self.path}}):
+            provider = get_provider()
+            self.assertIs(get_provider(), provider)
+            self.assertEqual(provider.unit, 'min')
+            stops = [(1, self.latitudes[2], self.longitudes[2]),
+                     (2, self.latitudes[1], self.longitudes[1])]
+            matrix = get_distance_matrix(stops, (45.5, -73.6), 'route',
+                                         'driving')
+            numpy.testing.assert_allclose(
+                matrix, [[0, 8, 2], [8, 0, 6], [2, 6, 0]], atol=0.1)
+            # the costs of another vehicle are cached apart
+            matrix = get_distance_matrix(stops, (45.5, -73.6), 'route',
+                                         'cycling')
+            self.assertAlmostEqual(float(matrix[0, 2]), 4, places=1)
+
+
+class TSPTestCase(SimpleTestCase):
+
+    def setUp(self):
+        random.seed(0)
+        self.nodes = [
+            tsp.Node(i, 45.5 + random.random() * 0.1,
+                     -73.6 + random.random() * 0.1)
+            for i in range(60)]
+
+    def test_solve(self):
+        tour = tsp.solve(self.nodes)
+        self.assertIs(tour[0], self.nodes[0])
+        self.assertEqual(sorted(node.id for node in tour), list(range(60)))
+        matrix = distances.nodes_distance_matrix(self.nodes)
+        self.assertLess(
+            tsp.tour_distance([node.id for node in tour], matrix),
+            tsp.tour_distance(list(range(60)), matrix))
+
+    def test_short_tours(self):
+        for n in range(4):
+            self.assertEqual(tsp.solve(self.nodes[:n]), self.nodes[:n])
+
+    def test_no_improving_move_is_left(self):
+        matrix = distances.nodes_distance_matrix(self.nodes)
+        tour = tsp.solve_matrix(matrix, neighbors=len(matrix))
+        distance = tsp.tour_distance(tour, matrix)
+        for i in range(1, len(tour) - 1):
+            for j in range(i + 1, len(tour)):
+                neighbor = tour[:i] + tour[i:j + 1][::-1] + tour[j + 1:]
+                self.assertGreaterEqual(
+                    tsp.tour_distance(neighbor, matrix),
+                    distance * (1 - 1e-6))
+
+    def test_initial_tour(self):
+        matrix = distances.nodes_distance_matrix(self.nodes)
+        initial = list(range(len(matrix)))
+        random.shuffle(initial)
+        tour = tsp.solve_matrix(matrix, initial)
+        self.assertEqual(tour[0], initial[0])
+        self.assertLess(tsp.tour_distance(tour, matrix),
+                        tsp.tour_distance(initial, matrix))
+
+    def test_optimize(self):
+        matrix = distances.nodes_distance_matrix(self.nodes)
+        tour = tsp.optimize(matrix)
+        self.assertEqual(tour[0], 0)
+        self.assertEqual(sorted(tour), list(range(60)))
+        # Or-opt and 3-opt only improve on the 2-opt tour
+        self.assertLessEqual(tsp.tour_distance(tour, matrix),
+                             tsp.tour_distance(tsp.solve_matrix(matrix),
+                                               matrix))
+
+    def test_or_opt_and_three_opt_improve(self):
+        matrix = distances.nodes_distance_matrix(self.nodes)
+        neighbors = tsp.neighbor_lists(matrix, tsp.NEIGHBORS)
+        matrix = matrix.tolist()
+        for move in (tsp.or_opt, tsp.three_opt):
+            tour = list(range(60))
+            random.shuffle(tour)
+            before = tsp.tour_distance(tour, matrix)
+            self.assertTrue(move(tour, matrix, neighbors))
+            self.assertEqual(sorted(tour), list(range(60)))
+            self.assertLess(tsp.tour_distance(tour, matrix), before)
+
+    def test_insert(self):
+        matrix = distances.nodes_distance_matrix(self.nodes)
+        tour = tsp.optimize(matrix)
+        # each node is inserted back where it was removed from
+        for node in tour[1:]:
+            partial = [n for n in tour if n != node]
+            self.assertLessEqual(
+                tsp.tour_distance(tsp.insert(partial, [node], matrix),
+                                  matrix),
+                tsp.tour_distance(tour, matrix) + 1e-4)
+        self.assertEqual(sorted(tsp.insert([], [3, 1, 2], matrix)), [1, 2, 3])
+
+    def test_calculate_route_points_from_sequence(self):
+        waypoints = [{'id': node.id + 100, 'latitude': node.latitude,
+                      'longitude': node.longitude} for node in self.nodes]
+        optimised = calculateRoutePointsEuclidean(waypoints)
+        sequence = [waypoint['id'] for waypoint in optimised]
+        self.assertEqual(
+            calculateRoutePointsEuclidean(waypoints, sequence=sequence),
+            optimised)
+        # unknown IDs are ignored, missing waypoints are inserted
+        result = calculateRoutePointsEuclidean(
+            waypoints, sequence=[1] + sequence[10:] + [2])
+        self.assertEqual(sorted(waypoint['id'] for waypoint in result),
+                         sorted(sequence))
+
+    def test_optimize_all(self):
+        matrix = distances.nodes_distance_matrix(self.nodes)
+        tasks = [(matrix[:n, :n], None, None) for n in (10, 30, 60)]
+        results = tsp.optimize_all(tasks, processes=2)
+        self.assertEqual([tour for tour, *_ in results],
+                         [tsp.optimize(*task) for task in tasks])
+        for (tour, before, after, seconds), (task_matrix, _, _) in zip(
+                results, tasks):
+            self.assertAlmostEqual(
+                before, tsp.tour_distance(list(range(len(tour))),
+                                          task_matrix), places=4)
+            self.assertLess(after, before)
+
+    def test_optimize_budget(self):
+        matrix = distances.nodes_distance_matrix(self.nodes)
+        start = time.monotonic()
+        tour = tsp.optimize(matrix, budget=0.3)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(tour[0], 0)
+        self.assertEqual(sorted(tour), list(range(60)))
+        self.assertLessEqual(tsp.tour_distance(tour, matrix),
+                             tsp.tour_distance(tsp.optimize(matrix), matrix))
+
+
+class BenchmarkRoutesTestCase(SimpleTestCase):
+
+    def test_benchmarkroutes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            out = io.StringIO()
+            call_command('benchmarkroutes', 5, 12, budget=0.01,
+                         output=output, stdout=out)
+            self.assertIn('12 results written', out.getvalue())
+            with open(output) as f:
+                results = json.load(f)['results']
+            # compared with itself, the gaps do not change
+            call_command('benchmarkroutes', 5, 12, budget=0.01,
+                         output=output + '.2', baseline=output,
+                         stdout=io.StringIO())
+            with open(output + '.2') as f:
+                self.assertEqual(
+                    [result['gap'] for result in results],
+                    [result['gap'] for result in json.load(f)['results']])
+        self.assertEqual(len(results), 12)
+        for layout in ('uniform', 'clustered'):
+            for size in (5, 12):
+                instance = [result for result in results
+                            if (result['layout'], result['size']) ==
+                            (layout, size)]
+                self.assertEqual(len(instance), 3)
+                self.assertEqual(min(r['gap'] for r in instance), 0)
+                for result in instance:
+                    self.assertGreater(result['peak_memory'], 0)
+
+    def test_generated_stops_are_reproducible(self):
+        for layout in ('uniform', 'clustered'):
+            stops = benchmarkroutes.generate_stops(layout, 20, 0)
+            self.assertEqual(len(stops[0]), 21)
+            self.assertEqual(
+                stops, benchmarkroutes.generate_stops(layout, 20, 0))
+            self.assertNotEqual(
+                stops, benchmarkroutes.generate_stops(layout, 20, 1))
+
+
+class VRPTestCase(SimpleTestCase):
+
+    def setUp(self):
+        random.seed(0)
+        self.matrix = distances.distance_matrix(
+            [45.5 + random.random() * 0.1 for _ in range(61)],
+            [-73.6 + random.random() * 0.1 for _ in range(61)])
+
+    def test_solve(self):
+        capacities = [25, 20, 15]
+        tours = vrp.solve(self.matrix, capacities)
+        self.assertEqual(len(tours), 3)
+        self.assertEqual(sorted(node for tour in tours for node in tour[1:]),
+                         list(range(1, 61)))
+        for tour, capacity in zip(tours, capacities):
+            self.assertEqual(tour[0], 0)
+            self.assertLessEqual(len(tour) - 1, capacity)
+
+    def test_demands(self):
+        demands = [0] + [2] * 30 + [1] * 30
+        tours = vrp.solve(self.matrix, [45, 45], demands)
+        for tour in tours:
+            self.assertLessEqual(sum(demands[node] for node in tour), 45)
+
+    def test_relocate_shortens_the_routes(self):
+        capacities = [40, 40]
+        tours = vrp.assign(self.matrix, capacities, [0] + [1] * 60)
+        before = sum(tsp.tour_distance(vrp.sequence(tour, self.matrix),
+                                       self.matrix) for tour in tours)
+        tours = vrp.solve(self.matrix, capacities)
+        self.assertLessEqual(
+            sum(tsp.tour_distance(tour, self.matrix) for tour in tours),
+            before + 1e-6)
+
+    def test_over_capacity(self):
+        with self.assertRaises(ValueError):
+            vrp.solve(self.matrix, [30, 29])
+
+
 class ChooseDayMainDishIngredientsTestCase(SousChefTestMixin, TestCase):
 
     fixtures = ['sample_data']
@@ -452,6 +1286,18 @@ class DeliveryRouteSheetTestCase(SousChefTestMixin, TestCase):
         route_list = Order.get_delivery_list(self.today, self.route_id)
         self.assertTrue('Blondin' in repr(route_list))
 
+    def test_query_routes(self):
+        """All the route sheets at once."""
+        route_ids = list(Route.objects.values_list('id', flat=True))
+        # the items, and the contacts of the members
+        with self.assertNumQueries(2):
+            route_lists = Order.get_delivery_lists(self.today, route_ids)
+        self.assertIn(self.route_id, route_lists)
+        for route_id in route_ids:
+            self.assertEqual(
+                repr(route_lists.get(route_id, {})),
+                repr(Order.get_delivery_list(self.today, route_id)))
+
     def test_extra_similar_sides(self):
         """Test cumulative quantities for similar side dishes."""
         # Add two separate extra compote order items for 'Tracy'
@@ -471,6 +1317,22 @@ class DeliveryRouteSheetTestCase(SousChefTestMixin, TestCase):
         mile_end_id = Route.objects.get(name='Mile-End').id
         route_list = Order.get_delivery_list(self.today, mile_end_id)
         self.assertTrue('Tracy' in repr(route_list))
+        compotes = [item for item in route_list[client.id].delivery_items
+                    if item.component_group == 'compote']
+        self.assertEqual(len(compotes), 1)
+        self.assertTrue(compotes[0].remark.endswith('no sugar; no sugar'))
+
+    def test_bill(self):
+        """The clients whose order includes a bill."""
+        client = Client.objects.filter(member__lastname='Blondin')[0]
+        order = Order.objects.get(client=client, delivery_date=self.today)
+        order.includes_a_bill = True
+        route_list = Order.get_delivery_list(self.today, self.route_id)
+        self.assertTrue(route_list[client.id].include_a_bill)
+        self.assertFalse(any(
+            delivery_client.include_a_bill
+            for client_id, delivery_client in route_list.items()
+            if client_id != client.id))
 
     def test_sheet(self):
         """Sample route sheet page."""
@@ -624,6 +1486,22 @@ class RoutesInformationViewTestCase(SousChefTestMixin, TestCase):
         self.assertNotIn('routes_dict', response_1)
         self.assertIn('routes_dict', response_2)
 
+    def test_queries_do_not_grow_with_routes(self):
+        url = reverse('delivery:routes')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        routes = RouteFactory.create_batch(5)
+        DeliveryHistoryFactory(
+            route=routes[0], date=tz.datetime.today(), client_id_sequence=[])
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get(url)
+        route_details = {
+            route: (order_count, has_organised)
+            for route, order_count, has_organised, _
+            in response.context['route_details']}
+        self.assertEqual(route_details[routes[0]], (0, 'yes'))
+        self.assertEqual(route_details[routes[1]], (0, 'no'))
+
     def test_redirects_users_who_do_not_have_read_permission(self):
         # Setup
         User.objects.create_user(
@@ -647,6 +1525,237 @@ class RoutesInformationViewTestCase(SousChefTestMixin, TestCase):
         self.assertEqual(response.status_code, 200)
 
 
+@override_settings(ROUTE_VEHICLE_CAPACITIES={
+    'cycling': 3, 'walking': 3, 'driving': 3})
+class ProposeRoutesViewTestCase(SousChefTestMixin, TestCase):
+
+    def setUp(self):
+        self.route1 = RouteFactory(vehicle='cycling')
+        self.route2 = RouteFactory(vehicle='driving')
+        self.clients = ClientFactory.create_batch(
+            5, route=self.route1, status=Client.ACTIVE)
+        self.clients.append(ClientFactory(
+            route=self.route2, status=Client.ACTIVE))
+        for client in self.clients:
+            OrderFactory(client=client, delivery_date=datetime.date.today(),
+                         status=ORDER_STATUS_ORDERED)
+        self.url = reverse('delivery:propose_routes')
+        self.force_login()
+
+    def test_redirects_users_who_do_not_have_edit_permission(self):
+        self.assertRedirectsWithAllMethods(self.url)
+
+    def test_propose_routes(self):
+        proposal = propose_routes(datetime.date.today())
+        self.assertEqual([route for route, clients in proposal],
+                         sorted([self.route1, self.route2],
+                                key=lambda route: route.name))
+        for route, clients in proposal:
+            self.assertLessEqual(len(clients), 3)
+        self.assertEqual(
+            sorted(client.pk for route, clients in proposal
+                   for client in clients),
+            sorted(client.pk for client in self.clients))
+
+    def test_accept_proposal(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        proposal = json.loads(response.context['proposal_json'])
+        response = self.client.post(
+            self.url, {'proposal': response.context['proposal_json'],
+                       'move_clients': '1'})
+        self.assertRedirects(response, reverse('delivery:routes'))
+        for route in (self.route1, self.route2):
+            sequence = proposal[str(route.pk)]
+            self.assertEqual(DeliveryHistory.objects.get(
+                route=route, date=datetime.date.today()
+            ).client_id_sequence, sequence)
+            self.assertEqual(
+                set(route.client_set.values_list('pk', flat=True)),
+                set(sequence))
+
+    def test_accept_proposal_keeping_routes(self):
+        response = self.client.get(self.url)
+        # the clients proposed on another route are listed
+        moves = response.context['moves']
+        self.assertTrue(moves)
+        for client, route, proposed_route in moves:
+            self.assertEqual(client.route_id, route.pk)
+            self.assertNotEqual(route, proposed_route)
+        self.assertContains(response, 'name="move_clients"')
+        proposal = json.loads(response.context['proposal_json'])
+        routes = {client.pk: client.route_id for client in self.clients}
+        response = self.client.post(
+            self.url, {'proposal': response.context['proposal_json']})
+        self.assertRedirects(response, reverse('delivery:routes'))
+        # no client changed route
+        self.assertEqual(
+            dict(Client.objects.filter(pk__in=routes).values_list(
+                'pk', 'route_id')),
+            routes)
+        for route in (self.route1, self.route2):
+            sequence = DeliveryHistory.objects.get(
+                route=route, date=datetime.date.today()
+            ).client_id_sequence
+            self.assertEqual(
+                sorted(sequence),
+                sorted(pk for pk, route_id in routes.items()
+                       if route_id == route.pk))
+            # in the proposed order
+            kept = [pk for pk in proposal[str(route.pk)]
+                    if routes[pk] == route.pk]
+            self.assertEqual([pk for pk in sequence if pk in kept], kept)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_accept_proposal_invalidates_kitchen_count(self):
+        cache.clear()
+        today = datetime.date.today()
+        get_kitchen_count(today, kitchen_count)
+        self.assertTrue(get_kitchen_count(today, kitchen_count)[1])
+        key = kitchen_count_key(today)
+        response = self.client.get(self.url)
+        self.client.post(
+            self.url, {'proposal': response.context['proposal_json'],
+                       'move_clients': '1'})
+        # clients were moved between the routes
+        self.assertNotEqual(
+            set(self.route1.client_set.values_list('pk', flat=True)),
+            set(client.pk for client in self.clients[:5]))
+        # and the key of the report jobs (see jobs.submit)
+        self.assertNotEqual(kitchen_count_key(today), key)
+        self.assertFalse(get_kitchen_count(today, kitchen_count)[1])
+
+    def test_stale_proposal(self):
+        response = self.client.post(self.url, {'proposal': json.dumps({
+            self.route1.pk: [client.pk for client in self.clients[1:]]})})
+        self.assertRedirects(response, self.url)
+        self.assertFalse(DeliveryHistory.objects.exists())
+        response = self.client.post(self.url, {'proposal': '[1'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_over_capacity(self):
+        OrderFactory(client=ClientFactory(
+            route=self.route2, status=Client.ACTIVE),
+            delivery_date=datetime.date.today(), status=ORDER_STATUS_ORDERED)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['proposal'], [])
+
+
+class OptimizeRoutesTestCase(SousChefTestMixin, TestCase):
+
+    def setUp(self):
+        self.today = datetime.date.today()
+        self.route1 = RouteFactory(name='Route 1')
+        self.route2 = RouteFactory(name='Route 2')
+        self.clients = {}
+        for route, count in ((self.route1, 8), (self.route2, 5)):
+            self.clients[route.pk] = ClientFactory.create_batch(
+                count, route=route, status=Client.ACTIVE)
+            for client in self.clients[route.pk]:
+                client.member.address.latitude = 45.5 + random.random() / 10
+                client.member.address.longitude = -73.6 + random.random() / 10
+                client.member.address.save()
+                OrderFactory(client=client, delivery_date=self.today,
+                             status=ORDER_STATUS_ORDERED)
+
+    def test_optimize_routes(self):
+        sequence = [client.pk for client in self.clients[self.route1.pk]]
+        DeliveryHistoryFactory(route=self.route1, date=self.today,
+                               vehicle='walking', client_id_sequence=sequence)
+        optimisations = optimize_routes(self.today, processes=1)
+        self.assertEqual([o.route for o in optimisations],
+                         [self.route1, self.route2])
+        self.assertEqual([o.stops for o in optimisations], [8, 5])
+        for optimisation in optimisations:
+            self.assertLessEqual(optimisation.distance,
+                                 optimisation.distance_before + 1e-6)
+            delivery_history = DeliveryHistory.objects.get(
+                route=optimisation.route, date=self.today)
+            self.assertEqual(
+                sorted(delivery_history.client_id_sequence),
+                sorted(c.pk for c in self.clients[optimisation.route.pk]))
+        # starts from the sequence of the delivery, keeping its vehicle
+        delivery_history = DeliveryHistory.objects.get(
+            route=self.route1, date=self.today)
+        self.assertEqual(delivery_history.vehicle, 'walking')
+        waypoints = [{'id': c.pk, 'latitude': c.member.address.latitude,
+                      'longitude': c.member.address.longitude}
+                     for c in self.clients[self.route1.pk]]
+        self.assertAlmostEqual(
+            optimisations[0].distance_before,
+            tsp.tour_distance(list(range(9)), distances.distance_matrix(
+                [DELIVERY_STARTING_POINT_LAT_LONG[0]] +
+                [float(w['latitude']) for w in waypoints],
+                [DELIVERY_STARTING_POINT_LAT_LONG[1]] +
+                [float(w['longitude']) for w in waypoints],
+                origin=DELIVERY_STARTING_POINT_LAT_LONG)),
+            places=2)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('optimizeroutes', self.today.strftime('%Y-%m-%d'),
+                     processes=1, stdout=out)
+        self.assertIn('Route 1: 8 stops', out.getvalue())
+        self.assertIn('Route 2: 5 stops', out.getvalue())
+        self.assertIn('2 route(s) optimized', out.getvalue())
+        self.assertEqual(
+            DeliveryHistory.objects.filter(date=self.today).count(), 2)
+
+    @override_settings(ROUTE_OPTIMISATION_REQUEST_BUDGET=0.1,
+                       ROUTE_OPTIMISATION_REQUEST_PROCESSES=1)
+    def test_view(self):
+        url = reverse('delivery:optimize_routes')
+        self.assertRedirectsWithAllMethods(url)
+        self.force_login()
+        # the clients of the delivery of route 1, in reverse order
+        sequence = [client.pk for client in self.clients[self.route1.pk]]
+        delivery_history = DeliveryHistoryFactory(
+            route=self.route1, date=self.today, vehicle='walking',
+            client_id_sequence=sequence[::-1])
+        with patch('delivery.views.tsp.optimize_all',
+                   wraps=tsp.optimize_all) as optimize_all:
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['optimisations']), 2)
+        self.assertContains(response, 'Route 2')
+        # bounded by the settings
+        tasks, processes = optimize_all.call_args[0]
+        self.assertEqual([task[2] for task in tasks], [0.1, 0.1])
+        self.assertEqual(processes, 1)
+        # the delivery of route 1 is updated, one of route 2 created
+        self.assertEqual(
+            DeliveryHistory.objects.filter(date=self.today).count(), 2)
+        delivery_history.refresh_from_db()
+        self.assertEqual(delivery_history.vehicle, 'walking')
+        self.assertEqual(sorted(delivery_history.client_id_sequence),
+                         sorted(sequence))
+        optimisation = response.context['optimisations'][0]
+        self.assertEqual(optimisation.route, self.route1)
+        addresses = {client.pk: client.member.address
+                     for client in self.clients[self.route1.pk]}
+        matrix = distances.distance_matrix(
+            [DELIVERY_STARTING_POINT_LAT_LONG[0]] +
+            [float(addresses[pk].latitude)
+             for pk in delivery_history.client_id_sequence],
+            [DELIVERY_STARTING_POINT_LAT_LONG[1]] +
+            [float(addresses[pk].longitude)
+             for pk in delivery_history.client_id_sequence],
+            origin=DELIVERY_STARTING_POINT_LAT_LONG)
+        # the saved sequence has the distance displayed, no more than
+        # the distance of the reversed sequence it started from
+        self.assertAlmostEqual(
+            tsp.tour_distance(list(range(9)), matrix),
+            optimisation.distance, places=2)
+        self.assertLessEqual(optimisation.distance,
+                             optimisation.distance_before + 1e-6)
+        route2_history = DeliveryHistory.objects.get(
+            route=self.route2, date=self.today)
+        self.assertEqual(sorted(route2_history.client_id_sequence),
+                         sorted(c.pk for c in self.clients[self.route2.pk]))
+
+
 class KitchenCountViewTestCase(SousChefTestMixin, TestCase):
     fixtures = ['sample_data']
 
@@ -717,8 +1826,8 @@ class MealLabelsViewTestCase(SousChefTestMixin, TestCase):
         url = reverse('delivery:mealLabels')
         # Run
         response = self.client.get(url)
-        # Check
-        self.assertEqual(response.status_code, 200)
+        # Check : no meal labels were rendered
+        self.assertEqual(response.status_code, 404)
 
 
 class RefreshOrderViewTestCase(SousChefTestMixin, TestCase):
@@ -1225,6 +2334,44 @@ class ExcludeMalconfiguredClientsTestCase(SousChefTestMixin, TestCase):
         self.assertEqual(response2.status_code, 404)
 
 
+class MultiRouteReportTestCase(SimpleTestCase):
+
+    def make_pages(self, sizes):
+        """Render routes of `sizes` stops, and returns the number of pages
+        and their text."""
+        routes_dict = {
+            i: {
+                'route': Route(name='Route {}'.format(i)),
+                'summary_lines': [RouteSummaryLine(
+                    COMPONENT_GROUP_CHOICES_MAIN_DISH, 'Main Dish', 1, 1)],
+                'detail_lines': [DeliveryClient(
+                    'Client', str(j), '1', 'Street', '', '514-555-0000', '',
+                    [DeliveryItem(COMPONENT_GROUP_CHOICES_MAIN_DISH,
+                                  'Main Dish', 1, 'meal_component', '', 'R')],
+                    j, False) for j in range(size)],
+            } for i, size in enumerate(sizes)}
+        f = io.BytesIO()
+        pages = MultiRouteReport.routes_make_pages(routes_dict, f)
+        reader = PyPDF2.PdfFileReader(f)
+        return pages, [reader.getPage(i).extractText()
+                       for i in range(reader.getNumPages())]
+
+    def test_concurrent_reports(self):
+        reports = [[3], [40, 5], [25, 60, 2], [80]]
+        expected = [self.make_pages(sizes) for sizes in reports]
+        # the first route takes three pages, and a blank one: the second
+        # route starts on the front side of a sheet
+        pages = expected[1][1]
+        self.assertIn('CONTINUED ON REVERSE SIDE', pages[0])
+        self.assertIn('SEE NEXT SHEET', pages[1])
+        self.assertEqual(pages[3], '')
+        self.assertIn('Route 1', pages[4])
+        with ThreadPoolExecutor(len(reports)) as executor:
+            for _ in range(3):
+                self.assertEqual(
+                    list(executor.map(self.make_pages, reports)), expected)
+
+
 class RouteSheetReportTestCase(SousChefTestMixin, TestCase):
     # PDF route sheets report generation
     fixtures = ['sample_data']
@@ -1288,4 +2435,4 @@ class RouteSheetReportTestCase(SousChefTestMixin, TestCase):
         response = self.client.get(reverse("delivery:routes"),
                                    {'print': 'yes'})
         self.assertEqual(response.status_code, 200)
-        self.assertTrue('ReportLab' in repr(response.content))
+        self.assertTrue('ReportLab' in repr(response.getvalue()))
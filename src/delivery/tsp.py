@@ -1,4 +1,23 @@
+import collections
 import itertools
+import multiprocessing
+import random
+import time
+
+import numpy
+
+from . import distances
+
+
+# Number of nearest nodes considered for the new edges of a move.
+NEIGHBORS = 10
+
+# Relative cost decrease below which a move is not an improvement,
+# so that rounding errors cannot make the search cycle.
+TOLERANCE = 1e-9
+
+# Longest segment moved by an Or-opt move.
+OR_OPT_SEGMENT = 3
 
 
 class Node:
@@ -33,11 +52,6 @@ def pairwise(iterable):
     return zip(a, b)
 
 
-def reverse_subtour(tour, start, end):
-    """Returns a new list with the subtour reversed"""
-    return tour[:start] + list(reversed(tour[start:end + 1])) + tour[end + 1:]
-
-
 def solve(tour):
     """Solves the Traveling Salesman Problem (TSP) with a heuristic.
 
@@ -49,35 +63,218 @@ def solve(tour):
 
     Returns:
         A tour with a distance less or equal to the distance of the
-        initial tour.
+        initial tour, starting with the same node. The distances are
+        measured on a plane tangent at the first node (see distances).
 
     """
+    if len(tour) < 4:
+        return list(tour)
+    matrix = distances.nodes_distance_matrix(tour)
+    return [tour[i] for i in solve_matrix(matrix)]
+
+
+def solve_matrix(matrix, tour=None, neighbors=NEIGHBORS):
+    """Solves the TSP given by a distance matrix with a heuristic.
 
-    # This function implements a local search heuristic with a 2-opt
-    # neighborhood to solve an Euclidean TSP.
+    This function implements a local search heuristic with a 2-opt
+    neighborhood (see two_opt).
 
-    best_solution = Solution(list(tour), tour_squared_distance(tour))
+    Args:
+        matrix: A symmetric distance matrix, a NumPy array or a list of
+            lists: matrix[a][b] is the distance between the nodes a and b
+            (see distances.distance_matrix).
+        tour: The initial tour, a list of node indexes. Defaults to
+            range(len(matrix)).
+        neighbors: The number of nearest nodes searched for each node.
 
-    improved = True
-    while improved:
-        improved = False
-        best_candidate = Solution(best_solution.tour, best_solution.value)
+    Returns:
+        A tour (list of node indexes) with a distance less or equal to
+        the distance of the initial tour, starting with the same node.
+    """
+    tour = list(range(len(matrix)) if tour is None else tour)
+    if len(tour) < 4:
+        return tour
+    start = tour[0]
+    neighbors = neighbor_lists(matrix, neighbors)
+    if isinstance(matrix, numpy.ndarray):
+        # indexing lists of floats is faster in the search loops
+        matrix = matrix.tolist()
+    two_opt(tour, matrix, neighbors)
+    return rotate(tour, start)
+
+
+def optimize(matrix, tour=None, budget=None, neighbors=NEIGHBORS, seed=0):
+    """Solves the TSP given by a distance matrix with more move types.
+
+    Improves the tour with 2-opt, Or-opt and 3-opt moves until none of
+    them improves it (see local_search). Given a time budget, it then
+    keeps perturbing the best tour found ("double bridge" move) and
+    improving it again, until the budget is spent (iterated local
+    search).
+
+    Args:
+        matrix: A symmetric distance matrix (see solve_matrix).
+        tour: The initial tour, a list of node indexes. Defaults to
+            range(len(matrix)).
+        budget: The wall-clock time allowed, in seconds, or None for
+            one local search only. When the budget is spent, the best
+            tour found so far is returned.
+        neighbors: The number of nearest nodes searched for each node.
+        seed: The seed of the random perturbations.
 
-        for candidate_tour in two_opt_neighbors(best_solution.tour):
-            candidate = Solution(candidate_tour,
-                                 tour_squared_distance(candidate_tour))
+    Returns:
+        A tour (list of node indexes) with a distance less or equal to
+        the distance of the initial tour, starting with the same node.
+    """
+    deadline = None if budget is None else time.monotonic() + budget
+    tour = list(range(len(matrix)) if tour is None else tour)
+    if len(tour) < 4:
+        return tour
+    start = tour[0]
+    neighbors = neighbor_lists(matrix, neighbors)
+    if isinstance(matrix, numpy.ndarray):
+        matrix = matrix.tolist()
+
+    local_search(tour, matrix, neighbors, deadline)
+    best, best_distance = tour, tour_distance(tour, matrix)
+    generator = random.Random(seed)
+    while deadline is not None and len(tour) >= 8 and \
+            time.monotonic() < deadline:
+        tour = double_bridge(best, generator)
+        local_search(tour, matrix, neighbors, deadline)
+        distance = tour_distance(tour, matrix)
+        if distance < best_distance:
+            best, best_distance = tour, distance
+    return rotate(best, start)
+
+
+def optimize_task(task):
+    """Solves one TSP (see optimize), in a worker process of optimize_all.
 
-            # We use the squared distance since the square root
-            # function is monotone increasing, so comparing squared
-            # distance is equivalent to comparing distances.
-            if candidate.value < best_candidate.value:
-                best_candidate = candidate
+    Args:
+        task: A tuple (matrix, tour, budget) of arguments of optimize.
 
-        if best_candidate.value < best_solution.value:
-            improved = True
-            best_solution = best_candidate
+    Returns:
+        A tuple (tour, initial distance, distance, seconds).
+    """
+    start = time.monotonic()
+    matrix, tour, budget = task
+    initial = list(range(len(matrix)) if tour is None else tour)
+    tour = optimize(matrix, initial, budget)
+    return (tour, float(tour_distance(initial, matrix)),
+            float(tour_distance(tour, matrix)), time.monotonic() - start)
 
-    return best_solution.tour
+
+def optimize_all(tasks, processes=1):
+    """Solves several TSPs in `processes` worker processes.
+
+    Args:
+        tasks: A list of tuples (matrix, tour, budget) (see optimize_task).
+        processes: An integer, the number of worker processes.
+
+    Returns:
+        The list of the results of optimize_task, in the order of tasks.
+    """
+    if processes > 1 and len(tasks) > 1:
+        # A forkserver does not inherit the threads and connections of
+        # the server process.
+        context = multiprocessing.get_context('forkserver')
+        with context.Pool(min(processes, len(tasks))) as pool:
+            return pool.map(optimize_task, tasks)
+    return [optimize_task(task) for task in tasks]
+
+
+def expired(deadline):
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def local_search(tour, matrix, neighbors, deadline=None):
+    """Improve a circular tour in place until no 2-opt, Or-opt or 3-opt
+    move improves it, or the deadline (a time.monotonic() value) is
+    passed.
+
+    The cheapest moves are searched first: Or-opt and 3-opt moves are
+    searched only when no 2-opt move is left.
+    """
+    while not expired(deadline):
+        two_opt(tour, matrix, neighbors, deadline)
+        if expired(deadline):
+            break
+        if or_opt(tour, matrix, neighbors, deadline):
+            continue
+        if expired(deadline):
+            break
+        if not three_opt(tour, matrix, neighbors, deadline):
+            break
+
+
+def double_bridge(tour, generator):
+    """Returns the tour cut in four parts A B C D reconnected as A C B D.
+
+    A double bridge cannot be undone by a 2-opt or an Or-opt move.
+    """
+    i, j, k = sorted(generator.sample(range(1, len(tour)), 3))
+    return tour[:i] + tour[j:k] + tour[i:j] + tour[k:]
+
+
+def insertion_cost(tour, node, matrix):
+    """Returns the cheapest position at which to insert a node in a
+    circular tour, and the distance it adds to the tour.
+
+    Args:
+        tour: A list of node indexes, not containing `node`.
+        node: A node index.
+        matrix: A NumPy distance matrix (see solve_matrix).
+
+    Returns:
+        A tuple (position, cost): inserting the node at `position`
+        (i.e. tour.insert(position, node)) lengthens the tour by `cost`.
+    """
+    if not tour:
+        return 0, 0.0
+    before = numpy.asarray(tour)
+    after = numpy.roll(before, -1)
+    costs = (matrix[before, node] + matrix[node, after] -
+             matrix[before, after])
+    i = int(numpy.argmin(costs))
+    return i + 1, float(costs[i])
+
+
+def warm_start(matrix, sequence):
+    """Returns an initial tour made from a previous one.
+
+    Args:
+        matrix: A distance matrix (see solve_matrix).
+        sequence: Node indexes in the order of a previous tour (e.g. of
+            the last delivery), node 0 excepted.
+
+    Returns:
+        A tour starting with node 0, then the nodes of sequence in order,
+        the other nodes being inserted at their cheapest position (see
+        insert).
+    """
+    tour = [0] + list(sequence)
+    return insert(
+        tour, sorted(set(range(1, len(matrix))) - set(tour)), matrix)
+
+
+def insert(tour, nodes, matrix):
+    """Insert nodes in a circular tour in place, one after the other,
+    each one where it lengthens the tour the least (cheapest insertion).
+
+    Args:
+        tour: A list of node indexes.
+        nodes: The node indexes to insert, not in tour.
+        matrix: A distance matrix (see solve_matrix).
+
+    Returns:
+        The tour.
+    """
+    matrix = numpy.asarray(matrix)
+    for node in nodes:
+        position, _ = insertion_cost(tour, node, matrix)
+        tour.insert(position, node)
+    return tour
 
 
 def squared_distance(a, b):
@@ -96,11 +293,211 @@ def tour_squared_distance(tour):
     return distance
 
 
-def two_opt_neighbors(tour):
-    """Generates 2-opt neighbors for a tour.
+def tour_distance(tour, matrix):
+    """Returns the distance of a tour of node indexes."""
+    return sum(matrix[a][b] for a, b in pairwise(tour + tour[:1]))
+
+
+def neighbor_lists(matrix, count):
+    """Returns, for each node, the `count` nearest other nodes."""
+    matrix = numpy.array(matrix, dtype=numpy.float64)
+    numpy.fill_diagonal(matrix, numpy.inf)  # a node is not its neighbor
+    count = min(count, len(matrix) - 1)
+    return numpy.argsort(
+        matrix, axis=1, kind='mergesort')[:, :count].tolist()
+
+
+def rotate(tour, start):
+    """Returns the tour starting with the node `start`."""
+    i = tour.index(start)
+    return tour[i:] + tour[:i]
+
+
+def reverse(tour, position, i, j):
+    """Reverse in place the part of a circular tour from i to j.
+
+    Reversing the rest of the tour instead gives the same tour, in the
+    other direction: the shortest part is reversed.
+
+    Args:
+        tour: A list of node indexes.
+        position: The inverse of tour, updated.
+        i, j: Positions in tour, j may be before i.
+    """
+    n = len(tour)
+    length = (j - i) % n + 1
+    if 2 * length > n:
+        i, j = (j + 1) % n, (i - 1) % n
+        length = n - length
+    for k in range(length // 2):
+        a, b = (i + k) % n, (j - k) % n
+        tour[a], tour[b] = tour[b], tour[a]
+        position[tour[a]] = a
+        position[tour[b]] = b
+
+
+def two_opt(tour, matrix, neighbors, deadline=None):
+    """Improve a circular tour in place with 2-opt moves.
 
     https://en.wikipedia.org/wiki/2-opt
+
+    A move removes two edges of the tour and reconnects it with two new
+    edges; its gain only depends on these four edges. One of the new
+    edges is shorter than a removed edge next to it, so only the moves
+    adding an edge from a node to one of its nearest neighbors are
+    searched. The first improving move found is made, then the search
+    continues from the nodes whose edges changed, until no node is
+    left to search ("don't look bits").
+
+    Args:
+        tour: A list of node indexes, changed in place.
+        matrix: A symmetric distance matrix.
+        neighbors: For each node, a list of its nearest nodes, nearest
+            first (see neighbor_lists).
+        deadline: A time.monotonic() value after which the search
+            stops, or None.
+
+    Returns:
+        An integer : The number of moves made.
+    """
+    n = len(tour)
+    position = [0] * n
+    for i, a in enumerate(tour):
+        position[a] = i
+    queue = collections.deque(tour)
+    queued = [True] * n
+    moves = 0
+
+    while queue and not expired(deadline):
+        a = queue.popleft()
+        queued[a] = False
+        moved = False
+        for direction in (1, -1):
+            i = position[a]
+            b = tour[(i + direction) % n]
+            d_ab = matrix[a][b]
+            for c in neighbors[a]:
+                d_ac = matrix[a][c]
+                if d_ac >= d_ab:
+                    break
+                j = position[c]
+                d = tour[(j + direction) % n]
+                if c == b or d == a:
+                    continue
+                # Replace edges (a, b), (c, d) by (a, c), (b, d).
+                d_cd = matrix[c][d]
+                delta = d_ac + matrix[b][d] - d_ab - d_cd
+                if delta < -TOLERANCE * (d_ab + d_cd):
+                    if direction == 1:
+                        reverse(tour, position, i + 1, j)
+                    else:
+                        reverse(tour, position, j, i - 1)
+                    moves += 1
+                    moved = True
+                    break
+            if moved:
+                break
+        if moved:
+            # search again from the nodes having new edges, a first
+            for node in (b, c, d):
+                if not queued[node]:
+                    queued[node] = True
+                    queue.append(node)
+            queued[a] = True
+            queue.appendleft(a)
+    return moves
+
+
+def or_opt(tour, matrix, neighbors, deadline=None):
+    """Improve a circular tour in place with an Or-opt move.
+
+    An Or-opt move relocates a segment of up to OR_OPT_SEGMENT nodes,
+    possibly reversed, between two other consecutive nodes. Only the
+    moves putting the segment next to a neighbor of one of its ends are
+    searched. The first improving move found is made.
+
+    Returns:
+        True if the tour was improved.
+    """
+    n = len(tour)
+    position = [0] * n
+    for i, a in enumerate(tour):
+        position[a] = i
+    for length in range(1, min(OR_OPT_SEGMENT, n - 3) + 1):
+        for i in range(n):
+            if expired(deadline):
+                return False
+            first, last = tour[i], tour[(i + length - 1) % n]
+            before, after = tour[i - 1], tour[(i + length) % n]
+            # gain of removing the segment and closing the gap
+            removal = (matrix[before][first] + matrix[last][after] -
+                       matrix[before][after])
+            inside = {tour[(i + k) % n] for k in range(length)}
+            for end, other in ((first, last), (last, first)):
+                for c in neighbors[end]:
+                    if matrix[end][c] >= removal:
+                        break
+                    if c in inside:
+                        continue
+                    j = position[c]
+                    # put the segment between c and its successor, with
+                    # end next to c, or between its predecessor and c
+                    for e, end_after_c in ((tour[(j + 1) % n], True),
+                                           (tour[j - 1], False)):
+                        if e in inside:
+                            continue
+                        delta = (matrix[c][end] + matrix[other][e] -
+                                 matrix[c][e] - removal)
+                        if delta < -TOLERANCE * removal:
+                            segment = [tour[(i + k) % n]
+                                       for k in range(length)]
+                            if (end == first) != end_after_c:
+                                segment.reverse()
+                            rest = [tour[(i + length + k) % n]
+                                    for k in range(n - length)]
+                            x = rest.index(c if end_after_c else e)
+                            tour[:] = rest[:x + 1] + segment + rest[x + 1:]
+                            return True
+    return False
+
+
+def three_opt(tour, matrix, neighbors, deadline=None):
+    """Improve a circular tour in place with a 3-opt move.
+
+    The 3-opt move searched exchanges two consecutive segments without
+    reversing them: a [b .. p] [c .. k] f becomes a [c .. k] [b .. p] f.
+    Only the moves adding an edge from a node to one of its neighbors
+    are searched. The first improving move found is made.
+
+    Returns:
+        True if the tour was improved.
     """
-    for start in range(1, len(tour) - 1):
-        for end in range(start + 1, len(tour)):
-            yield reverse_subtour(tour, start, end)
+    n = len(tour)
+    position = [0] * n
+    for i, a in enumerate(tour):
+        position[a] = i
+    for i in range(n):
+        if expired(deadline):
+            return False
+        a, b = tour[i], tour[(i + 1) % n]
+        d_ab = matrix[a][b]
+        for c in neighbors[a]:
+            d_ac = matrix[a][c]
+            if d_ac >= d_ab:
+                break
+            offset = (position[c] - i) % n
+            if offset < 2:
+                continue
+            p = tour[(i + offset - 1) % n]
+            # gain of the edges (a, c) and (p, f) before choosing k
+            partial = d_ac - d_ab - matrix[p][c]
+            for m in range(offset, n):
+                k, f = tour[(i + m) % n], tour[(i + m + 1) % n]
+                delta = (partial + matrix[k][b] + matrix[p][f] -
+                         matrix[k][f])
+                if delta < -TOLERANCE * d_ab:
+                    rotated = [tour[(i + x) % n] for x in range(n)]
+                    tour[:] = (rotated[:1] + rotated[offset:m + 1] +
+                               rotated[1:offset] + rotated[m + 1:])
+                    return True
+    return False
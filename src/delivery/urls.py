@@ -4,7 +4,9 @@ from django.utils.translation import ugettext_lazy as _
 from delivery.views import (Orderlist, MealInformation, RoutesInformation,
                             KitchenCount, MealLabels, DeliveryRouteSheet,
                             RefreshOrderView, CreateDeliveryOfToday,
-                            EditDeliveryOfToday)
+                            EditDeliveryOfToday, OptimizeRoutes,
+                            ProposeRoutes, ReportJobStatus,
+                            ReportJobDownload)
 
 app_name = "delivery"
 
@@ -13,6 +15,10 @@ urlpatterns = [
     url(_(r'^meal/$'), MealInformation.as_view(), name='meal'),
     url(_(r'^meal/(?P<id>\d+)/$'), MealInformation.as_view(), name='meal_id'),
     url(_(r'^routes/$'), RoutesInformation.as_view(), name='routes'),
+    url(_(r'^routes/propose/$'),
+        ProposeRoutes.as_view(), name='propose_routes'),
+    url(_(r'^routes/optimize/$'),
+        OptimizeRoutes.as_view(), name='optimize_routes'),
     url(_(r'^route/(?P<pk>\d+)/$'),
         EditDeliveryOfToday.as_view(), name='edit_delivery_of_today'),
     url(_(r'^route/(?P<pk>\d+)/create/$'),
@@ -22,7 +28,16 @@ urlpatterns = [
         KitchenCount.as_view(), name='kitchen_count_date'),
     url(_(r'^viewDownloadKitchenCount/$'),
         KitchenCount.as_view(), name='downloadKitchenCount'),
+    url(_(r'^viewDownloadKitchenCount/(?P<year>\d{4})/(?P<month>\d{2})/'
+          r'(?P<day>\d+)/$'),
+        KitchenCount.as_view(), name='downloadKitchenCount_date'),
     url(_(r'^viewMealLabels/$'), MealLabels.as_view(), name='mealLabels'),
+    url(_(r'^viewMealLabels/(?P<year>\d{4})/(?P<month>\d{2})/(?P<day>\d+)/$'),
+        MealLabels.as_view(), name='mealLabels_date'),
+    url(_(r'^report_job/(?P<pk>\d+)/$'),
+        ReportJobStatus.as_view(), name='report_job'),
+    url(_(r'^report_job/(?P<pk>\d+)/download/$'),
+        ReportJobDownload.as_view(), name='report_job_download'),
     url(_(r'^route_sheet/(?P<pk>\d+)/$'),
         DeliveryRouteSheet.as_view(), name='route_sheet'),
     url(_(r'^refresh_orders/$'),
@@ -1,6 +1,8 @@
 import collections
 import datetime
 from datetime import date
+import hashlib
+import io
 import json
 import os
 import textwrap
@@ -21,22 +23,22 @@ from django.views import generic
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.cache import never_cache
 from django.http import HttpResponseRedirect, HttpResponse, Http404
-from django.http import JsonResponse
+from django.http import (FileResponse, HttpResponseBadRequest,
+                         HttpResponseNotModified, JsonResponse)
 from django.urls import reverse_lazy, reverse
+from django.utils.http import parse_etags, quote_etag
+from django.utils.text import slugify
 from django.contrib.admin.models import LogEntry, ADDITION
+from django.db import transaction
 from django.db.models.functions import Lower
 from django_filters.views import FilterView
 
-import labels  # package pylabels
-
-from reportlab.graphics import shapes as rl_shapes
 from reportlab.lib import (
     colors as rl_colors, enums as rl_enums)
 from reportlab.lib.styles import (
     getSampleStyleSheet as rl_getSampleStyleSheet,
     ParagraphStyle as RLParagraphStyle)
 from reportlab.lib.units import inch as rl_inch
-from reportlab.pdfbase import pdfmetrics as rl_pdfmetrics
 from reportlab.platypus import (
     PageBreak as RLPageBreak,
     Paragraph as RLParagraph,
@@ -53,16 +55,19 @@ from meal.models import (
     Menu, Menu_component,
     Component_ingredient)
 from member.models import Client, Route, ROUTE_VEHICLES, DeliveryHistory
+from order.cache import (
+    get_kitchen_count, invalidate_kitchen_count, kitchen_count_stats)
 from order.models import (
     Order, component_group_sorting, SIZE_CHOICES_REGULAR, SIZE_CHOICES_LARGE)
-from .models import Delivery
+from .cache import get_distance_matrix, get_provider
+from .models import Delivery, ReportJob
 from .filters import KitchenCountOrderFilter
 from .forms import DishIngredientsForm
-from . import tsp
+from . import jobs, label_sheets, tsp, vrp
+from .label_sheets import MealLabel, meal_label_fields
 
-MEAL_LABELS_FILE = os.path.join(settings.BASE_DIR, "meal_labels.pdf")
-KITCHEN_COUNT_FILE = os.path.join(settings.BASE_DIR, "kitchen_count.pdf")
-ROUTE_SHEETS_FILE = os.path.join(settings.BASE_DIR, "route_sheets.pdf")
+# Size of the chunks in which PDF reports are hashed and streamed.
+PDF_CHUNK_SIZE = 64 * 1024
 LOGO_IMAGE = os.path.join(settings.BASE_DIR,
                           "160widthSR-Logo-Screen-PurpleGreen-HI-RGB1.jpg")
 DELIVERY_STARTING_POINT_LAT_LONG = (45.516564, -73.575145)  # Santropol Roulant
@@ -279,7 +284,7 @@ class RoutesInformation(
     If the request includes argument "print=yes", the view obtains
     for each route the detailed orders to be delivered, sorts them in the
     chosen sequence and combines all the routes in a PDF report that
-    is stored in the BASE_DIR and then downloaded by the browser.
+    is rendered in memory and then downloaded by the browser.
     """
     permission_required = 'sous_chef.read'
 
@@ -288,28 +293,34 @@ class RoutesInformation(
         return self.request.GET.get('print', False)
 
     def get(self, request, *args, **kwargs):
+        today = timezone.datetime.today()
         routes = Route.objects.all()
+        # The same number of queries whatever the number of routes.
+        clients_by_route = collections.defaultdict(list)
+        for route_id, client_id in Order.objects.get_shippable_orders(
+                today, exclude_non_geolocalized=True).values_list(
+                    'client__route_id', 'client__pk'):
+            clients_by_route[route_id].append(client_id)
+        delivery_histories = {
+            delivery_history.route_id: delivery_history
+            for delivery_history in DeliveryHistory.objects.filter(
+                date=today).select_related('route')}
         route_details = []
         all_configured = True
         for route in routes:
-            clients = Order.objects.get_shippable_orders_by_route(
-                route.id, exclude_non_geolocalized=True).values_list(
-                    'client__pk', flat=True)
+            clients = clients_by_route[route.id]
             order_count = len(clients)
-            try:
-                delivery_history = DeliveryHistory.objects.get(
-                    route=route,
-                    date=timezone.datetime.today()
-                )
-                set1 = set(delivery_history.client_id_sequence)
-                set2 = set(clients)
-                has_organised = 'yes' if set1 == set2 else 'invalid'
-            except DeliveryHistory.DoesNotExist:
-                delivery_history = None
+            delivery_history = delivery_histories.get(route.id)
+            if delivery_history is None:
                 has_organised = 'no'
-            except TypeError:
-                # `client_id_sequence` is not iterable.
-                has_organised = 'invalid'
+            else:
+                try:
+                    set1 = set(delivery_history.client_id_sequence)
+                    set2 = set(clients)
+                    has_organised = 'yes' if set1 == set2 else 'invalid'
+                except TypeError:
+                    # `client_id_sequence` is not iterable.
+                    has_organised = 'invalid'
 
             route_details.append(
                 (route, order_count, has_organised, delivery_history)
@@ -326,14 +337,11 @@ class RoutesInformation(
             # download route sheets report as PDF
             if not all_configured:
                 raise Http404
-            today = timezone.datetime.today()
             routes_dict = {}
-            for delivery_history in DeliveryHistory.objects.filter(
-                    date=today
-            ):
-                route_list = Order.get_delivery_list(
-                    today, delivery_history.route_id
-                )
+            route_lists = Order.get_delivery_lists(
+                today, list(delivery_histories))
+            for delivery_history in delivery_histories.values():
+                route_list = route_lists.get(delivery_history.route_id, {})
                 route_list = sort_sequence_ids(
                     route_list, delivery_history.client_id_sequence
                 )
@@ -344,15 +352,11 @@ class RoutesInformation(
                     'detail_lines': detail_lines
                 }
             # generate PDF report
-            MultiRouteReport.routes_make_pages(routes_dict)
-            try:
-                f = open(ROUTE_SHEETS_FILE, "rb")
-            except:
-                raise Http404("File " + ROUTE_SHEETS_FILE + " does not exist")
-            response = HttpResponse(content_type='application/pdf')
-            response['Content-Disposition'] = \
-                'attachment; filename="routesheets{}.pdf"'. \
-                format(datetime.date.today().strftime("%Y%m%d"))
+            f = io.BytesIO()
+            MultiRouteReport.routes_make_pages(routes_dict, f)
+            response = pdf_response(
+                request, f, 'routesheets{}.pdf'.format(
+                    datetime.date.today().strftime("%Y%m%d")))
             # add serializable data in response header to be used in unit tests
             routes_dict_fortest = {}
             for key, item in routes_dict.items():
@@ -362,12 +366,44 @@ class RoutesInformation(
                                      for client in item['detail_lines']],
                 }
             response['routes_dict'] = json.dumps(routes_dict_fortest)
-            #
-            response.write(f.read())
-            f.close()
             return response
 
 
+def pdf_response(request, f, filename):
+    """Returns a response streaming a PDF file as an attachment.
+
+    The response has the length and an ETag of the file content. If the
+    request has a matching If-None-Match header, it is a 304 Not Modified
+    response instead.
+
+    Args:
+        request : The HttpRequest.
+        f : A binary file object, closed with the response.
+        filename : A string, the name proposed to save the file.
+
+    Returns:
+        A FileResponse or an HttpResponseNotModified object.
+    """
+    f.seek(0)
+    digest = hashlib.md5()
+    for chunk in iter(lambda: f.read(PDF_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    length = f.tell()
+    etag = quote_etag(digest.hexdigest())
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        f.close()
+        response = HttpResponseNotModified()
+    else:
+        f.seek(0)
+        response = FileResponse(f, content_type='application/pdf')
+        response.block_size = PDF_CHUNK_SIZE
+        response['Content-Length'] = length
+        response['Content-Disposition'] = \
+            'attachment; filename="{}"'.format(filename)
+    response['ETag'] = etag
+    return response
+
+
 class CreateDeliveryOfToday(
         LoginRequiredMixin, PermissionRequiredMixin, generic.View):
     permission_required = 'sous_chef.edit'
@@ -436,6 +472,275 @@ class EditDeliveryOfToday(
         return response
 
 
+def clients_distance_matrix(clients, group=None, vehicle=None):
+    """
+    Returns the distance matrix of the starting point, node 0, and of the
+    addresses of geolocalized clients (see cache.get_distance_matrix).
+    """
+    return get_distance_matrix(
+        [(client.pk, client.member.address.latitude,
+          client.member.address.longitude) for client in clients],
+        DELIVERY_STARTING_POINT_LAT_LONG, group, vehicle)
+
+
+def propose_routes(delivery_date):
+    """
+    Partition the shippable orders of a date between the vehicles of the
+    routes having orders, within the capacity of each vehicle (see
+    settings.ROUTE_VEHICLE_CAPACITIES), and sequence each route.
+
+    Returns a list of (route, clients) tuples, the clients in delivery
+    order. Raises ValueError if the vehicles cannot carry all the orders.
+    """
+    orders = Order.objects.get_shippable_orders(
+        delivery_date, exclude_non_geolocalized=True
+    ).select_related('client__member__address').order_by('client_id')
+    clients = list(collections.OrderedDict(
+        (order.client_id, order.client) for order in orders).values())
+    routes = list(Route.objects.filter(
+        pk__in={client.route_id for client in clients}).order_by('name'))
+    if not routes:
+        return []
+    matrix = clients_distance_matrix(clients, 'routes')
+    tours = vrp.solve(matrix, [
+        settings.ROUTE_VEHICLE_CAPACITIES[route.vehicle] for route in routes])
+    return [(route, [clients[i - 1] for i in tour[1:]])
+            for route, tour in zip(routes, tours)]
+
+
+def keep_routes(proposal, routes):
+    """
+    Returns the sequences of the routes of a proposal (see
+    propose_routes) keeping every client on its route: the clients of a
+    route are visited in the order proposed, the clients proposed on
+    another route being inserted at their cheapest position (see
+    tsp.warm_start).
+
+    Args:
+        proposal : A dictionary of the client ids of each route id, in
+            the proposed order.
+        routes : A dictionary of the routes by id.
+
+    Returns:
+        A dictionary of the client id sequence of each route having
+        clients.
+    """
+    clients_by_route = collections.defaultdict(list)
+    for client in Client.objects.filter(
+            pk__in=[pk for pks in proposal.values() for pk in pks]
+    ).select_related('member__address').order_by('pk'):
+        clients_by_route[client.route_id].append(client)
+    sequences = {}
+    for route_pk, route in routes.items():
+        clients = clients_by_route.get(route_pk)
+        if not clients:
+            continue
+        matrix = clients_distance_matrix(
+            clients, 'route:{}'.format(route_pk), route.vehicle)
+        tour = tsp.warm_start(matrix, sequence_indexes(
+            [client.pk for client in clients], proposal[route_pk]))
+        sequences[route_pk] = [clients[i - 1].pk for i in tour[1:]]
+    return sequences
+
+
+class ProposeRoutes(
+        LoginRequiredMixin, PermissionRequiredMixin, generic.View):
+    """
+    Propose today's routes, rebalanced between the vehicles (see
+    propose_routes), and list the clients proposed on another route.
+
+    Accepting the proposal saves the sequence of each route as today's
+    delivery. The clients stay on their route (see keep_routes) unless
+    'move_clients' is checked: they are then moved to their proposed
+    route, for every later delivery too.
+    """
+    permission_required = 'sous_chef.edit'
+
+    def get(self, request, *args, **kwargs):
+        try:
+            proposal = propose_routes(timezone.datetime.today())
+        except ValueError:
+            proposal = []
+            messages.add_message(
+                request, messages.ERROR,
+                _("The vehicles cannot carry all today's orders."))
+        routes = {route.pk: route for route, clients in proposal}
+        return render(request, 'propose_routes.html', {
+            'proposal': [
+                (route, clients,
+                 settings.ROUTE_VEHICLE_CAPACITIES[route.vehicle])
+                for route, clients in proposal],
+            'proposal_json': json.dumps({
+                route.pk: [client.pk for client in clients]
+                for route, clients in proposal}),
+            # (client, current route, proposed route)
+            'moves': [
+                (client, routes.get(client.route_id), route)
+                for route, clients in proposal for client in clients
+                if client.route_id != route.pk],
+        })
+
+    def post(self, request, *args, **kwargs):
+        today = timezone.datetime.today()
+        try:
+            proposal = {
+                int(route_pk): [int(pk) for pk in client_pks]
+                for route_pk, client_pks in
+                json.loads(request.POST.get('proposal', '')).items()}
+        except (AttributeError, TypeError, ValueError):
+            return HttpResponseBadRequest("Invalid proposal.")
+        move_clients = bool(request.POST.get('move_clients'))
+        routes = Route.objects.in_bulk(proposal.keys())
+        client_pks = [pk for pks in proposal.values() for pk in pks]
+        shippable = set(Order.objects.get_shippable_orders(
+            today, exclude_non_geolocalized=True
+        ).values_list('client_id', flat=True))
+        if len(routes) != len(proposal) or \
+                len(client_pks) != len(set(client_pks)) or \
+                set(client_pks) != shippable:
+            # The orders have changed since the proposal.
+            messages.add_message(
+                request, messages.ERROR,
+                _("Today's orders have changed, please review the new "
+                  "proposal."))
+            return HttpResponseRedirect(reverse('delivery:propose_routes'))
+        if not move_clients:
+            proposal = keep_routes(proposal, routes)
+        with transaction.atomic():
+            moved = []
+            for route_pk, sequence in proposal.items():
+                route = routes[route_pk]
+                if move_clients:
+                    clients = Client.objects.filter(
+                        pk__in=sequence).exclude(route=route)
+                    moved.extend(clients.values_list('pk', flat=True))
+                    clients.update(route=route)
+                delivery_history, created = \
+                    DeliveryHistory.objects.get_or_create(
+                        route=route, date=today,
+                        defaults={'vehicle': route.vehicle})
+                delivery_history.client_id_sequence = sequence
+                delivery_history.save(update_fields=['client_id_sequence'])
+            # update() sends no post_save: invalidate the kitchen
+            # counts showing the routes of the clients, as saving
+            # them would
+            for delivery_date in \
+                    Order.objects.get_upcoming_delivery_dates(moved):
+                invalidate_kitchen_count(delivery_date)
+        if move_clients:
+            messages.add_message(
+                request, messages.SUCCESS,
+                _("The clients have been moved to their proposed route "
+                  "and the routes have been organised."))
+        else:
+            messages.add_message(
+                request, messages.SUCCESS,
+                _("The routes have been organised in the proposed order, "
+                  "the clients staying on their route."))
+        return HttpResponseRedirect(reverse('delivery:routes'))
+
+
+RouteOptimisation = collections.namedtuple(
+    'RouteOptimisation',
+    ['route', 'stops', 'distance_before', 'distance', 'seconds'])
+
+
+def optimize_routes(delivery_date, processes=None, budget=None):
+    """
+    Optimize the sequence of every route with shippable orders on a date,
+    in parallel, and save them as the deliveries of the date.
+
+    Each route starts from the sequence of its delivery on the date, or
+    else of its last delivery (see calculateRoutePointsEuclidean).
+
+    Args:
+        delivery_date : A date.
+        processes : The number of worker processes, defaults to
+            settings.ROUTE_OPTIMISATION_PROCESSES or one per CPU.
+        budget : The time allowed to improve each route, in seconds (see
+            tsp.optimize).
+
+    Returns:
+        A list of RouteOptimisation tuples, ordered by route name, the
+        distances in the unit of the travel cost provider (see
+        cache.get_provider).
+    """
+    # This needs to be placed on the top when refactoring Route module.
+    # It causes circular dependancy in current code structure.
+    from member.views import get_last_client_id_sequence  # noqa
+    if processes is None:
+        processes = (settings.ROUTE_OPTIMISATION_PROCESSES or
+                     os.cpu_count() or 1)
+    orders = Order.objects.get_shippable_orders(
+        delivery_date, exclude_non_geolocalized=True
+    ).filter(client__route__isnull=False).select_related(
+        'client__member__address').order_by('client_id')
+    clients_by_route = collections.defaultdict(collections.OrderedDict)
+    for order in orders:
+        clients_by_route[order.client.route_id][order.client_id] = \
+            order.client
+    routes = sorted(Route.objects.in_bulk(clients_by_route).values(),
+                    key=lambda route: route.name)
+    delivery_histories = {
+        delivery_history.route_id: delivery_history
+        for delivery_history in DeliveryHistory.objects.filter(
+            date=delivery_date, route__in=routes)}
+    tasks = []
+    for route in routes:
+        clients = list(clients_by_route[route.pk].values())
+        matrix = clients_distance_matrix(
+            clients, 'route:{}'.format(route.pk), route.vehicle)
+        if route.pk in delivery_histories:
+            sequence = delivery_histories[route.pk].client_id_sequence
+        else:
+            sequence = get_last_client_id_sequence(route)
+        tour = tsp.warm_start(matrix, sequence_indexes(
+            [client.pk for client in clients], sequence or []))
+        tasks.append((matrix, tour, budget))
+    results = tsp.optimize_all(tasks, processes)
+
+    optimisations = []
+    with transaction.atomic():
+        for route, (tour, before, after, seconds) in zip(routes, results):
+            clients = list(clients_by_route[route.pk].values())
+            delivery_history = delivery_histories.get(route.pk)
+            if delivery_history is None:
+                delivery_history = DeliveryHistory(
+                    route=route, date=delivery_date, vehicle=route.vehicle)
+            delivery_history.client_id_sequence = [
+                clients[i - 1].pk for i in tour[1:]]
+            delivery_history.save()
+            optimisations.append(RouteOptimisation(
+                route, len(clients), before, after, seconds))
+    return optimisations
+
+
+class OptimizeRoutes(
+        LoginRequiredMixin, PermissionRequiredMixin, generic.View):
+    """
+    Optimize the sequences of all today's routes at once (see
+    optimize_routes), and display the distances before and after.
+
+    The request is bounded by settings.ROUTE_OPTIMISATION_REQUEST_BUDGET
+    seconds per route, shared by at most
+    settings.ROUTE_OPTIMISATION_REQUEST_PROCESSES worker processes.
+    """
+    permission_required = 'sous_chef.edit'
+
+    def post(self, request, *args, **kwargs):
+        processes = min(settings.ROUTE_OPTIMISATION_REQUEST_PROCESSES,
+                        os.cpu_count() or 1)
+        optimisations = optimize_routes(
+            timezone.datetime.today(), processes,
+            settings.ROUTE_OPTIMISATION_REQUEST_BUDGET)
+        return render(request, 'optimize_routes.html', {
+            'optimisations': optimisations,
+            'distance_before': sum(o.distance_before for o in optimisations),
+            'distance': sum(o.distance for o in optimisations),
+            'unit': get_provider().unit,
+        })
+
+
 # Route sheet report classes and functions.
 
 def defineStyles(my_styles):
@@ -498,18 +803,12 @@ def defineStyles(my_styles):
 class MultiRouteReport(object):
     """Namespace for Route sheet report data structures and logic.
 
-    This class is never instantiated.
+    This class is never instantiated. The state of a report being built
+    is kept by its document (see RLMultiRouteDocTemplate), so that
+    reports can be built concurrently, e.g. by the threads of a worker.
 
     Uses ReportLab see http://www.reportlab.com/documentation/faq/
     """
-    # (class attribute) last page number on which a ReportLab Table has split
-    table_split = None
-
-    # (class attribute) report document instance
-    document = None
-
-    # (class attribute) page number on which route starts
-    route_start_page = None
 
     class RLMultiRouteTable(RLTable):
         """Custom table for route sheets that is monitored for table splits.
@@ -521,10 +820,13 @@ class MultiRouteReport(object):
               first call has the table with rows that fit on current page,
               second call has the table with the rest of the rows.
             """
-            MultiRouteReport.table_split = MultiRouteReport.document.page
+            # ReportLab sets the canvas of the table while splitting it,
+            # and the document being built on the canvas.
+            document = self.canv._doctemplate
+            document.table_split = document.page
             # @lamontfr 20170522 : Please do not remove, used for DEBUGGING
             # print("onSplit **********************",
-            #       "page=", MultiRouteReport.document.page,
+            #       "page=", document.page,
             #       "FIRST CLIENT _cellvalues[1][0][0].text=",
             #       repr(table._cellvalues[1][0][0].text),
             #       "LAST CLIENT _cellvalues[-1][0][0].text=",
@@ -557,6 +859,10 @@ class MultiRouteReport(object):
                 raise KeyError(self.__class__.__name__ +
                                " missing kwarg : footerFunc")
             super().__init__(*args, **kwargs)
+            # last page number on which a ReportLab Table has split
+            self.table_split = 0
+            # page number on which route starts
+            self.route_start_page = 1
 
         def afterPage(self, *args, **kwargs):
             """Override method for footer and blanks based on table splits.
@@ -567,10 +873,9 @@ class MultiRouteReport(object):
             page after it if necessary to ensure that two sided printing will
             show the next table on the front side of the next sheet.
             """
-            if MultiRouteReport.table_split == self.page:
+            if self.table_split == self.page:
                 # table has split, therefore route continues on next page
-                if (self.page -
-                        MultiRouteReport.route_start_page + 1) % 2 != 0:
+                if (self.page - self.route_start_page + 1) % 2 != 0:
                     # split occured at bottom of front side of sheet (odd page)
                     self.footerFunc(
                         self,
@@ -582,15 +887,14 @@ class MultiRouteReport(object):
                         '** VOIR FEUILLE SUIVANTE / SEE NEXT SHEET **')
             else:
                 # no table split means route finishes on this page
-                if (self.page -
-                        MultiRouteReport.route_start_page + 1) % 2 != 0:
+                if (self.page - self.route_start_page + 1) % 2 != 0:
                     # route finishes on odd page, add a blank page
                     self.canv.showPage()
                 # the next route, if any, will start on next document page
-                MultiRouteReport.route_start_page = self.page + 1
+                self.route_start_page = self.page + 1
 
     # static method
-    def routes_make_pages(routes_dict):
+    def routes_make_pages(routes_dict, route_sheets_file):
         """Generate the route sheets pages as a PDF file.
 
         Ensures that a new route starts on the front side of a sheet,
@@ -607,6 +911,7 @@ class MultiRouteReport(object):
                 'detail_lines' : A list of DeliveryClient objects
                                  (see order/models.py),
                                  sorted according to delivery history sequence.
+            route_sheets_file : A file name or a binary file object.
 
         Returns:
             An integer : The number of pages generated.
@@ -647,8 +952,7 @@ class MultiRouteReport(object):
                 text='(This document contains CONFIDENTIAL information.)')
             canvas.drawRightString(
                 x=PAGE_WIDTH - 0.75 * rl_inch, y=PAGE_HEIGHT + 0.30 * rl_inch,
-                text='Page {:d}'.format(
-                    doc.page - MultiRouteReport.route_start_page + 1))
+                text='Page {:d}'.format(doc.page - doc.route_start_page + 1))
             canvas.drawInlineImage(
                 LOGO_IMAGE,
                 0.5 * rl_inch, PAGE_HEIGHT - 0.2 * rl_inch,
@@ -670,6 +974,110 @@ class MultiRouteReport(object):
                 text=text)
             doc.canv.restoreState()
 
+        def route_story(route):
+            """Make the flowables of a route: the summary of its items,
+            its name and the details of its stops.
+
+            Args:
+                route : A value of routes_dict.
+
+            Returns:
+                A list of flowables.
+            """
+            story = []
+            # begin Summary section
+            rows = []
+            rows.append(
+                [RLParagraph('PLAT / DISH', styles['NormalLeftBold']),
+                 RLParagraph('Qté / Qty', styles['NormalCenterBold'])])
+            for sl in route['summary_lines']:
+                rows.append([RLParagraph(sl.component_group_trans,
+                                         styles['NormalLeft']),
+                             RLParagraph(str(sl.rqty + sl.lqty),
+                                         styles['NormalCenter'])])
+            tab = MultiRouteReport.RLMultiRouteTable(
+                rows,
+                colWidths=(100, 60),
+                style=[('VALIGN', (0, 0), (-1, -1), 'TOP'),
+                       ('GRID', (0, 0), (-1, -1), 1, rl_colors.black),
+                       ('ALIGN', (0, 0), (-1, -1), 'RIGHT')],
+                hAlign='LEFT')
+            story.append(tab)
+            # end Summary section
+
+            # Route name
+            story.append(RLSpacer(1, 0.25 * rl_inch))
+            story.append(RLParagraph(route['route'].name,
+                                     styles['HugeBoldCenter']))
+            story.append(RLSpacer(1, 0.25 * rl_inch))
+            story.append(RLParagraph('- DÉBUT DE LA ROUTE / START ROUTE -',
+                                     styles['LargeLeft']))
+            story.append(RLSpacer(1, 0.125 * rl_inch))
+
+            # begin Detail section
+            rows = []
+            line = 0
+            tab_style = RLTableStyle(
+                [('VALIGN', (0, 0), (-1, -1), 'TOP')])
+            rows.append([RLParagraph('Client', styles['NormalLeft']),
+                         RLParagraph('Note', styles['NormalLeft']),
+                         RLParagraph('Items', styles['NormalLeft']),
+                         RLParagraph('', styles['NormalLeft'])])
+            tab_style.add('LINEABOVE',
+                          (0, 0), (-1, 0), 1, rl_colors.black)
+            line += 1
+            for c in route['detail_lines']:
+                tab_style.add('LINEABOVE',
+                              (0, line), (-1, line), 1, rl_colors.black)
+                items = c.delivery_items
+                rows.append([
+                    # client
+                    [RLParagraph(c.firstname + ' ' + c.lastname,
+                                 styles['VeryLargeBoldLeft']),
+                     RLParagraph(c.street,
+                                 styles['LargeLeft']),
+                     RLParagraph(
+                         'Apt ' + c.apartment,
+                         styles['LargeLeft']) if c.apartment else [],
+                     RLParagraph(c.phone,
+                                 styles['LargeLeft'])],
+                    # note
+                    RLParagraph(c.delivery_note,
+                                styles['LargeLeft']),
+                    # items
+                    ([RLParagraph(i.component_group_trans,
+                                  styles['LargeLeft'])
+                      for i in c.delivery_items] +
+                     [RLParagraph("Facture / Bill",
+                                  styles['LargeLeft'])
+                      if c.include_a_bill else []]),
+                    # quantity
+                    [RLParagraph(str(i.total_quantity),
+                                 styles['LargeRight'])
+                     for i in c.delivery_items]])
+                line += 1
+            # END for
+            # add row for number of clients
+            rows.append([
+                [RLParagraph("- FIN DE LA ROUTE -", styles['LargeLeft']),
+                 RLParagraph("- END OF ROUTE- ", styles['LargeLeft'])],
+                [RLParagraph("Nombre d'arrêts :", styles['LargeRight']),
+                 RLParagraph("Number of Stops :", styles['LargeRight'])],
+                RLParagraph(str(line - 1), styles['LargeLeft']),
+                RLParagraph("", styles['LargeLeft'])])
+            #
+            tab_style.add('LINEBELOW',
+                          (0, line - 1), (-1, line - 1), 1,
+                          rl_colors.black)
+            tab = MultiRouteReport.RLMultiRouteTable(
+                          rows,
+                          colWidths=(140, 255, 100, 20),
+                          repeatRows=1)
+            tab.setStyle(tab_style)
+            story.append(tab)
+            # end Detail section
+            return story
+
         def go():
             """Generate the pages.
 
@@ -677,119 +1085,20 @@ class MultiRouteReport(object):
                 An integer : The number of pages generated.
             """
             doc = MultiRouteReport.RLMultiRouteDocTemplate(
-                ROUTE_SHEETS_FILE,
+                route_sheets_file,
                 leftMargin=0.5 * rl_inch,
                 rightMargin=0.5 * rl_inch,
                 bottomMargin=0.5 * rl_inch,
                 footerFunc=drawFooter)
-            # initialize
-            MultiRouteReport.table_split = 0
-            MultiRouteReport.document = doc
-            MultiRouteReport.route_start_page = 1
             story = []
-            first_route = True
-
-            # TODO Loop over routes
             for route in routes_dict.values():
                 if not route['summary_lines']:
                     # empty route : skip it
                     continue
-                # begin Summary section
-                if not first_route:
+                if story:
                     # next route must start on a new page
                     story.append(RLPageBreak())
-                rows = []
-                rows.append(
-                    [RLParagraph('PLAT / DISH', styles['NormalLeftBold']),
-                     RLParagraph('Qté / Qty', styles['NormalCenterBold'])])
-                for sl in route['summary_lines']:
-                    rows.append([RLParagraph(sl.component_group_trans,
-                                             styles['NormalLeft']),
-                                 RLParagraph(str(sl.rqty + sl.lqty),
-                                             styles['NormalCenter'])])
-                tab = MultiRouteReport.RLMultiRouteTable(
-                    rows,
-                    colWidths=(100, 60),
-                    style=[('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                           ('GRID', (0, 0), (-1, -1), 1, rl_colors.black),
-                           ('ALIGN', (0, 0), (-1, -1), 'RIGHT')],
-                    hAlign='LEFT')
-                story.append(tab)
-                # end Summary section
-
-                # Route name
-                story.append(RLSpacer(1, 0.25 * rl_inch))
-                story.append(RLParagraph(route['route'].name,
-                                         styles['HugeBoldCenter']))
-                story.append(RLSpacer(1, 0.25 * rl_inch))
-                story.append(RLParagraph('- DÉBUT DE LA ROUTE / START ROUTE -',
-                                         styles['LargeLeft']))
-                story.append(RLSpacer(1, 0.125 * rl_inch))
-
-                # begin Detail section
-                rows = []
-                line = 0
-                tab_style = RLTableStyle(
-                    [('VALIGN', (0, 0), (-1, -1), 'TOP')])
-                rows.append([RLParagraph('Client', styles['NormalLeft']),
-                             RLParagraph('Note', styles['NormalLeft']),
-                             RLParagraph('Items', styles['NormalLeft']),
-                             RLParagraph('', styles['NormalLeft'])])
-                tab_style.add('LINEABOVE',
-                              (0, 0), (-1, 0), 1, rl_colors.black)
-                line += 1
-                for c in route['detail_lines']:
-                    tab_style.add('LINEABOVE',
-                                  (0, line), (-1, line), 1, rl_colors.black)
-                    items = c.delivery_items
-                    rows.append([
-                        # client
-                        [RLParagraph(c.firstname + ' ' + c.lastname,
-                                     styles['VeryLargeBoldLeft']),
-                         RLParagraph(c.street,
-                                     styles['LargeLeft']),
-                         RLParagraph(
-                             'Apt ' + c.apartment,
-                             styles['LargeLeft']) if c.apartment else [],
-                         RLParagraph(c.phone,
-                                     styles['LargeLeft'])],
-                        # note
-                        RLParagraph(c.delivery_note,
-                                    styles['LargeLeft']),
-                        # items
-                        ([RLParagraph(i.component_group_trans,
-                                      styles['LargeLeft'])
-                          for i in c.delivery_items] +
-                         [RLParagraph("Facture / Bill",
-                                      styles['LargeLeft'])
-                          if c.include_a_bill else []]),
-                        # quantity
-                        [RLParagraph(str(i.total_quantity),
-                                     styles['LargeRight'])
-                         for i in c.delivery_items]])
-                    line += 1
-                # END for
-                # add row for number of clients
-                rows.append([
-                    [RLParagraph("- FIN DE LA ROUTE -", styles['LargeLeft']),
-                     RLParagraph("- END OF ROUTE- ", styles['LargeLeft'])],
-                    [RLParagraph("Nombre d'arrêts :", styles['LargeRight']),
-                     RLParagraph("Number of Stops :", styles['LargeRight'])],
-                    RLParagraph(str(line - 1), styles['LargeLeft']),
-                    RLParagraph("", styles['LargeLeft'])])
-                #
-                tab_style.add('LINEBELOW',
-                              (0, line - 1), (-1, line - 1), 1,
-                              rl_colors.black)
-                tab = MultiRouteReport.RLMultiRouteTable(
-                              rows,
-                              colWidths=(140, 255, 100, 20),
-                              repeatRows=1)
-                tab.setStyle(tab_style)
-                story.append(tab)
-                # end Detail section
-                first_route = False
-            # END for
+                story.extend(route_story(route))
 
             # build full document
             doc.build(story,
@@ -809,28 +1118,14 @@ class KitchenCount(
     permission_required = 'sous_chef.read'
 
     def get(self, request, *args, **kwargs):
+        date = report_date(kwargs)
         if reverse('delivery:downloadKitchenCount') in request.path:
-            # download kitchen count report as PDF
-            try:
-                f = open(KITCHEN_COUNT_FILE, "rb")
-            except:
-                raise Http404("File " + KITCHEN_COUNT_FILE + " does not exist")
-            response = HttpResponse(content_type='application/pdf')
-            response['Content-Disposition'] = \
-                'attachment; filename="kitchencount{}.pdf"'. \
-                format(datetime.date.today().strftime("%Y%m%d"))
-            response.write(f.read())
-            f.close()
-            return response
+            # download the kitchen count report of the date rendered as PDF
+            return report_download(request, ReportJob.KITCHEN_COUNT, date)
         else:
             # Display kitchen count report for given delivery date
-            #   or for today by default; generate meal labels
-            if 'year' in kwargs and 'month' in kwargs and 'day' in kwargs:
-                date = datetime.date(
-                    int(kwargs['year']), int(kwargs['month']),
-                    int(kwargs['day']))
-            else:
-                date = datetime.date.today()
+            #   or for today by default; render the kitchen count
+            #   report and the meal labels in the background
             #  get sides component
             try:
                 sides_component = Component.objects.get(
@@ -856,42 +1151,153 @@ class KitchenCount(
                 return HttpResponseRedirect(
                     reverse_lazy("delivery:meal"))
 
-            kitchen_list_unfiltered = Order.get_kitchen_items(date)
+            report, cached = get_kitchen_count(date, kitchen_count)
+            context = {
+                'component_lines': report['component_lines'],
+                'meal_lines': report['meal_lines'],
+                'num_labels': report['num_labels']}
+            if report['component_lines']:
+                # we have orders today
+                context['kitchen_count_job'] = jobs.submit(
+                    ReportJob.KITCHEN_COUNT, date)
+                if report['num_labels']:
+                    context['meal_labels_job'] = jobs.submit(
+                        ReportJob.MEAL_LABELS, date)
+            if request.user.is_superuser:
+                context['kitchen_count_cache'] = kitchen_count_stats()
+            return render(request, 'kitchen_count.html', context)
 
-            # filter out route=None clients and not geolocalized clients
-            kitchen_list = {}
-            geolocalized_client_ids = list(Client.objects.filter(
-                pk__in=kitchen_list_unfiltered.keys(),
-                member__address__latitude__isnull=False,
-                member__address__longitude__isnull=False
-            ).values_list('pk', flat=True))
 
-            for client_id, kitchen_item in kitchen_list_unfiltered.items():
-                if kitchen_item.routename is not None \
-                   and client_id in geolocalized_client_ids:
-                    kitchen_list[client_id] = kitchen_item
+def kitchen_count(date):
+    """Compute the Kitchen Count Report and the Meal Labels for a date.
 
-            component_lines, meal_lines = kcr_make_lines(kitchen_list, date)
-            if component_lines:
-                # we have orders today
-                num_pages = kcr_make_pages(     # kitchen count as PDF
-                    date,
-                    component_lines,                    # summary
-                    meal_lines)                         # detail
-                num_labels = kcr_make_labels(   # meal labels as PDF
-                    date,
-                    kitchen_list,                       # KitchenItems
-                    component_lines[0].name,            # main dish name
-                    component_lines[0].ingredients)     # main dish ingredients
-            else:
-                # no orders today
-                num_pages = 0
-                num_labels = 0
-            return render(request, 'kitchen_count.html',
-                          {'component_lines': component_lines,
-                           'meal_lines': meal_lines,
-                           'num_pages': num_pages,
-                           'num_labels': num_labels})
+    Args:
+        date : A date.datetime object giving the date on which the
+            meals will be delivered.
+
+    Returns:
+        A dictionary with the kitchen list, the component and meal
+        lines of the report and the number of meal labels.
+    """
+    kitchen_list_unfiltered = Order.get_kitchen_items(date)
+
+    # filter out route=None clients and not geolocalized clients
+    kitchen_list = {}
+    geolocalized_client_ids = list(Client.objects.filter(
+        pk__in=kitchen_list_unfiltered.keys(),
+        member__address__latitude__isnull=False,
+        member__address__longitude__isnull=False
+    ).values_list('pk', flat=True))
+
+    for client_id, kitchen_item in kitchen_list_unfiltered.items():
+        if kitchen_item.routename is not None \
+           and client_id in geolocalized_client_ids:
+            kitchen_list[client_id] = kitchen_item
+
+    component_lines, meal_lines = kcr_make_lines(kitchen_list, date)
+    num_labels = 0
+    if component_lines:
+        # one label per main dish serving (see kcr_make_labels)
+        num_labels = sum(
+            kititm.meal_qty for kititm in kitchen_list.values())
+    return {'kitchen_list': kitchen_list,
+            'component_lines': component_lines,
+            'meal_lines': meal_lines,
+            'num_labels': num_labels}
+
+
+@jobs.renderer(ReportJob.KITCHEN_COUNT)
+def render_kitchen_count(date, filename):
+    """Render the Kitchen Count Report of a date (see jobs.renderer)."""
+    report, cached = get_kitchen_count(date, kitchen_count)
+    if not report['component_lines']:
+        return 0
+    return kcr_make_pages(
+        date,
+        report['component_lines'],              # summary
+        report['meal_lines'],                   # detail
+        filename)
+
+
+@jobs.renderer(ReportJob.MEAL_LABELS)
+def render_meal_labels(date, filename, by_route=False):
+    """Render the Meal Labels of a date (see jobs.renderer), in one file
+    per route in the directory `filename` if `by_route` is True (see
+    kcr_make_labels)."""
+    report, cached = get_kitchen_count(date, kitchen_count)
+    if not report['component_lines']:
+        return 0
+    return kcr_make_labels(
+        date,
+        report['kitchen_list'],                 # KitchenItems
+        report['component_lines'][0].name,      # main dish name
+        report['component_lines'][0].ingredients,  # main dish ingredients
+        filename,
+        by_route)
+
+
+def report_date(kwargs):
+    """Returns the date of the year, month and day URL arguments, or
+    today's date by default."""
+    if 'year' in kwargs and 'month' in kwargs and 'day' in kwargs:
+        return datetime.date(
+            int(kwargs['year']), int(kwargs['month']), int(kwargs['day']))
+    return datetime.date.today()
+
+
+def report_download(request, kind, date):
+    """Returns the PDF file of the report `kind` of a date as it is now,
+    or the status of its job while it is rendered (see jobs.submit)."""
+    job = jobs.submit(kind, date)
+    if not job.is_finished:
+        return report_job_status(job, status=202)
+    return report_job_response(request, job)
+
+
+def report_job_status(job, **kwargs):
+    """Returns the status of a report job as JSON (see ReportJobStatus)."""
+    return JsonResponse({
+        'id': job.pk,
+        'kind': job.kind,
+        'delivery_date': job.delivery_date,
+        'status': job.status,
+        'count': job.count,
+        'error': job.error,
+        'download_url': (
+            reverse('delivery:report_job_download', args=(job.pk,))
+            if job.has_artifact else None),
+    }, **kwargs)
+
+
+def report_job_response(request, job):
+    """Returns the PDF file rendered by a report job as an attachment."""
+    if not job.has_artifact:
+        raise Http404("The report job did not render a file")
+    try:
+        f = open(job.artifact, "rb")
+    except FileNotFoundError:
+        raise Http404("File " + job.artifact + " does not exist")
+    prefix = {ReportJob.KITCHEN_COUNT: 'kitchencount',
+              ReportJob.MEAL_LABELS: 'labels'}[job.kind]
+    return pdf_response(request, f, '{}{}.pdf'.format(
+        prefix, job.delivery_date.strftime("%Y%m%d")))
+
+
+class ReportJobStatus(
+        LoginRequiredMixin, PermissionRequiredMixin, generic.View):
+    permission_required = 'sous_chef.read'
+
+    def get(self, request, pk):
+        return report_job_status(get_object_or_404(ReportJob, pk=pk))
+
+
+class ReportJobDownload(
+        LoginRequiredMixin, PermissionRequiredMixin, generic.View):
+    permission_required = 'sous_chef.read'
+
+    def get(self, request, pk):
+        return report_job_response(
+            request, get_object_or_404(ReportJob, pk=pk))
 
 
 component_line_fields = [          # Component summary Line on Kitchen Count.
@@ -1084,7 +1490,7 @@ def kcr_make_lines(kitchen_list, date):
     return (component_lines_sorted, meal_lines)
 
 
-def kcr_make_pages(date, component_lines, meal_lines):
+def kcr_make_pages(date, component_lines, meal_lines, filename):
     """Generate the kitchen count report pages as a PDF file.
 
     Uses ReportLab see http://www.reportlab.com/documentation/faq/
@@ -1096,6 +1502,7 @@ def kcr_make_pages(date, component_lines, meal_lines):
         meal_lines : A list of MealLine objects, the details of the clients
             for the date that have ingredients clashing with those in today's
             main dish.
+        filename : A string, the name of the PDF file.
 
     Returns:
         An integer : The number of pages generated.
@@ -1157,7 +1564,7 @@ def kcr_make_pages(date, component_lines, meal_lines):
         Returns:
             An integer : The number of pages generated.
         """
-        doc = RLSimpleDocTemplate(KITCHEN_COUNT_FILE)
+        doc = RLSimpleDocTemplate(filename)
         story = []
 
         # begin Summary section
@@ -1285,120 +1692,15 @@ def kcr_make_pages(date, component_lines, meal_lines):
 
 # Meal labels generation data structures and functions.
 
-meal_label_fields = [                         # Contents for Meal Labels.
-    # field name, default value
-    'sortkey', '',          # key for sorting
-    'route', '',            # String : Route name
-    'name', '',             # String : Last + First abbreviated
-    'date', '',             # String : Delivery date
-    'size', '',             # String : Regular or Large
-    'main_dish_name', '',   # String
-    'dish_clashes', [],   # List of strings
-    'preparations', [],   # List of strings
-    'sides_clashes', [],    # List of strings
-    'other_restrictions', [],   # List of strings
-    'ingredients', []]  # List of strings
-MealLabel = collections.namedtuple(
-    'MealLabel', meal_label_fields[0::2])
-
-
-def draw_label(label, width, height, data):
-    """Draw a single Meal Label on the sheet.
-
-    Callback function that is used by the labels generator.
-
-    Args:
-        label : Object passed by pylabels.
-        width : Single label width in font points.
-        height : Single label height in font points.
-        data : A MealLabel namedtuple.
-    """
-    # dimensions are in font points (72 points = 1 inch)
-    # Line 1
-    vertic_pos = height * 0.85
-    horiz_margin = 9  # distance from edge of label 9/72 = 1/8 inch
-    if data.name:
-        label.add(rl_shapes.String(
-            horiz_margin, vertic_pos, data.name,
-            fontName="Helvetica-Bold", fontSize=12))
-    if data.route:
-        label.add(rl_shapes.String(
-            width / 2.0, vertic_pos, data.route,
-            fontName="Helvetica-Oblique", fontSize=10, textAnchor="middle"))
-    if data.date:
-        label.add(rl_shapes.String(
-            width - horiz_margin, vertic_pos, data.date,
-            fontName="Helvetica", fontSize=10, textAnchor="end"))
-    # Line 2
-    vertic_pos -= 14
-    if data.main_dish_name:
-        label.add(rl_shapes.String(
-            horiz_margin, vertic_pos, data.main_dish_name,
-            fontName="Helvetica-Bold", fontSize=10))
-    if data.size:
-        label.add(rl_shapes.String(
-            width - horiz_margin, vertic_pos, data.size,
-            fontName="Helvetica-Bold", fontSize=10, textAnchor="end"))
-    # Line(s) 3
-    vertic_pos -= 12
-    if data.dish_clashes:
-        for line in data.dish_clashes:
-            label.add(rl_shapes.String(
-                horiz_margin, vertic_pos, line,
-                fontName="Helvetica", fontSize=9))
-            vertic_pos -= 10
-    # Line(s) 4
-    if data.preparations:
-        # draw prefix
-        label.add(rl_shapes.String(
-            horiz_margin, vertic_pos, data.preparations[0],
-            fontName="Helvetica", fontSize=9))
-        # measure prefix length to offset first line
-        offset = rl_pdfmetrics.stringWidth(
-            data.preparations[0], fontName="Helvetica", fontSize=9)
-        for line in data.preparations[1:]:
-            label.add(rl_shapes.String(
-                horiz_margin + offset, vertic_pos, line,
-                fontName="Helvetica-Bold", fontSize=9))
-            offset = 0.0  # Only first line is offset at right of prefix
-            vertic_pos -= 10
-    # Line(s) 5
-    if data.sides_clashes:
-        # draw prefix
-        label.add(rl_shapes.String(
-            horiz_margin, vertic_pos, data.sides_clashes[0],
-            fontName="Helvetica", fontSize=9))
-        # measure prefix length to offset first line
-        offset = rl_pdfmetrics.stringWidth(
-            data.sides_clashes[0], fontName="Helvetica", fontSize=9)
-        for line in data.sides_clashes[1:]:
-            label.add(rl_shapes.String(
-                horiz_margin + offset, vertic_pos, line,
-                fontName="Helvetica-Bold", fontSize=9))
-            offset = 0.0  # Only first line is offset at right of prefix
-            vertic_pos -= 10
-    # Line(s) 6
-    if data.other_restrictions:
-        for line in data.other_restrictions:
-            label.add(rl_shapes.String(
-                horiz_margin, vertic_pos, line,
-                fontName="Helvetica", fontSize=9))
-            vertic_pos -= 10
-    # Line(s) 7
-    if data.ingredients:
-        for line in data.ingredients:
-            label.add(rl_shapes.String(
-                horiz_margin, vertic_pos, line,
-                fontName="Helvetica", fontSize=8))
-            vertic_pos -= 9
-
-
 def kcr_make_labels(date, kitchen_list,
-                    main_dish_name, main_dish_ingredients):
+                    main_dish_name, main_dish_ingredients, filename,
+                    by_route=False):
     """Generate Meal Labels sheets as a PDF file.
 
     Generate a label for each main dish serving to be delivered. The
     sheet format is "Avery 5162" 8,5 X 11 inches, 2 cols X 7 lines.
+    The sheets are rendered in settings.MEAL_LABELS_PROCESSES worker
+    processes (see label_sheets.render).
 
     Uses pylabels package - see https://github.com/bcbnz/pylabels
     and ReportLab
@@ -1412,35 +1714,15 @@ def kcr_make_labels(date, kitchen_list,
         main_dish_name : A string, the name of today's main dish.
         main_dish_ingredient : A string, the comma separated list
             of all the ingredients in today's main dish.
+        filename : A string, the name of the PDF file, written if there
+            is at least one label. If `by_route` is True, the name of a
+            directory in which a PDF file is written for each route.
+        by_route : A boolean, True to generate the labels of each route
+            in a separate PDF file, named after the route.
 
     Returns:
         An integer : The number of labels generated.
     """
-    # dimensions are in millimeters; 1 inch = 25.4 mm
-    # Sheet format is Avery 5162 : 2 columns * 7 rows
-    sheet_height = 11.0 * 25.4
-    sheet_width = 8.5 * 25.4
-    vertic_margin = 21.0
-    horiz_margin = 4.0
-    columns = 2
-    rows = 7
-    gutter = 3.0 / 16.0 * 25.4
-    specs = labels.Specification(
-        sheet_width=sheet_width,
-        sheet_height=sheet_height,
-        columns=columns,
-        rows=rows,
-        column_gap=gutter,
-        label_width=(sheet_width - 2.0 * horiz_margin - gutter) / columns,
-        label_height=(sheet_height - 2.0 * vertic_margin) / rows,
-        top_margin=vertic_margin,
-        bottom_margin=vertic_margin,
-        left_margin=horiz_margin,
-        right_margin=horiz_margin,
-        corner_radius=1.5)
-
-    sheet = labels.Sheet(specs, draw_label, border=False)
-
     meal_labels = []
     for kititm in kitchen_list.values():
         meal_label = MealLabel(*meal_label_fields[1::2])
@@ -1539,12 +1821,22 @@ def kcr_make_labels(date, kitchen_list,
                 rou=route, rouw=routew,
                 nam=meal_labels[j].name, namw=namew))
     # generate labels into PDF
-    for label in sorted(meal_labels, key=lambda x: x.sortkey):
-        sheet.add_label(label)
-
-    if sheet.label_count > 0:
-        sheet.save(MEAL_LABELS_FILE)
-    return sheet.label_count
+    meal_labels.sort(key=lambda x: x.sortkey)
+    processes = settings.MEAL_LABELS_PROCESSES or os.cpu_count() or 1
+    if by_route:
+        os.makedirs(filename, exist_ok=True)
+        routes = collections.OrderedDict()
+        for label in meal_labels:
+            routes.setdefault(label.route, []).append(label)
+        for route, route_labels in routes.items():
+            label_sheets.render(
+                route_labels,
+                os.path.join(filename, '{}.pdf'.format(
+                    slugify(route) or 'no-route')),
+                processes)
+    elif meal_labels:
+        label_sheets.render(meal_labels, filename, processes)
+    return len(meal_labels)
 
 # END Meal labels
 
@@ -1557,17 +1849,10 @@ class MealLabels(
     permission_required = 'sous_chef.read'
 
     def get(self, request, **kwargs):
-        try:
-            f = open(MEAL_LABELS_FILE, "rb")
-        except:
-            raise Http404("File " + MEAL_LABELS_FILE + " does not exist")
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = \
-            'attachment; filename="labels{}.pdf"'. \
-            format(datetime.date.today().strftime("%Y%m%d"))
-        response.write(f.read())
-        f.close()
-        return response
+        # download the meal labels of the date, today by default, rendered
+        # as PDF
+        return report_download(
+            request, ReportJob.MEAL_LABELS, report_date(kwargs))
 
 
 class DeliveryRouteSheet(
@@ -1661,35 +1946,58 @@ def sort_sequence_ids(unordered_dic, seq):
 # END Delivery route sheet view, helper classes and functions
 
 
-def calculateRoutePointsEuclidean(data):
+def sequence_indexes(ids, sequence):
+    """
+    Returns the indexes in a distance matrix, where ids[i] is the node
+    i + 1, of the IDs of a sequence. The IDs not in ids, and repeated,
+    are skipped.
+    """
+    indexes = {pk: i + 1 for i, pk in enumerate(ids)}
+    return [i for i in (indexes.pop(pk, None) for pk in sequence)
+            if i is not None]
+
+
+def calculateRoutePointsEuclidean(data, budget=None, sequence=None,
+                                  group=None, vehicle=None):
     """Find shortest path for points on route assuming 2D plane.
 
     Since the
     https://www.mapbox.com/api-documentation/#retrieve-a-duration-matrix
     endpoint is not yet available, we solve an approximation of the
-    problem by assuming the world is flat and has no obstacles (2D
-    Euclidean plane). This should still give good results.
+    problem by assuming the world is flat and has no obstacles: the
+    points are projected on a plane tangent at the starting point
+    (equirectangular projection). This should still give good results.
+    Travel times on an offline road network can be used instead (see
+    settings.ROUTE_COST_PROVIDER).
 
     Args:
         data : A list of waypoints for leaflet.js
+        budget : The time allowed to improve the route, in seconds, or
+            None to stop at the first local optimum (see tsp.optimize).
+        sequence : A previous sequence of waypoint IDs, e.g. of the last
+            delivery, to start from. The waypoints not in it are inserted
+            where they lengthen the route the least, the IDs not in data
+            are ignored. A good sequence converges much faster than
+            solving from scratch.
+        group : The name under which the distances are cached (see
+            cache.get_distance_matrix), e.g. of the route.
+        vehicle : The vehicle of the route, its speed on the road network.
 
     Returns:
         An optimized list of waypoints.
     """
-    node_to_waypoint = {}
-    nodes = [tsp.Node(None,
-                      DELIVERY_STARTING_POINT_LAT_LONG[0],
-                      DELIVERY_STARTING_POINT_LAT_LONG[1])]
-    for waypoint in data:
-        node = tsp.Node(waypoint['id'], float(waypoint['latitude']),
-                        float(waypoint['longitude']))
-        node_to_waypoint[node] = waypoint
-        nodes.append(node)
+    matrix = get_distance_matrix(
+        [(waypoint['id'], waypoint['latitude'], waypoint['longitude'])
+         for waypoint in data],
+        DELIVERY_STARTING_POINT_LAT_LONG, group, vehicle)
+    tour = None
+    if sequence:
+        tour = tsp.warm_start(matrix, sequence_indexes(
+            [waypoint['id'] for waypoint in data], sequence))
     # Optimize waypoints by solving the Travelling Salesman Problem
-    nodes = tsp.solve(nodes)
-    # Guard against starting point which is not in node_to_waypoint
-    return [node_to_waypoint[node] for
-            node in nodes if node in node_to_waypoint]
+    tour = tsp.optimize(matrix, tour, budget)
+    # Skip the starting point, index 0
+    return [data[i - 1] for i in tour[1:]]
 
 
 class RefreshOrderView(
@@ -1698,8 +2006,9 @@ class RefreshOrderView(
 
     def get(self, request):
         delivery_date = date.today()
-        clients = Client.ongoing.all()
-        orders = Order.objects.auto_create_orders(delivery_date, clients)
+        clients = Client.ongoing.select_related('route', 'member__address')
+        orders = Order.objects.auto_create_orders(
+            delivery_date, clients, bulk=True)
         LogEntry.objects.log_action(
             user_id=1, content_type_id=1,
             object_id="", object_repr="Generation of orders for " + str(
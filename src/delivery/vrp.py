@@ -0,0 +1,142 @@
+# Capacitated vehicle routing: partition the stops of a day between the
+# vehicles of the routes, and sequence each route (see tsp.py).
+#
+# All the tours start at the depot, node 0 of the distance matrix. The
+# stops are assigned by regret insertion, then moved between the tours
+# while it shortens the total distance, each tour being improved by the
+# TSP local search.
+import numpy
+
+from . import tsp
+
+
+# Relocation passes at most, each followed by a local search per tour.
+MAX_PASSES = 10
+
+
+def solve(matrix, capacities, demands=None):
+    """Solves the capacitated vehicle routing problem with a heuristic.
+
+    Args:
+        matrix: A symmetric distance matrix (see tsp.solve_matrix), node
+            0 being the depot.
+        capacities: The capacity of each vehicle.
+        demands: The demand of each node, the depot's is ignored.
+            Defaults to 1 for every stop.
+
+    Returns:
+        A list of tours, one per vehicle: lists of node indexes starting
+        with 0. Each stop is in exactly one tour, and the demands of the
+        stops of a tour do not exceed the capacity of its vehicle.
+
+    Raises:
+        ValueError: The vehicles cannot carry all the demands.
+    """
+    matrix = numpy.asarray(matrix, dtype=numpy.float64)
+    n = len(matrix)
+    if demands is None:
+        demands = [0] + [1] * (n - 1)
+    if sum(demands[1:]) > sum(capacities):
+        raise ValueError("The vehicles cannot carry all the demands.")
+    tours = assign(matrix, capacities, demands)
+    loads = [sum(demands[node] for node in tour) for tour in tours]
+    for _ in range(MAX_PASSES):
+        tours = [sequence(tour, matrix) for tour in tours]
+        if not relocate(tours, loads, matrix, capacities, demands):
+            break
+    return tours
+
+
+def sequence(tour, matrix):
+    """Returns a tour improved by the TSP local search (see tsp.optimize).
+    """
+    tour = numpy.asarray(tour)
+    return [int(tour[i]) for i in
+            tsp.optimize(matrix[numpy.ix_(tour, tour)])]
+
+
+def assign(matrix, capacities, demands):
+    """Returns the tours built by regret insertion.
+
+    The stops are inserted one after the other, each at its cheapest
+    position (see tsp.insertion_cost). The next stop is the one with the
+    largest regret: the most extra distance if it is not inserted in its
+    best tour, which must be done while there is room in that tour.
+    """
+    k = len(capacities)
+    tours = [[0] for _ in range(k)]
+    loads = [0] * k
+    stops = numpy.arange(1, len(matrix))
+    # costs[r, s]: cost of inserting stops[s] in the tour r
+    costs = numpy.repeat(
+        (2 * matrix[0, stops])[numpy.newaxis, :], k, axis=0)
+    unassigned = numpy.ones(len(stops), dtype=bool)
+    for _ in range(len(stops)):
+        room = numpy.array([
+            capacities[r] - loads[r] for r in range(k)])[:, numpy.newaxis]
+        feasible = numpy.where(
+            room >= numpy.asarray(demands)[stops], costs, numpy.inf)
+        if k > 1:
+            best, second = numpy.sort(feasible, axis=0)[:2]
+            with numpy.errstate(invalid='ignore'):  # inf - inf
+                regret = second - best
+        else:
+            best, regret = feasible[0], numpy.zeros(len(stops))
+        regret = numpy.where(numpy.isnan(regret), numpy.inf, regret)
+        # break ties on regret by the cheapest insertion
+        s = max(numpy.flatnonzero(unassigned),
+                key=lambda s: (regret[s], -best[s]))
+        if best[s] == numpy.inf:
+            raise ValueError("The vehicles cannot carry all the demands.")
+        r = int(numpy.argmin(feasible[:, s]))
+        node = int(stops[s])
+        position, _ = tsp.insertion_cost(tours[r], node, matrix)
+        tours[r].insert(position, node)
+        loads[r] += demands[node]
+        unassigned[s] = False
+        costs[:, s] = numpy.inf
+        # only the costs of the tour grown change
+        before = numpy.asarray(tours[r])
+        after = numpy.roll(before, -1)
+        costs[r] = numpy.where(
+            unassigned,
+            (matrix[before][:, stops] + matrix[after][:, stops] -
+             matrix[before, after][:, numpy.newaxis]).min(axis=0),
+            numpy.inf)
+    return tours
+
+
+def relocate(tours, loads, matrix, capacities, demands):
+    """Move stops in place to other tours while it shortens the total
+    distance and the capacities allow it.
+
+    Returns:
+        True if a stop was moved.
+    """
+    moved = False
+    for a, tour in enumerate(tours):
+        i = 1
+        while i < len(tour):
+            node = tour[i]
+            previous, following = tour[i - 1], tour[(i + 1) % len(tour)]
+            gain = (matrix[previous, node] + matrix[node, following] -
+                    matrix[previous, following])
+            best = None
+            for b, other in enumerate(tours):
+                if b == a or \
+                        loads[b] + demands[node] > capacities[b]:
+                    continue
+                position, cost = tsp.insertion_cost(other, node, matrix)
+                if cost < gain - tsp.TOLERANCE * gain and \
+                        (best is None or cost < best[2]):
+                    best = b, position, cost
+            if best is None:
+                i += 1
+                continue
+            b, position, _ = best
+            del tour[i]
+            tours[b].insert(position, node)
+            loads[a] -= demands[node]
+            loads[b] += demands[node]
+            moved = True
+    return moved
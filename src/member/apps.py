@@ -5,4 +5,4 @@ class MemberConfig(AppConfig):
     name = 'member'
 
     def ready(self):
-        pass
+        from member.signals import forbidden_ingredients  # noqa
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 21:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def materialize_forbidden_ingredients(apps, schema_editor):
+    Client_avoid_ingredient = apps.get_model(
+        'member', 'Client_avoid_ingredient')
+    Client_forbidden_ingredient = apps.get_model(
+        'member', 'Client_forbidden_ingredient')
+    Restriction = apps.get_model('member', 'Restriction')
+    Incompatibility = apps.get_model('meal', 'Incompatibility')
+    Client_forbidden_ingredient.objects.bulk_create(
+        Client_forbidden_ingredient(
+            client_id=avoid.client_id,
+            ingredient_id=avoid.ingredient_id,
+            avoid_ingredient_id=avoid.id)
+        for avoid in Client_avoid_ingredient.objects.all())
+    Client_forbidden_ingredient.objects.bulk_create(
+        Client_forbidden_ingredient(
+            client_id=restriction.client_id,
+            ingredient_id=incompatibility.ingredient_id,
+            restriction_id=restriction.id,
+            incompatibility_id=incompatibility.id)
+        for restriction in Restriction.objects.all()
+        for incompatibility in Incompatibility.objects.filter(
+            restricted_item_id=restriction.restricted_item_id))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meal', '0008_auto_20180704_1613'),
+        ('member', '0034_auto_20170816_0850'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Client_forbidden_ingredient',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('avoid_ingredient', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='member.Client_avoid_ingredient')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='member.Client', verbose_name='client')),
+                ('incompatibility', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='meal.Incompatibility')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='meal.Ingredient', verbose_name='ingredient')),
+                ('restriction', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='member.Restriction')),
+            ],
+        ),
+        migrations.RunPython(
+            materialize_forbidden_ingredients, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,5 @@
+import collections
+import copy
 import datetime
 import math
 import json
@@ -17,7 +19,7 @@ from annoying.fields import JSONField
 from member.formsfield import CAPhoneNumberExtField
 from meal.models import (
     COMPONENT_GROUP_CHOICES, COMPONENT_GROUP_CHOICES_MAIN_DISH,
-    COMPONENT_GROUP_CHOICES_SIDES
+    COMPONENT_GROUP_CHOICES_SIDES, Incompatibility
 )
 from note.models import Note
 
@@ -89,6 +91,70 @@ ROUTE_VEHICLES = (
 
 DEFAULT_VEHICLE = ROUTE_VEHICLES[0][0]
 
+# Component groups that can be part of a client's meals default.
+MEALS_DEFAULT_COMPONENTS = tuple(
+    component for component, label in COMPONENT_GROUP_CHOICES
+    if component != COMPONENT_GROUP_CHOICES_SIDES
+)
+
+
+class CompiledMealsSchedule(collections.namedtuple(
+        'CompiledMealsSchedule',
+        ['schedule',      # Simple meals schedule as stored, or None
+         'days',          # 7 booleans, True if delivery scheduled that day
+         'quantities',    # 7 tuples of quantities (MEALS_DEFAULT_COMPONENTS)
+         'sizes'])):      # 7 main dish sizes
+    """Compact representation of a client's meals default and schedule.
+
+    Every tuple of 7 elements is indexed by weekday, Monday being 0 and
+    Sunday 6, like `date.weekday()` and DAYS_OF_WEEK.
+    """
+    __slots__ = ()
+
+    def day_items(self, weekday):
+        """
+        Returns the meal default of the weekday as a dictionary
+        {component group: quantity, ..., 'size': size}.
+        """
+        items = dict(zip(MEALS_DEFAULT_COMPONENTS, self.quantities[weekday]))
+        items['size'] = self.sizes[weekday]
+        return items
+
+
+def compile_meals_schedule(meal_default_week, meals_schedule_values):
+    """
+    Build a CompiledMealsSchedule.
+
+    Args:
+        meal_default_week: The client's `meal_default_week` dictionary.
+        meals_schedule_values: The values of the client's 'meals_schedule'
+            options, as JSON strings. The first valid one is used.
+    """
+    schedule = None
+    for value in meals_schedule_values:
+        try:
+            schedule = json.loads(value)
+            break
+        except (ValueError, TypeError):  # JSON error
+            continue
+
+    meal_default_week = meal_default_week or {}
+    quantities = []
+    sizes = []
+    for day, label in DAYS_OF_WEEK:
+        quantities.append(tuple(
+            meal_default_week.get(component + '_' + day + '_quantity')
+            for component in MEALS_DEFAULT_COMPONENTS
+        ))
+        sizes.append(meal_default_week.get('size_' + day))
+
+    return CompiledMealsSchedule(
+        schedule=schedule,
+        days=(None if schedule is None else
+              tuple(day in schedule for day, label in DAYS_OF_WEEK)),
+        quantities=tuple(quantities),
+        sizes=tuple(sizes))
+
 
 class Member(models.Model):
 
@@ -684,19 +750,69 @@ class Client(models.Model):
         """
         return self.client_notes.all()
 
+    def save(self, *args, **kwargs):
+        super(Client, self).save(*args, **kwargs)
+        self.invalidate_meals_schedule()
+
+    @property
+    def compiled_meals_schedule(self):
+        """
+        Returns the CompiledMealsSchedule of the client.
+
+        It is compiled once and kept on the instance until the
+        'meals_schedule' option is changed (see invalidate_meals_schedule)
+        or `meal_default_week` has another value.
+
+        The compiled schedule is not shared: every instance of the client
+        (e.g. one per request or query) compiles its own, and a change of
+        the option made through another instance or a queryset update is
+        only seen after calling invalidate_meals_schedule().
+        """
+        cached = getattr(self, '_compiled_meals_schedule', None)
+        if cached is None or cached[0] != self.meal_default_week:
+            # the options prefetched by prefetch_related('client_option_set')
+            # are cached under the related query name 'client_option'
+            if 'client_option' in getattr(
+                    self, '_prefetched_objects_cache', {}):
+                values = tuple(
+                    co.value for co in self.client_option_set.all()
+                    if co.option.name == 'meals_schedule'
+                )
+            else:
+                values = tuple(self.client_option_set.filter(
+                    option__name='meals_schedule'
+                ).values_list('value', flat=True))
+            # a copy, as the meals default can be changed in place
+            cached = (copy.deepcopy(self.meal_default_week),
+                      compile_meals_schedule(self.meal_default_week, values))
+            self._compiled_meals_schedule = cached
+        return cached[1]
+
+    def invalidate_meals_schedule(self):
+        """
+        Forget the compiled meals schedule and the prefetched options.
+        """
+        self.__dict__.pop('_compiled_meals_schedule', None)
+        getattr(self, '_prefetched_objects_cache', {}).pop(
+            'client_option', None)
+
+    def is_scheduled_on(self, weekday):
+        """
+        Returns True if the client has a scheduled delivery on the weekday
+        (Monday is 0, Sunday is 6).
+        Episodic clients never have scheduled deliveries.
+        """
+        days = self.compiled_meals_schedule.days
+        return self.delivery_type != 'E' and days is not None and \
+            days[weekday]
+
     @property
     def simple_meals_schedule(self):
         """
         Returns a list of days, corresponding to the client's delivery
         days.
         """
-        for co in self.client_option_set.all():
-            if co.option.name == 'meals_schedule':
-                try:
-                    return json.loads(co.value)
-                except (ValueError, TypeError):  # JSON error
-                    continue
-        return None
+        return self.compiled_meals_schedule.schedule
 
     @property
     def meals_default(self):
@@ -710,27 +826,11 @@ class Client(models.Model):
         It is possible to have zero value, representing that the client
         has said no to a component on a particular day.
         """
-        defaults = []
-        for day, str in DAYS_OF_WEEK:
-            current = {}
-            numeric_fields = []
-            for component, label in COMPONENT_GROUP_CHOICES:
-                if component is COMPONENT_GROUP_CHOICES_SIDES:
-                    continue  # skip "Sides"
-                item = self.meal_default_week.get(
-                    component + '_' + day + '_quantity'
-                )
-                current[component] = item
-                numeric_fields.append(item)
-
-            size = self.meal_default_week.get(
-                'size_' + day
-            )
-            current['size'] = size
-
-            defaults.append((day, current))
-
-        return defaults
+        compiled = self.compiled_meals_schedule
+        return [
+            (day, compiled.day_items(weekday))
+            for weekday, (day, label) in enumerate(DAYS_OF_WEEK)
+        ]
 
     @property
     def meals_schedule(self):
@@ -741,17 +841,16 @@ class Client(models.Model):
         Intended to be called only for Ongoing clients. For episodic clients
         or if `simple_meals_schedule` is not set, it returns empty tuple.
         """
-        defaults = self.meals_default
-        prefs = []
-        simple_meals_schedule = self.simple_meals_schedule
+        compiled = self.compiled_meals_schedule
 
-        if self.delivery_type == 'E' or simple_meals_schedule is None:
+        if self.delivery_type == 'E' or compiled.days is None:
             return ()
         else:
-            for day, meal_schedule in defaults:
-                if day in simple_meals_schedule:
-                    prefs.append((day, meal_schedule))
-            return prefs
+            return [
+                (day, compiled.day_items(weekday))
+                for weekday, (day, label) in enumerate(DAYS_OF_WEEK)
+                if compiled.days[weekday]
+            ]
 
     def set_simple_meals_schedule(self, schedule):
         """
@@ -764,6 +863,7 @@ class Client(models.Model):
         client_option, _ = Client_option.objects.update_or_create(
             client=self, option=meal_schedule_option,
             defaults={'value': json.dumps(schedule)})
+        self.invalidate_meals_schedule()
 
 
 class ClientScheduledStatus(models.Model):
@@ -1042,6 +1142,17 @@ class Client_option(models.Model):
                                        self.client.member.lastname,
                                        self.option.name)
 
+    def save(self, *args, **kwargs):
+        super(Client_option, self).save(*args, **kwargs)
+        if Client_option.client.is_cached(self):
+            self.client.invalidate_meals_schedule()
+
+    def delete(self, *args, **kwargs):
+        result = super(Client_option, self).delete(*args, **kwargs)
+        if Client_option.client.is_cached(self):
+            self.client.invalidate_meals_schedule()
+        return result
+
 
 class Restriction(models.Model):
     client = models.ForeignKey(
@@ -1085,6 +1196,137 @@ class Client_avoid_ingredient(models.Model):
                                        self.ingredient.name)
 
 
+class ClientForbiddenIngredientManager(models.Manager):
+
+    def refresh_avoid_ingredient(self, avoid_ingredient):
+        """
+        Materialize the ingredient avoided by a Client_avoid_ingredient.
+        """
+        self.filter(avoid_ingredient=avoid_ingredient).delete()
+        self.create(
+            client_id=avoid_ingredient.client_id,
+            ingredient_id=avoid_ingredient.ingredient_id,
+            avoid_ingredient=avoid_ingredient)
+
+    def refresh_restriction(self, restriction):
+        """
+        Materialize the ingredients incompatible with a Restriction.
+        """
+        self.filter(restriction=restriction).delete()
+        self.bulk_create(
+            Client_forbidden_ingredient(
+                client_id=restriction.client_id,
+                ingredient_id=ingredient_id,
+                restriction=restriction,
+                incompatibility_id=incompatibility_id)
+            for incompatibility_id, ingredient_id in
+            Incompatibility.objects.filter(
+                restricted_item_id=restriction.restricted_item_id
+            ).values_list('id', 'ingredient_id'))
+
+    def refresh_incompatibility(self, incompatibility):
+        """
+        Materialize an Incompatibility for the clients restricting its
+        restricted item.
+        """
+        self.filter(incompatibility=incompatibility).delete()
+        self.bulk_create(
+            Client_forbidden_ingredient(
+                client_id=client_id,
+                ingredient_id=incompatibility.ingredient_id,
+                restriction_id=restriction_id,
+                incompatibility=incompatibility)
+            for restriction_id, client_id in Restriction.objects.filter(
+                restricted_item_id=incompatibility.restricted_item_id
+            ).values_list('id', 'client_id'))
+
+    def rebuild(self):
+        """
+        Materialize again all the forbidden ingredients, for example
+        after rows were added with `bulk_create`, which sends no signal.
+        """
+        self.all().delete()
+        incompatibilities = collections.defaultdict(list)
+        for incompatibility_id, restricted_item_id, ingredient_id in \
+                Incompatibility.objects.values_list(
+                    'id', 'restricted_item_id', 'ingredient_id'):
+            incompatibilities[restricted_item_id].append(
+                (incompatibility_id, ingredient_id))
+        self.bulk_create(
+            Client_forbidden_ingredient(
+                client_id=client_id,
+                ingredient_id=ingredient_id,
+                avoid_ingredient_id=avoid_ingredient_id)
+            for avoid_ingredient_id, client_id, ingredient_id in
+            Client_avoid_ingredient.objects.values_list(
+                'id', 'client_id', 'ingredient_id'))
+        self.bulk_create(
+            Client_forbidden_ingredient(
+                client_id=client_id,
+                ingredient_id=ingredient_id,
+                restriction_id=restriction_id,
+                incompatibility_id=incompatibility_id)
+            for restriction_id, client_id, restricted_item_id in
+            Restriction.objects.values_list(
+                'id', 'client_id', 'restricted_item_id')
+            for incompatibility_id, ingredient_id in
+            incompatibilities[restricted_item_id])
+
+
+class Client_forbidden_ingredient(models.Model):
+    """
+    An ingredient that a client must not eat, because it is avoided or
+    because it is incompatible with one of the client's restricted items.
+
+    There is one row for every Client_avoid_ingredient and for every
+    pair of Restriction and Incompatibility sharing a restricted item.
+    Rows are created by the signal handlers of these models and deleted
+    with them.
+    """
+    client = models.ForeignKey(
+        'member.Client',
+        verbose_name=_('client'),
+        related_name='+',
+        on_delete=models.CASCADE
+    )
+
+    ingredient = models.ForeignKey(
+        'meal.Ingredient',
+        verbose_name=_('ingredient'),
+        related_name='+',
+        on_delete=models.CASCADE
+    )
+
+    avoid_ingredient = models.ForeignKey(
+        'member.Client_avoid_ingredient',
+        related_name='+',
+        null=True,
+        on_delete=models.CASCADE
+    )
+
+    restriction = models.ForeignKey(
+        'member.Restriction',
+        related_name='+',
+        null=True,
+        on_delete=models.CASCADE
+    )
+
+    incompatibility = models.ForeignKey(
+        'meal.Incompatibility',
+        related_name='+',
+        null=True,
+        on_delete=models.CASCADE
+    )
+
+    objects = ClientForbiddenIngredientManager()
+
+    def __str__(self):
+        return "{} {} <must not eat> {}".format(
+            self.client.member.firstname,
+            self.client.member.lastname,
+            self.ingredient.name)
+
+
 class Client_avoid_component(models.Model):
     client = models.ForeignKey(
         'member.Client',
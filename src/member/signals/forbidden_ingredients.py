@@ -0,0 +1,33 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from meal.models import Incompatibility
+from ..models import (Client_avoid_ingredient, Client_forbidden_ingredient,
+                      Restriction)
+
+
+@receiver(
+    post_save,
+    sender=Client_avoid_ingredient,
+    dispatch_uid="post_save.forbid_avoided_ingredient"
+)
+def forbid_avoided_ingredient(sender, instance, **kwargs):
+    Client_forbidden_ingredient.objects.refresh_avoid_ingredient(instance)
+
+
+@receiver(
+    post_save,
+    sender=Restriction,
+    dispatch_uid="post_save.forbid_restricted_ingredients"
+)
+def forbid_restricted_ingredients(sender, instance, **kwargs):
+    Client_forbidden_ingredient.objects.refresh_restriction(instance)
+
+
+@receiver(
+    post_save,
+    sender=Incompatibility,
+    dispatch_uid="post_save.forbid_incompatible_ingredient"
+)
+def forbid_incompatible_ingredient(sender, instance, **kwargs):
+    Client_forbidden_ingredient.objects.refresh_incompatibility(instance)
@@ -3,6 +3,9 @@ import random
 
 from datetime import date, timedelta
 from decimal import Decimal
+from unittest.mock import patch
+
+import numpy
 from django.contrib.auth.models import User
 from django.core.management import call_command
 from django.forms import BaseFormSet
@@ -15,11 +18,12 @@ from member.models import (
     Member, Client, Address,
     Contact, Option, Client_option, Restriction, Route,
     Client_avoid_ingredient, Client_avoid_component,
-    ClientScheduledStatus, Relationship,
+    Client_forbidden_ingredient, ClientScheduledStatus, Relationship,
     CELL, HOME, EMAIL, DAYS_OF_WEEK
 )
 from meal.models import (
-    Restricted_item, Ingredient, Component, COMPONENT_GROUP_CHOICES
+    Restricted_item, Ingredient, Component, Incompatibility,
+    COMPONENT_GROUP_CHOICES
 )
 from order.models import Order
 from member.factories import (
@@ -489,6 +493,53 @@ class ClientMealDefaultWeekTestCase(TestCase):
         ms = self.clientTest.meals_schedule
         self.assertEqual(ms, ())
 
+    def test_client_compiled_meals_schedule(self):
+        """
+        The schedule is compiled once and reused by the properties.
+        """
+        client = Client.objects.prefetch_related(
+            'client_option_set__option').get(pk=self.clientTest.pk)
+        compiled = client.compiled_meals_schedule
+        self.assertEqual(
+            compiled.days, (True, False, True, False, True, False, False))
+        with self.assertNumQueries(0):
+            self.assertIs(client.compiled_meals_schedule, compiled)
+            self.assertEqual(
+                [day for day, items in client.meals_schedule],
+                ['monday', 'wednesday', 'friday'])
+            self.assertTrue(client.is_scheduled_on(0))
+            self.assertFalse(client.is_scheduled_on(1))
+
+    def test_client_compiled_meals_schedule_queries(self):
+        """
+        Without prefetched options, compiling the schedule costs one query.
+        """
+        client = Client.objects.get(pk=self.clientTest.pk)
+        with self.assertNumQueries(1):
+            compiled = client.compiled_meals_schedule
+        with self.assertNumQueries(0):
+            self.assertIs(client.compiled_meals_schedule, compiled)
+            self.assertTrue(client.is_scheduled_on(0))
+
+    def test_client_compiled_meals_schedule_invalidation(self):
+        """
+        Changing the schedule or the meals default recompiles it.
+        """
+        client = Client.objects.get(pk=self.clientTest.pk)
+        self.assertTrue(client.is_scheduled_on(0))
+        client.set_simple_meals_schedule(['tuesday'])
+        self.assertFalse(client.is_scheduled_on(0))
+        self.assertTrue(client.is_scheduled_on(1))
+
+        client.meal_default_week = {'main_dish_tuesday_quantity': 3}
+        client.save()
+        self.assertEqual(
+            dict(client.meals_schedule)['tuesday']['main_dish'], 3)
+        # changed in place, not saved
+        client.meal_default_week['main_dish_tuesday_quantity'] = 2
+        self.assertEqual(
+            dict(client.meals_schedule)['tuesday']['main_dish'], 2)
+
 
 class RestrictionTestCase(TestCase):
 
@@ -557,6 +608,58 @@ class ClientAvoidIngredientTestCase(TestCase):
         self.assertTrue(ingredient.name in str(client_avoid_ingredient))
 
 
+class ClientForbiddenIngredientTestCase(TestCase):
+
+    fixtures = ['routes']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.forbidding_client = ClientFactory()
+        cls.pork = Ingredient.objects.create(name='ground pork')
+        cls.ham = Ingredient.objects.create(name='ham')
+        cls.meat = Restricted_item.objects.create(
+            name='meat', restricted_item_group='meat')
+        Incompatibility.objects.create(
+            restricted_item=cls.meat, ingredient=cls.pork)
+
+    def forbidden(self):
+        return sorted(
+            Client_forbidden_ingredient.objects.filter(
+                client=self.forbidding_client
+            ).values_list('ingredient__name', flat=True))
+
+    def test_avoid_ingredient(self):
+        avoid = Client_avoid_ingredient.objects.create(
+            client=self.forbidding_client, ingredient=self.ham)
+        self.assertEqual(self.forbidden(), ['ham'])
+        avoid.ingredient = self.pork
+        avoid.save()
+        self.assertEqual(self.forbidden(), ['ground pork'])
+        avoid.delete()
+        self.assertEqual(self.forbidden(), [])
+
+    def test_restriction_and_incompatibility(self):
+        restriction = Restriction.objects.create(
+            client=self.forbidding_client, restricted_item=self.meat)
+        self.assertEqual(self.forbidden(), ['ground pork'])
+        incompatibility = Incompatibility.objects.create(
+            restricted_item=self.meat, ingredient=self.ham)
+        self.assertEqual(self.forbidden(), ['ground pork', 'ham'])
+        incompatibility.delete()
+        self.assertEqual(self.forbidden(), ['ground pork'])
+        restriction.delete()
+        self.assertEqual(self.forbidden(), [])
+
+    def test_rebuild(self):
+        Client_avoid_ingredient.objects.create(
+            client=self.forbidding_client, ingredient=self.ham)
+        Restriction.objects.create(
+            client=self.forbidding_client, restricted_item=self.meat)
+        forbidden = self.forbidden()
+        Client_forbidden_ingredient.objects.rebuild()
+        self.assertEqual(self.forbidden(), forbidden)
+
+
 class ClientAvoidComponentTestCase(TestCase):
 
     @classmethod
@@ -3755,6 +3858,122 @@ class RouteGetOptimisedSequenceViewTestCase(SousChefTestMixin, TestCase):
         except (TypeError, ValueError) as e:
             self.fail("Response is not valid JSON.")
 
+    def test_budget(self):
+        route = RouteFactory()
+        ClientFactory.create_batch(10, route=route, status=Client.ACTIVE)
+        self.force_login()
+        url = reverse(
+            'member:route_get_optimised_sequence', kwargs={'pk': route.pk})
+        response = self.client.get(url, {'budget': '0.1'})
+        self.assertEqual(response.status_code, 200)
+        result = json.loads(response.content.decode(response.charset))
+        self.assertEqual(len(result), 10)
+        for budget in ('abc', '-1', '3600', 'nan'):
+            response = self.client.get(url, {'budget': budget})
+            self.assertEqual(response.status_code, 400)
+
+    def test_starts_from_last_delivery(self):
+        route = RouteFactory()
+        clients = ClientFactory.create_batch(
+            12, route=route, status=Client.ACTIVE)
+        self.force_login()
+        url = reverse(
+            'member:route_get_optimised_sequence', kwargs={'pk': route.pk})
+        response = self.client.get(url)
+        sequence = json.loads(response.content.decode(response.charset))
+        # A client was removed from the route since the last delivery
+        DeliveryHistoryFactory(
+            route=route, date=date(2001, 1, 1),
+            client_id_sequence=sequence[1:] + [999999])
+        response = self.client.get(url)
+        result = json.loads(response.content.decode(response.charset))
+        self.assertEqual(sorted(result), sorted(c.pk for c in clients))
+        # An optimal sequence is kept
+        DeliveryHistoryFactory(
+            route=route, date=date(2001, 1, 2),
+            client_id_sequence=sequence)
+        response = self.client.get(url)
+        result = json.loads(response.content.decode(response.charset))
+        self.assertEqual(result, sequence)
+
+
+class RouteInsertClientViewTestCase(SousChefTestMixin, TestCase):
+
+    def setUp(self):
+        self.route = RouteFactory()
+        self.a, self.n, self.b, self.new = ClientFactory.create_batch(
+            4, route=self.route, status=Client.ACTIVE)
+        for client, latitude, longitude in (
+                (self.a, '45.6', '-73.575145'),
+                (self.n, None, None),
+                (self.b, '45.6', '-73.4'),
+                (self.new, '45.6', '-73.5')):
+            client.member.address.latitude = latitude
+            client.member.address.longitude = longitude
+            client.member.address.save()
+        self.route.client_id_sequence = [
+            self.a.pk, self.n.pk, self.b.pk]
+        self.route.save()
+        self.url = reverse('member:route_insert_client', kwargs={
+            'pk': self.route.pk, 'client_pk': self.new.pk})
+
+    def test_redirects_users_who_do_not_have_edit_permission(self):
+        self.assertRedirectsWithAllMethods(self.url)
+
+    def test_get(self):
+        self.force_login()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        result = json.loads(response.content.decode(response.charset))
+        # between a and b, skipping the client not geolocalized
+        self.assertEqual(result['position'], 1)
+        self.assertEqual(result['client_id_sequence'], [
+            self.a.pk, self.new.pk, self.n.pk, self.b.pk])
+        self.assertAlmostEqual(result['distance'], 0, places=3)
+        self.assertEqual(result['unit'], 'km')
+        self.route.refresh_from_db()
+        self.assertEqual(len(self.route.client_id_sequence), 3)
+
+    def test_get_uses_route_costs(self):
+        self.force_login()
+        # travel costs under which the client is best visited last
+        matrix = numpy.full((4, 4), 10, dtype=numpy.float32)
+        numpy.fill_diagonal(matrix, 0)
+        matrix[2, 3] = matrix[3, 2] = matrix[0, 3] = matrix[3, 0] = 1
+        with patch('member.views.get_distance_matrix',
+                   return_value=matrix) as get_distance_matrix:
+            response = self.client.get(self.url)
+        result = json.loads(response.content.decode(response.charset))
+        self.assertEqual(result['client_id_sequence'], [
+            self.a.pk, self.n.pk, self.b.pk, self.new.pk])
+        self.assertAlmostEqual(result['distance'], -8)
+        stops, origin, group, vehicle = get_distance_matrix.call_args[0]
+        self.assertEqual([stop[0] for stop in stops],
+                         [self.a.pk, self.b.pk, self.new.pk])
+        self.assertEqual(group, 'route:{}'.format(self.route.pk))
+        self.assertEqual(vehicle, self.route.vehicle)
+
+    def test_post(self):
+        self.force_login()
+        # the client already in the sequence is moved
+        self.route.client_id_sequence = [
+            self.new.pk, self.a.pk, self.n.pk, self.b.pk]
+        self.route.save()
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.route.refresh_from_db()
+        self.assertEqual(self.route.client_id_sequence, [
+            self.a.pk, self.new.pk, self.n.pk, self.b.pk])
+
+    def test_client_not_on_route_or_not_geolocalized(self):
+        self.force_login()
+        url = reverse('member:route_insert_client', kwargs={
+            'pk': RouteFactory().pk, 'client_pk': self.new.pk})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        url = reverse('member:route_insert_client', kwargs={
+            'pk': self.route.pk, 'client_pk': self.n.pk})
+        self.assertEqual(self.client.post(url).status_code, 400)
+
 
 class RouteDeliveryHistoryDetailViewTestCase(SousChefTestMixin, TestCase):
     fixtures = ['routes.json']
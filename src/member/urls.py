@@ -28,6 +28,7 @@ from member.views import (
     RouteListView,
     RouteDetailView,
     RouteEditView,
+    RouteInsertClientView,
     DeliveryHistoryDetailView,
     get_minimised_euclidean_distances_route_sequence,
 )
@@ -130,6 +131,8 @@ urlpatterns = [
     url(_(r'^route/(?P<pk>\d+)/optimised_sequence/$'),
         get_minimised_euclidean_distances_route_sequence,
         name='route_get_optimised_sequence'),
+    url(_(r'^route/(?P<pk>\d+)/insert_client/(?P<client_pk>\d+)/$'),
+        RouteInsertClientView.as_view(), name='route_insert_client'),
     url(_(r'^route/(?P<route_pk>\d+)/(?P<date>\d{4}-\d{2}-\d{2})/$'),
         DeliveryHistoryDetailView.as_view(), name='delivery_history_detail'),
 ]
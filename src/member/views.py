@@ -21,7 +21,10 @@ from django.utils.translation import ugettext_lazy as _
 from django.views import generic
 from formtools.wizard.views import NamedUrlSessionWizardView
 
-from delivery.views import calculateRoutePointsEuclidean
+from delivery import tsp
+from delivery.cache import get_distance_matrix, get_provider
+from delivery.views import (
+    DELIVERY_STARTING_POINT_LAT_LONG, calculateRoutePointsEuclidean)
 from meal.models import COMPONENT_GROUP_CHOICES, COMPONENT_GROUP_CHOICES_SIDES
 from member.forms import (
     ClientScheduledStatusForm,
@@ -1556,12 +1559,40 @@ class RouteEditView(
         return response
 
 
+def get_last_client_id_sequence(route):
+    """
+    Returns the sequence of client IDs of the last delivery on a route,
+    or the configured sequence of the route if it was never delivered.
+    """
+    delivery_history = route.delivery_histories.order_by('-date').first()
+    if delivery_history is not None and delivery_history.client_id_sequence:
+        return delivery_history.client_id_sequence
+    return route.client_id_sequence or []
+
+
+# Longest time allowed to optimise a route sequence, in seconds.
+MAX_ROUTE_SEQUENCE_BUDGET = 10.0
+
+
 @login_required
 def get_minimised_euclidean_distances_route_sequence(request, pk):
     """
     Return the sequence of clients on the given route that minimises
-    euclidean distances, as a JSON list of client IDs.
+    euclidean distances, as a JSON list of client IDs. The optimisation
+    starts from the sequence of the last delivery on the route (see
+    get_last_client_id_sequence).
+
+    The optional GET parameter `budget` is the time allowed to improve
+    the sequence, in seconds, up to MAX_ROUTE_SEQUENCE_BUDGET.
     """
+    budget = request.GET.get('budget')
+    if budget is not None:
+        try:
+            budget = float(budget)
+        except ValueError:
+            return HttpResponseBadRequest("Invalid budget.")
+        if not 0 <= budget <= MAX_ROUTE_SEQUENCE_BUDGET:
+            return HttpResponseBadRequest("Invalid budget.")
     route = get_object_or_404(Route, pk=pk)
     clients_on_route = get_clients_on_route(route)
     waypoints = list(map(
@@ -1571,13 +1602,97 @@ def get_minimised_euclidean_distances_route_sequence(request, pk):
             'longitude': c.member.address.longitude
         }, clients_on_route
     ))
-    optimised_waypoints = calculateRoutePointsEuclidean(waypoints)
+    optimised_waypoints = calculateRoutePointsEuclidean(
+        waypoints, budget, get_last_client_id_sequence(route),
+        'route:{}'.format(route.pk), route.vehicle)
     return JsonResponse(
         list(map(lambda w: w['id'], optimised_waypoints)),
         safe=False
     )
 
 
+def get_client_insertion(route, client):
+    """
+    Find where to insert a client in the configured sequence of a route,
+    the rest of the sequence being kept (cheapest insertion). The clients
+    of the sequence not geolocalized are ignored.
+
+    The travel costs are those of settings.ROUTE_COST_PROVIDER, from the
+    distance matrix cached for the route (see delivery.cache).
+
+    Returns a tuple (sequence, position, cost): `sequence` is the route
+    sequence with the client inserted at index `position`, lengthening
+    the route by `cost` (in the unit of the provider).
+    """
+    sequence = [
+        pk for pk in (route.client_id_sequence or []) if pk != client.pk]
+    clients = Client.objects.filter(pk__in=sequence).select_related(
+        'member__address').in_bulk()
+    # the sequence indexes of the stops after the starting point
+    indexes = [
+        i for i, pk in enumerate(sequence)
+        if pk in clients and clients[pk].is_geolocalized]
+    stops = []
+    for i in indexes:
+        address = clients[sequence[i]].member.address
+        stops.append((sequence[i], address.latitude, address.longitude))
+    address = client.member.address
+    stops.append((client.pk, address.latitude, address.longitude))
+    matrix = get_distance_matrix(
+        stops, DELIVERY_STARTING_POINT_LAT_LONG,
+        'route:{}'.format(route.pk), route.vehicle)
+    # the starting point, node 0, then the stops in sequence order
+    position, cost = tsp.insertion_cost(
+        list(range(len(indexes) + 1)), len(indexes) + 1, matrix)
+    # insert after the stop preceding the node in the tour
+    position = 0 if position == 1 else indexes[position - 2] + 1
+    sequence.insert(position, client.pk)
+    return sequence, position, cost
+
+
+class RouteInsertClientView(
+        LoginRequiredMixin, PermissionRequiredMixin, generic.View):
+    """
+    Find where a client of a route is best inserted in the route sequence
+    as a JSON object {"client_id_sequence", "position", "distance",
+    "unit"}, the distance being the travel cost added to the route.
+
+    GET only computes the insertion, POST also saves the new sequence.
+    """
+    permission_required = 'sous_chef.edit'
+
+    def get_insertion(self):
+        route = get_object_or_404(Route, pk=self.kwargs['pk'])
+        client = get_object_or_404(
+            Client.objects.select_related('member__address'),
+            pk=self.kwargs['client_pk'], route=route)
+        if not client.is_geolocalized:
+            return route, None
+        return route, get_client_insertion(route, client)
+
+    def get(self, request, *args, **kwargs):
+        route, insertion = self.get_insertion()
+        return self.render_insertion(insertion)
+
+    def post(self, request, *args, **kwargs):
+        route, insertion = self.get_insertion()
+        if insertion is not None:
+            route.client_id_sequence = insertion[0]
+            route.save(update_fields=['client_id_sequence'])
+        return self.render_insertion(insertion)
+
+    def render_insertion(self, insertion):
+        if insertion is None:
+            return HttpResponseBadRequest("Client not geolocalized.")
+        sequence, position, distance = insertion
+        return JsonResponse({
+            'client_id_sequence': sequence,
+            'position': position,
+            'distance': distance,
+            'unit': get_provider().unit,
+        })
+
+
 class DeliveryHistoryDetailView(
         LoginRequiredMixin, PermissionRequiredMixin, generic.DetailView):
     model = DeliveryHistory
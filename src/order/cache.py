@@ -0,0 +1,116 @@
+# Cache of the kitchen count computed for a delivery date.
+#
+# An entry is keyed by the version of its delivery date, changed when
+# the orders, order items, menus or day ingredients of the date change,
+# or what the kitchen count shows about a client having an order on the
+# date, and by the version of the clients, changed when the dishes,
+# ingredients or options shown on every date change (see
+# order/signals/handlers.py). Changing a version makes the
+# previous entries unreachable. Entries, versions and hit/miss counters
+# are in the default Django cache, which must be shared by the processes
+# serving the application.
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+KITCHEN_COUNT_TIMEOUT = 24 * 60 * 60  # seconds
+KITCHEN_COUNT_HITS = 'kitchen_count:hits'
+KITCHEN_COUNT_MISSES = 'kitchen_count:misses'
+CLIENTS_VERSION = 'kitchen_count:version:clients'
+
+
+def date_version_key(delivery_date):
+    return 'kitchen_count:version:{}'.format(delivery_date.isoformat())
+
+
+def get_version(key):
+    """
+    Returns the current version stored under `key`.
+
+    A missing (or evicted) version starts from the current time, so that
+    it never matches the entries cached before. A cache keeping nothing
+    (e.g. a dummy cache) gives a new version on every call.
+    """
+    version = cache.get(key)
+    if version is None:
+        version = int(time.time() * 1000)
+        if not cache.add(key, version, None):
+            # added by another process in between
+            version = cache.get(key, version)
+    return version
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:  # missing key
+        cache.set(key, int(time.time() * 1000), None)
+
+
+def invalidate(key):
+    """
+    Change a version now, for the current transaction, and again once
+    it is committed, so that a kitchen count computed by another process
+    before the commit is not kept.
+    """
+    bump_version(key)
+    transaction.on_commit(lambda: bump_version(key))
+
+
+def invalidate_kitchen_count(delivery_date=None):
+    """
+    Invalidate the kitchen count of a delivery date, or of all the dates
+    if `delivery_date` is None.
+    """
+    if delivery_date is None:
+        invalidate(CLIENTS_VERSION)
+    else:
+        invalidate(date_version_key(delivery_date))
+
+
+def kitchen_count_key(delivery_date):
+    return 'kitchen_count:{}:{}:{}'.format(
+        delivery_date.isoformat(),
+        get_version(date_version_key(delivery_date)),
+        get_version(CLIENTS_VERSION))
+
+
+def increment(key):
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:  # evicted in between
+            cache.set(key, 1, None)
+
+
+def get_kitchen_count(delivery_date, compute):
+    """
+    Returns a tuple (kitchen count, True if it was found in the cache).
+    The kitchen count is computed by `compute(delivery_date)` if it is
+    not in the cache.
+
+    The versions are read before computing, so that a change made while
+    computing leaves the stored value unreachable.
+    """
+    key = kitchen_count_key(delivery_date)
+    value = cache.get(key)
+    if value is None:
+        increment(KITCHEN_COUNT_MISSES)
+        value = compute(delivery_date)
+        cache.set(key, value, KITCHEN_COUNT_TIMEOUT)
+        return value, False
+    increment(KITCHEN_COUNT_HITS)
+    return value, True
+
+
+def kitchen_count_stats():
+    """
+    Returns a dictionary {'hits': int, 'misses': int}.
+    """
+    counters = cache.get_many([KITCHEN_COUNT_HITS, KITCHEN_COUNT_MISSES])
+    return {
+        'hits': counters.get(KITCHEN_COUNT_HITS, 0),
+        'misses': counters.get(KITCHEN_COUNT_MISSES, 0),
+    }
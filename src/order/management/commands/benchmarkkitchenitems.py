@@ -0,0 +1,145 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from meal.models import (Component, Component_ingredient, Incompatibility,
+                         Ingredient, Menu, Menu_component, Restricted_item,
+                         COMPONENT_GROUP_CHOICES_MAIN_DISH,
+                         COMPONENT_GROUP_CHOICES_SIDES)
+from member.models import (Client, Client_avoid_ingredient,
+                           Client_forbidden_ingredient, Client_option,
+                           Member, Option, Restriction, Route,
+                           OPTION_GROUP_CHOICES_PREPARATION)
+from order.models import Order, Order_item
+
+
+BENCHMARK_GROUPS = (COMPONENT_GROUP_CHOICES_MAIN_DISH,
+                    COMPONENT_GROUP_CHOICES_SIDES,
+                    'dessert')
+
+
+class Command(BaseCommand):
+    help = 'Measure Order.get_kitchen_items on generated daily orders. \
+            The generated data is rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'orders',
+            help='The numbers of daily orders to measure.',
+            nargs='*',
+            default=[1000, 5000],
+            type=int
+        )
+        parser.add_argument(
+            '--seed',
+            help='The seed of the random restrictions and preferences.',
+            default=0,
+            type=int
+        )
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        with transaction.atomic():
+            clients = self.create_clients(max(options['orders']))
+            for i, count in enumerate(options['orders']):
+                delivery_date = date(2000, 1, 1) + timedelta(days=i)
+                self.create_orders(delivery_date, clients[:count])
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.time()
+                    kitchen_list = Order.get_kitchen_items(delivery_date)
+                    elapsed = time.time() - start
+                self.stdout.write(
+                    "{0} orders: {1} kitchen items, {2} queries, "
+                    "{3:.3f}s.".format(
+                        count, len(kitchen_list), len(queries), elapsed))
+            transaction.set_rollback(True)
+
+    def create_clients(self, count):
+        """
+        Create `count` clients with a few ingredients to avoid,
+        restrictions and food preparations, and returns their ids.
+        """
+        last_member = Member.objects.order_by('-pk').first()
+        Member.objects.bulk_create(
+            Member(firstname='Client {}'.format(i), lastname='Benchmark')
+            for i in range(count))
+        members = Member.objects.filter(
+            pk__gt=last_member.pk if last_member else 0).order_by('pk')
+
+        route = Route.objects.create(name='Benchmark')
+        last_client = Client.objects.order_by('-pk').first()
+        Client.objects.bulk_create(
+            Client(member=member, billing_member=member, route=route,
+                   status=Client.ACTIVE)
+            for member in members)
+        client_ids = list(Client.objects.filter(
+            pk__gt=last_client.pk if last_client else 0
+        ).order_by('pk').values_list('pk', flat=True))
+
+        ingredients = [
+            Ingredient.objects.create(name='Benchmark ingredient {}'.format(i))
+            for i in range(30)]
+        restricted_items = [
+            Restricted_item.objects.create(
+                name='Benchmark item {}'.format(i),
+                restricted_item_group='other')
+            for i in range(5)]
+        Incompatibility.objects.bulk_create(
+            Incompatibility(restricted_item=item, ingredient=ingredient)
+            for item in restricted_items
+            for ingredient in random.sample(ingredients, 4))
+        preparation = Option.objects.create(
+            name='Benchmark preparation',
+            option_group=OPTION_GROUP_CHOICES_PREPARATION)
+
+        Client_avoid_ingredient.objects.bulk_create(
+            Client_avoid_ingredient(client_id=client_id, ingredient=ingredient)
+            for client_id in client_ids if random.random() < 0.2
+            for ingredient in random.sample(ingredients, 2))
+        Restriction.objects.bulk_create(
+            Restriction(client_id=client_id, restricted_item=item)
+            for client_id in client_ids if random.random() < 0.2
+            for item in random.sample(restricted_items, 2))
+        Client_option.objects.bulk_create(
+            Client_option(client_id=client_id, option=preparation)
+            for client_id in client_ids if random.random() < 0.05)
+        # bulk_create does not send the signals materializing them.
+        Client_forbidden_ingredient.objects.rebuild()
+        self.ingredients = ingredients
+        return client_ids
+
+    def create_orders(self, delivery_date, client_ids):
+        """
+        Create the menu of the day and an order of a main dish,
+        sides and dessert for every client.
+        """
+        menu = Menu.objects.create(date=delivery_date)
+        for group in BENCHMARK_GROUPS:
+            component = Component.objects.create(
+                name='Benchmark {} {}'.format(group, delivery_date),
+                component_group=group)
+            Menu_component.objects.create(menu=menu, component=component)
+            Component_ingredient.objects.bulk_create(
+                Component_ingredient(component=component,
+                                     ingredient=ingredient,
+                                     date=delivery_date)
+                for ingredient in random.sample(self.ingredients, 5))
+
+        last_order = Order.objects.order_by('-pk').first()
+        Order.objects.bulk_create(
+            Order(client_id=client_id, delivery_date=delivery_date)
+            for client_id in client_ids)
+        Order_item.objects.bulk_create(
+            Order_item(order_id=order_id, price=0, billable_flag=True,
+                       size=random.choice('RL'),
+                       order_item_type='meal_component',
+                       total_quantity=random.choice([1, 1, 1, 2]),
+                       component_group=group)
+            for order_id in Order.objects.filter(
+                pk__gt=last_order.pk if last_order else 0
+            ).values_list('pk', flat=True)
+            for group in BENCHMARK_GROUPS)
@@ -1,13 +1,41 @@
+import collections
+import multiprocessing
+import time
 from django.core.management.base import BaseCommand
+from django.db import connection, connections
 from order.models import Order
-from member.models import Client
+from member.models import Client, DAYS_OF_WEEK
 from datetime import datetime, timedelta
 from django.contrib.admin.models import LogEntry, ADDITION, CHANGE
 
 
+# Clients scheduled on each weekday, set in every worker process.
+_clients_by_day = None
+
+
+def init_worker(clients_by_day):
+    global _clients_by_day
+    _clients_by_day = clients_by_day
+
+
+def create_orders(delivery_date):
+    """
+    Create the orders of one delivery date for the clients scheduled on
+    that weekday. Returns (delivery_date, number of orders, seconds).
+    """
+    start = time.time()
+    day = DAYS_OF_WEEK[delivery_date.weekday()][0]
+    orders = Order.objects.auto_create_orders(
+        delivery_date, _clients_by_day.get(day, []), bulk=True
+    )
+    return delivery_date, len(orders), time.time() - start
+
+
 class Command(BaseCommand):
     help = 'Create new orders for a given delivery date for all\
-            ongoing active clients using their meals defaults.'
+            ongoing active clients using their meals defaults. The\
+            orders of each date are committed on their own: if a date\
+            fails, the orders of the dates already created are kept.'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -23,22 +51,54 @@ class Command(BaseCommand):
             default=1,
             type=int
         )
+        parser.add_argument(
+            '--processes',
+            help=(
+                'The number of worker processes creating the orders of '
+                'different dates in parallel, each one with its own '
+                'database connection.'
+            ),
+            default=1,
+            type=int
+        )
 
     def handle(self, *args, **options):
         start_date = datetime.strptime(
             options['delivery_date'], '%Y-%m-%d'
         ).date()
         days = options['days']
+        processes = options['processes']
+        start = time.time()
 
-        # Only active ongoing clients can receive orders
-        clients = Client.ongoing.all()
+        # Only active ongoing clients can receive orders.
+        # Load their schedules once and expand them over the weekdays.
+        clients_by_day = collections.defaultdict(list)
+        for client in Client.ongoing.prefetch_related(
+                'client_option_set__option'):
+            for weekday, (day, label) in enumerate(DAYS_OF_WEEK):
+                if client.is_scheduled_on(weekday):
+                    clients_by_day[day].append(client)
 
-        for i in range(days):
-            # Create the orders
-            delivery_date = start_date + timedelta(days=i)
-            orders = Order.objects.auto_create_orders(
-                delivery_date, clients
-            )
+        delivery_dates = [start_date + timedelta(days=i) for i in range(days)]
+        if connection.vendor == 'sqlite':
+            # SQLite does not support concurrent writers.
+            processes = 1
+        if processes > 1 and len(delivery_dates) > 1:
+            # Forked workers must not share the parent's connection.
+            connections.close_all()
+            pool = multiprocessing.Pool(
+                min(processes, len(delivery_dates)),
+                initializer=init_worker, initargs=(dict(clients_by_day),))
+            try:
+                results = pool.map(create_orders, delivery_dates)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            init_worker(clients_by_day)
+            results = [create_orders(d) for d in delivery_dates]
+
+        for delivery_date, count, elapsed in results:
             # Log the execution
             LogEntry.objects.log_action(
                 user_id=1, content_type_id=1,
@@ -46,6 +106,13 @@ class Command(BaseCommand):
                     delivery_date.strftime('%Y-%m-%d %H:%M')),
                 action_flag=ADDITION,
             )
-            print("{0} orders created on {1}: to be delivered on {2}.".format(
-                len(orders), start_date, delivery_date
+            self.stdout.write(
+                "{0} orders created on {1}: to be delivered on {2} "
+                "({3:.2f}s).".format(
+                    count, start_date, delivery_date, elapsed
+                ))
+        self.stdout.write(
+            "{0} orders created for {1} day(s) in {2:.2f}s.".format(
+                sum(count for _, count, _ in results),
+                len(results), time.time() - start
             ))
@@ -1,8 +1,7 @@
 import collections
 from datetime import date, datetime
-import re
 
-from django.db import models, connection, transaction
+from django.db import models, transaction
 from django.db.models import Q
 from django.utils.translation import ugettext_lazy as _
 from django_filters import FilterSet, ChoiceFilter, CharFilter
@@ -13,6 +12,7 @@ from member.models import (Client, Member, Route, DAYS_OF_WEEK,
                            RATE_TYPE_LOW_INCOME, RATE_TYPE_SOLIDARY,
                            Address, Option, Client_option, Restriction,
                            Client_avoid_ingredient, Client_avoid_component,
+                           Client_forbidden_ingredient,
                            OPTION_GROUP_CHOICES_PREPARATION)
 from meal.models import (Menu, Menu_component, Component,
                          Restricted_item, Ingredient,
@@ -20,6 +20,7 @@ from meal.models import (Menu, Menu_component, Component,
                          COMPONENT_GROUP_CHOICES,
                          COMPONENT_GROUP_CHOICES_MAIN_DISH,
                          COMPONENT_GROUP_CHOICES_SIDES)
+from order.cache import invalidate_kitchen_count
 
 
 ORDER_STATUS = (
@@ -108,6 +109,16 @@ class OrderManager(models.Manager):
             client__status=Client.ACTIVE,
             **extra_kwargs)
 
+    def get_upcoming_delivery_dates(self, clients):
+        """
+        Return the distinct delivery dates, from today on, of the orders
+        of the given clients (a queryset of clients or a list of ids).
+        """
+        return self.get_queryset().filter(
+            client__in=clients,
+            delivery_date__gte=date.today()
+        ).order_by().values_list('delivery_date', flat=True).distinct()
+
     def get_billable_orders(self, year, month):
         """
         Return the orders that have successfully delivered during
@@ -147,7 +158,7 @@ class OrderManager(models.Manager):
 
         return {'main': main_price, 'side': side_price}
 
-    def auto_create_orders(self, delivery_date, clients):
+    def auto_create_orders(self, delivery_date, clients, bulk=False):
         """
         Automatically creates orders and order items for the given delivery
         date and given client list.
@@ -156,14 +167,16 @@ class OrderManager(models.Manager):
         Parameters:
           delivery_date : date on which orders are to be delivered
           clients : a list of one or many client objects
+          bulk : if True, use `bulk_auto_create_orders` which creates all
+                 the orders and order items with a fixed number of queries
 
         Returns:
           Created orders.
         """
+        if bulk:
+            return self.bulk_auto_create_orders(delivery_date, clients)
+
         created_orders = []
-        messages = []
-        weekday = delivery_date.weekday()  # Monday is 0, Sunday is 6
-        day = DAYS_OF_WEEK[weekday][0]     # 0 -> 'monday', 6 -> 'sunday'
         for client in clients:
             try:
                 order = Order.objects.get(client=client,
@@ -172,28 +185,13 @@ class OrderManager(models.Manager):
                 continue
             except Order.DoesNotExist:
                 # If no order for this client/date, create it and attach items
-                items = dict(client.meals_schedule).get(day, None)
-
-                # Skip this client if no scheduled delivery
-                if items is None:
-                    continue
-
-                filtered_items = {
-                    k: v for k, v in items.items() if v is not None
-                }
+                individual_items = self.get_scheduled_items(
+                    client, delivery_date)
 
                 # Skip this client if nothing to order
-                if not filtered_items:
+                if individual_items is None:
                     continue
 
-                individual_items = {}
-                for key, value in filtered_items.items():
-                    if 'size' in key:
-                        replaced_key = key + '_default'
-                    else:
-                        replaced_key = key + '_default_quantity'
-                    individual_items[replaced_key] = value
-
                 prices = self.get_client_prices(client)
                 order = self.create_order(
                     delivery_date, client, individual_items, prices
@@ -202,6 +200,125 @@ class OrderManager(models.Manager):
                 created_orders.append(order)
         return created_orders
 
+    @transaction.atomic
+    def bulk_auto_create_orders(self, delivery_date, clients,
+                                batch_size=500):
+        """
+        Set-based equivalent of `auto_create_orders`.
+
+        The existing orders of the delivery date are fetched in one query,
+        then every new order and order item is built in memory and written
+        with batched `bulk_create`, inside a single transaction.
+
+        Parameters:
+          delivery_date : date on which orders are to be delivered
+          clients : a list or a queryset of one or many client objects
+          batch_size : maximum number of rows per INSERT statement
+
+        Returns:
+          Created orders, in the same order as `auto_create_orders` would
+          return them (existing orders of the date included). A client
+          listed twice gets a single order, returned twice.
+
+        Raises:
+          Order.MultipleObjectsReturned, before creating anything, if a
+          client already has several orders on the delivery date, as
+          `auto_create_orders` does when it reaches that client.
+        """
+        if hasattr(clients, 'prefetch_related'):
+            # Avoid one meals schedule query per client
+            clients = clients.prefetch_related('client_option_set__option')
+        clients = list(clients)
+
+        existing_orders = collections.defaultdict(list)
+        for order in Order.objects.filter(delivery_date=delivery_date):
+            existing_orders[order.client_id].append(order)
+        for client in clients:
+            if len(existing_orders.get(client.pk, ())) > 1:
+                raise Order.MultipleObjectsReturned(
+                    "The client {} has {} orders on {}.".format(
+                        client.pk, len(existing_orders[client.pk]),
+                        delivery_date))
+        existing_orders = {
+            client_id: orders[0]
+            for client_id, orders in existing_orders.items()}
+
+        new_orders = []
+        scheduled_items = {}
+        for client in clients:
+            # a client listed twice is ordered for once
+            if client.pk in existing_orders or client.pk in scheduled_items:
+                continue
+            individual_items = self.get_scheduled_items(
+                client, delivery_date)
+            # Skip this client if nothing to order
+            if individual_items is None:
+                continue
+            scheduled_items[client.pk] = individual_items
+            new_orders.append(
+                Order(client=client, delivery_date=delivery_date))
+
+        if new_orders:
+            self.bulk_create(new_orders, batch_size=batch_size)
+            # Only some database backends set the primary key on
+            # bulk_create, fetch the missing ones: the clients of the new
+            # orders had no order on the date, they have exactly one now.
+            if any(order.pk is None for order in new_orders):
+                order_ids = dict(Order.objects.filter(
+                    delivery_date=delivery_date
+                ).values_list('client_id', 'pk'))
+                for order in new_orders:
+                    order.pk = order_ids[order.client_id]
+
+            order_items = []
+            for order in new_orders:
+                order_items.extend(self.build_order_items(
+                    order, scheduled_items[order.client_id],
+                    self.get_client_prices(order.client)))
+            Order_item.objects.bulk_create(
+                order_items, batch_size=batch_size)
+            # bulk_create does not send signals
+            invalidate_kitchen_count(delivery_date)
+
+        created_orders = []
+        new_orders = {order.client_id: order for order in new_orders}
+        for client in clients:
+            order = existing_orders.get(client.pk) or new_orders.get(client.pk)
+            if order is not None:
+                order.client = client
+                created_orders.append(order)
+        return created_orders
+
+    def get_scheduled_items(self, client, delivery_date):
+        """
+        Return the items scheduled by the client for the given delivery
+        date, formatted as expected by `create_order`, or None if the
+        client has nothing to order on that day.
+        """
+        weekday = delivery_date.weekday()  # Monday is 0, Sunday is 6
+
+        # No scheduled delivery
+        if not client.is_scheduled_on(weekday):
+            return None
+
+        items = client.compiled_meals_schedule.day_items(weekday)
+        filtered_items = {
+            k: v for k, v in items.items() if v is not None
+        }
+
+        # Nothing to order
+        if not filtered_items:
+            return None
+
+        individual_items = {}
+        for key, value in filtered_items.items():
+            if 'size' in key:
+                replaced_key = key + '_default'
+            else:
+                replaced_key = key + '_default_quantity'
+            individual_items[replaced_key] = value
+        return individual_items
+
     def create_batch_orders(self, delivery_dates, client, items,
                             override_dates=[], return_created_orders=False):
         created_orders = []
@@ -260,6 +377,21 @@ class OrderManager(models.Manager):
         """
         order = Order.objects.create(client=client,
                                      delivery_date=delivery_date)
+        Order_item.objects.bulk_create(
+            self.build_order_items(order, items, prices))
+        # bulk_create does not send signals
+        invalidate_kitchen_count(delivery_date)
+        return order
+
+    def build_order_items(self, order, items, prices):
+        """
+        Build, without saving them, the order items of an order for given
+        items and prices. (See `create_order` for the format of items.)
+
+        Returns:
+          A list of unsaved Order_item objects.
+        """
+        order_items = []
         free_side_dishes = items.get('main_dish_default_quantity') or 0
 
         for component_group, trans in COMPONENT_GROUP_CHOICES:
@@ -281,52 +413,56 @@ class OrderManager(models.Manager):
                     if items['size_default'] == 'L':
                         price += item_qty * prices['side']
                     # main dish
-                    Order_item.objects.create(
+                    order_items.append(Order_item(
                         size=items['size_default'],
                         total_quantity=item_qty,
                         price=price,
                         billable_flag=True,
-                        **common_kwargs)
+                        **common_kwargs))
                 else:
                     # side dish: deduct+billable
                     deduct = min(free_side_dishes, item_qty)
                     free_side_dishes -= deduct
                     if deduct > 0:
                         # free side dishes
-                        Order_item.objects.create(
+                        order_items.append(Order_item(
                             size=None,
                             total_quantity=deduct,
                             price=deduct * prices['side'],
                             billable_flag=False,
-                            **common_kwargs)
+                            **common_kwargs))
 
                     billable = item_qty - deduct
                     if billable > 0:
                         # billable side dishes
-                        Order_item.objects.create(
+                        order_items.append(Order_item(
                             size=None,
                             total_quantity=billable,
                             price=billable * prices['side'],
                             billable_flag=True,
-                            **common_kwargs)
+                            **common_kwargs))
 
         for order_item_type, trans in ORDER_ITEM_TYPE_CHOICES:
             if order_item_type != ORDER_ITEM_TYPE_CHOICES_COMPONENT:
                 additional = items.get('{0}_default'.format(order_item_type))
                 if additional:
-                    Order_item.objects.create(
+                    order_items.append(Order_item(
                         order=order,
                         price=0,
                         billable_flag=False,
-                        order_item_type=order_item_type)
+                        order_item_type=order_item_type))
 
-        return order
+        return order_items
 
     """
     Allow changing status of multiple orders at once.
     """
     def update_orders_status(self, orders, new):
+        delivery_dates = set(orders.values_list('delivery_date', flat=True))
         count = orders.update(status=new)
+        # update does not send signals
+        for delivery_date in delivery_dates:
+            invalidate_kitchen_count(delivery_date)
         return count
 
 
@@ -443,89 +579,95 @@ class Order(models.Model):
             A dictionary where the key is an Integer 'client id' and
             the value is a KitchenItem named tuple.
         """
+        day = kitchen_day(delivery_date)
         kitchen_list = {}
 
-        # Day's avoid ingredients clashes.
-        for row in day_avoid_ingredient(delivery_date):
-            check_for_new_client(kitchen_list, row)
-            if (row.oiorderid and row.menucompid and
-                    row.component_group == COMPONENT_GROUP_CHOICES_MAIN_DISH):
-                # found avoid ingredient clash in main dish
-                # should be a sorted set (or ordered dict ?)
-                kitchen_list[row.cid].incompatible_ingredients.append(
-                    row.ingredient)
-            # we Know that it is not incompatible with main dish
-            if (row.oiorderid and row.menucompid and
-                    row.component_group == COMPONENT_GROUP_CHOICES_SIDES and
-                    row.ingredient not in
-                    kitchen_list[row.cid].sides_clashes):
-                # found new avoid ingredient clash in sides
-                kitchen_list[row.cid].sides_clashes.append(
-                    row.ingredient)
-            if (row.ingredient not in
-                    kitchen_list[row.cid].avoid_ingredients):
-                # remember ingredient to avoid
-                kitchen_list[row.cid].avoid_ingredients.append(
-                    row.ingredient)
-
-        # Day's restrictions.
-        for row in day_restrictions(delivery_date):
-            check_for_new_client(kitchen_list, row)
-            if (row.oiorderid and row.menucompid and
-                    row.component_group == COMPONENT_GROUP_CHOICES_MAIN_DISH):
-                # found restriction clash in main dish
-                # should be a sorted set
-                kitchen_list[row.cid].incompatible_ingredients.append(
-                    row.ingredient)
-            if (row.oiorderid and row.menucompid and
-                    row.component_group == COMPONENT_GROUP_CHOICES_SIDES and
-                    row.restricted_item not in
-                    kitchen_list[row.cid].sides_clashes):
-                # found new restriction clash in sides
-                kitchen_list[row.cid].sides_clashes.append(
-                    row.restricted_item)
-            if (row.restricted_item not in
-                    kitchen_list[row.cid].restricted_items):
-                # remember restricted_item
-                kitchen_list[row.cid].restricted_items.append(
-                    row.restricted_item)
+        # Orders are visited in the order in which the clients have
+        # always been listed: by client id for the ingredients clashes,
+        # by client name for the preparations and the delivery items.
+        by_client_id = day.orders
+        by_client_name = sorted(
+            day.orders, key=lambda o: (o.lastname, o.firstname))
+
+        # Day's avoid ingredients clashes (needs a menu for the day).
+        for order in (by_client_id if day.menu_ids else ()):
+            ingredients = day.avoid_ingredients.get(order.client_id)
+            if not ingredients:
+                continue
+            item = kitchen_record(kitchen_list, order)
+            clashes = (day.forbidden_ingredients[order.client_id] &
+                       day.clashing_ingredients)
+            for ingredient_id, ingredient in ingredients:
+                if ingredient_id in clashes:
+                    item.incompatible_ingredients.extend(
+                        [ingredient] * (order.main_dish_items *
+                                        day.main_dish_clashes[ingredient_id]))
+                    if (ingredient_id in day.sides_clashes and
+                            order.sides_items and
+                            ingredient not in item.sides_clashes):
+                        item.sides_clashes.append(ingredient)
+                if ingredient not in item.avoid_ingredients:
+                    item.avoid_ingredients.append(ingredient)
+
+        # Day's restrictions (needs a menu for the day).
+        for order in (by_client_id if day.menu_ids else ()):
+            restrictions = day.restrictions.get(order.client_id)
+            if not restrictions:
+                continue
+            item = kitchen_record(kitchen_list, order)
+            clashes = (day.forbidden_ingredients[order.client_id] &
+                       day.clashing_ingredients)
+            for restriction_id, restricted_item in restrictions:
+                for ingredient_id, ingredient in \
+                        day.incompatibilities.get(restriction_id, ()):
+                    if ingredient_id not in clashes:
+                        continue
+                    item.incompatible_ingredients.extend(
+                        [ingredient] * (order.main_dish_items *
+                                        day.main_dish_clashes[ingredient_id]))
+                    if (ingredient_id in day.sides_clashes and
+                            order.sides_items and
+                            restricted_item not in item.sides_clashes):
+                        item.sides_clashes.append(restricted_item)
+                if restricted_item not in item.restricted_items:
+                    item.restricted_items.append(restricted_item)
 
         # Day's preparations.
-        for row in day_preparations(delivery_date):
-            check_for_new_client(kitchen_list, row)
-            # should be a sorted set
-            # found client with food preparation
-            kitchen_list[row.cid].preparation.append(row.food_prep)
+        for order in by_client_name:
+            preparations = day.preparations.get(order.client_id)
+            if not preparations or not order.main_dish_items:
+                continue
+            item = kitchen_record(kitchen_list, order)
+            item.preparation.extend(preparations * order.main_dish_items)
 
         # Day's Delivery Items, Components summary and Data for all labels.
-        for row in day_delivery_items(delivery_date):
-            check_for_new_client(kitchen_list, row)
-            if row.component_group == COMPONENT_GROUP_CHOICES_MAIN_DISH:
-                kitchen_list[row.cid] = kitchen_list[row.cid]._replace(
-                    meal_qty=(kitchen_list[row.cid].meal_qty +
-                              row.total_quantity),
-                    meal_size=row.size)
-            old_component = \
-                kitchen_list[row.cid].meal_components.get(row.component_group)
-            if old_component:
-                # component group already exists in the order
-                kitchen_list[row.cid].meal_components[row.component_group] = \
-                    old_component._replace(
-                        qty=old_component.qty + (row.total_quantity or 0))
-            else:
-                # new component group for this order
-                kitchen_list[row.cid].meal_components[row.component_group] = \
-                    MealComponent(id=row.component_id,
-                                  name=row.component_name,
-                                  qty=row.total_quantity or 0)
-            kitchen_list[row.cid] = kitchen_list[row.cid]._replace(
-                routename=row.routename)
+        for order in by_client_name:
+            if order.routename is None:
+                continue
+            for component_group, total_quantity, size in order.items:
+                for component_id, component_name in \
+                        day.menu_components.get(component_group, ()):
+                    item = kitchen_record(kitchen_list, order)
+                    if component_group == COMPONENT_GROUP_CHOICES_MAIN_DISH:
+                        item.meal_qty += total_quantity or 0
+                        item.meal_size = size
+                    component = item.meal_components.get(component_group)
+                    if component:
+                        # component group already exists in the order
+                        component[2] += total_quantity or 0
+                    else:
+                        # new component group for this order
+                        item.meal_components[component_group] = [
+                            component_id, component_name,
+                            total_quantity or 0]
+                    item.routename = order.routename
 
         # Sort requirements list in each value.
-        for value in kitchen_list.values():
-            value.incompatible_ingredients.sort()
-            value.restricted_items.sort()
-            value.preparation.sort()
+        for client_id, item in kitchen_list.items():
+            item.incompatible_ingredients.sort()
+            item.restricted_items.sort()
+            item.preparation.sort()
+            kitchen_list[client_id] = item.kitchen_item()
 
         return kitchen_list
 
@@ -535,6 +677,27 @@ class Order(models.Model):
         Get all delivery order specifics for delivery date and route.
         Exclude non-geolocalized clients.
 
+        See get_delivery_lists.
+
+        Args:
+            delivery_date: A datetime.date object, the date on which
+                the meals will be delivered to the clients.
+            route_id: An integer, the is of the route for which the
+                delivery list must be produced.
+
+        Returns:
+            A dictionary where the key is an Integer 'client id' and
+            the value is a DeliveryClient object.
+        """
+        return Order.get_delivery_lists(
+            delivery_date, [route_id]).get(route_id, {})
+
+    @staticmethod
+    def get_delivery_lists(delivery_date, route_ids):
+        """
+        Get all delivery order specifics for delivery date and routes,
+        in a fixed number of queries. Exclude non-geolocalized clients.
+
         For each client that has ordered a meal for 'delivery_date'
         and that belongs to the route specified, find all the
         information needed to generate the Route Sheet. This
@@ -544,90 +707,98 @@ class Order(models.Model):
         Args:
             delivery_date: A datetime.date object, the date on which
                 the meals will be delivered to the clients.
-            route_id: An integer, the is of the route for which the
-                delivery list must be produced.
+            route_ids: A list of the ids of the routes for which the
+                delivery lists must be produced.
 
         Returns:
-            A dictionary where the key is an Integer 'client id' and
-            the value is a DeliveryClient object.
+            A dictionary where the key is an Integer 'route id' and the
+            value is the delivery list of the route: a dictionary where
+            the key is an Integer 'client id' and the value is a
+            DeliveryClient object. Routes without deliveries are missing.
         """
         orditms = Order_item.objects.\
             select_related('order__client__member__address').\
+            prefetch_related('order__client__member__member_contact').\
             exclude(
                 order__status=ORDER_STATUS_CANCELLED,
             ).\
             filter(
                 order__delivery_date=delivery_date,
-                order__client__route__id=route_id
+                order__client__route__id__in=route_ids
             ).\
             order_by('order__client_id')
 
-        route_list = {}
+        # translated name of each component group
+        component_group_names = dict(COMPONENT_GROUP_CHOICES)
+        route_lists = {}
+        # position of (client id, component group) in the delivery items
+        item_positions = {}
+        # ids of the orders including a bill
+        bills = set()
         for oi in orditms:
-            if oi.order.client.is_geolocalized is False:
+            client = oi.order.client
+            if client.is_geolocalized is False:
                 # exclude non-geolocalized client
                 continue
-            if not route_list.get(oi.order.client.id):
+            if oi.is_a_client_bill:
+                bills.add(oi.order_id)
+            route_list = route_lists.setdefault(client.route_id, {})
+            delivery_client = route_list.get(client.id)
+            if delivery_client is None:
                 # found new client
-                route_list[oi.order.client.id] = DeliveryClient(
-                    oi.order.client.member.firstname,
-                    oi.order.client.member.lastname,
-                    oi.order.client.member.address.number,
-                    oi.order.client.member.address.street,
-                    oi.order.client.member.address.apartment,
-                    (oi.order.client.member.home_phone or
-                     oi.order.client.member.cell_phone),
-                    oi.order.client.delivery_note,
+                delivery_client = route_list[client.id] = DeliveryClient(
+                    client.member.firstname,
+                    client.member.lastname,
+                    client.member.address.number,
+                    client.member.address.street,
+                    client.member.address.apartment,
+                    client.member.home_phone or client.member.cell_phone,
+                    client.delivery_note,
                     delivery_items=[],
-                    order_id=oi.order.id,
-                    include_a_bill=oi.order.includes_a_bill)
+                    order_id=oi.order_id,
+                    include_a_bill=False)
             # found new delivery item for client
             if (oi.order_item_type == ORDER_ITEM_TYPE_CHOICES_COMPONENT and
                     oi.component_group):
                 # found a meal_component with proper component_group
-                for j in range(
-                        len(route_list[oi.order.client.id].delivery_items)):
-                    if (route_list[oi.order.client.id].delivery_items[j].
-                            component_group == oi.component_group):
-                        # existing component_group in this order
-                        old_quantity = route_list[oi.order.client.id]. \
-                            delivery_items[j].total_quantity
-                        old_remark = route_list[oi.order.client.id]. \
-                            delivery_items[j].remark
-                        if old_remark != '':
-                            old_remark = old_remark + '; '
-                        route_list[oi.order.client.id].delivery_items[j] = \
-                            route_list[oi.order.client.id].delivery_items[j]. \
-                            _replace(
-                                # cumulate quantities
-                                total_quantity=(
-                                    old_quantity + (oi.total_quantity or 0)),
-                                # concatenate order item remarks
-                                remark=(
-                                    old_remark + (oi.remark or '')))
-                        break
-                else:
+                delivery_items = delivery_client.delivery_items
+                key = client.id, oi.component_group
+                j = item_positions.get(key)
+                if j is None:
                     # new component_group in this order
-                    route_list[oi.order.client.id].delivery_items.append(
-                        DeliveryItem(
-                            oi.component_group,
-                            # find the translated name of the component group
-                            next(cg for cg in COMPONENT_GROUP_CHOICES
-                                 if cg[0] == oi.component_group)[1],
-                            oi.total_quantity or 0,
-                            oi.order_item_type,
-                            oi.remark or '',
-                            size=(
-                                oi.size if
-                                oi.component_group == (
-                                    COMPONENT_GROUP_CHOICES_MAIN_DISH
-                                ) else '')))
-
-        # Sort delivery items for each client
-        for client in route_list.values():
-            client.delivery_items.sort(key=component_group_sorting)
-
-        return route_list
+                    item_positions[key] = len(delivery_items)
+                    delivery_items.append(DeliveryItem(
+                        oi.component_group,
+                        component_group_names[oi.component_group],
+                        oi.total_quantity or 0,
+                        oi.order_item_type,
+                        oi.remark or '',
+                        size=(
+                            oi.size if
+                            oi.component_group == (
+                                COMPONENT_GROUP_CHOICES_MAIN_DISH
+                            ) else '')))
+                else:
+                    # existing component_group in this order
+                    old_remark = delivery_items[j].remark
+                    if old_remark != '':
+                        old_remark = old_remark + '; '
+                    delivery_items[j] = delivery_items[j]._replace(
+                        # cumulate quantities
+                        total_quantity=(
+                            delivery_items[j].total_quantity +
+                            (oi.total_quantity or 0)),
+                        # concatenate order item remarks
+                        remark=old_remark + (oi.remark or ''))
+
+        # Sort delivery items for each client, and flag the bills
+        for route_list in route_lists.values():
+            for client_id, client in route_list.items():
+                client.delivery_items.sort(key=component_group_sorting)
+                route_list[client_id] = client._replace(
+                    include_a_bill=client.order_id in bills)
+
+        return route_lists
 
     @property
     def includes_a_bill(self):
@@ -663,308 +834,147 @@ class Order(models.Model):
 # Order.get_kitchen_items helper functions.
 
 
-def named_tuple_fetchall(cursor):
-    """Fetch all rows from a database 'cursor', returning namedtuples.
-
-    Args:
-        cursor: A database cursor object on which a query was executed.
-
-    Returns:
-        A list of named tuples, each one being a row fetched from the cursor.
-        Each column of the cursor becomes an attribute of the named tuple.
-    """
-    desc = cursor.description
-    nt_row = collections.namedtuple('Row', [col[0] for col in desc])
-    return [nt_row(*row) for row in cursor.fetchall()]
-
-
-def sql_prep(query, valuesdict):
-    """Prepare SQL 'query' by matching its parameters with given 'values'.
-
-    Find parameters %(name)s in 'query' and replace them with a %s placeholder
-    then build an ordered list of corresponding values.
+KitchenOrder = collections.namedtuple(        # Order of the day.
+    'KitchenOrder',
+    ['client_id',
+     'lastname',                     # Client's lastname
+     'firstname',                    # Client's firstname
+     'routename',                    # Name of Client's route or None
+     'items',                        # (component group, quantity, size)
+     'main_dish_items',              # Number of main dish order items
+     'sides_items'])                 # Number of items matching the sides
+
+
+KitchenDay = collections.namedtuple(          # All the day's kitchen data.
+    'KitchenDay',
+    ['orders',                       # KitchenOrders ordered by client id
+     'menu_ids',                     # Ids of the day's menus
+     'menu_components',              # {group: [(component id, name)]}
+     'main_dish_clashes',            # {ingredient id: main dish components}
+     'sides_clashes',                # Ingredient ids of the day's sides
+     'clashing_ingredients',         # Ingredient ids of the day's clashes
+     'forbidden_ingredients',        # {client id: {ingredient id}}
+     'avoid_ingredients',            # {client id: [(id, name)]}
+     'restrictions',                 # {client id: [(id, restricted item)]}
+     'incompatibilities',            # {restriction id: [(id, name)]}
+     'preparations'])                # {client id: [option name]}
+
+
+def kitchen_day(delivery_date):
+    """Load everything needed to build the day's KitchenItems.
+
+    Each table is read once with a narrow query, and the ingredients of
+    the day's menu components are indexed so that the clashes of a
+    client can be found without going back to the database.
 
     Args:
-        query: A string, the SQL query containing parameters like %(name)s.
-        valuesdict: A dictionary of parameter values : {'name': value, ...}.
+        delivery_date: A datetime.date object, the date on which the meals
+            will be delivered to the clients.
 
     Returns:
-        A tuple of two values, (the modified query string, a list of values to
-        pass to the query). For example :
-
-        >>> sql_prep('this is %(one)s a trial of %(two)s changes %(one)s end',
-                     {'one': 10, 'two': 'twenty'})
-        ('this is %s a trial of %s changes %s end', [10, 'twenty', 10])
-
-    Raises:
-        Exception: A parameter in the query does not have a matching value.
+        A KitchenDay named tuple.
     """
-    # Get all the substrings that match the regex
-    subs = [(m.start(), m.end(), m.group(0))
-            for m in re.finditer(r"%\(\w+\)s", query)]
-    # print("subs", subs)  # DEBUG
-    mod = []    # list of segments of new query
-    pos = 0     # start of non-matching text in old query
-    names = []  # parameter names found in old query
-    for sta, end, grp in subs:
-        mod.append(query[pos:sta])  # add text before match
-        mod.append("%s")            # new placeholder
-        pos = end                   # next non-matching text
-        names.append(grp[2:-2])     # extract name in %(name)s
-    mod.append(query[pos:])  # add tail of old query
-    values = []
-    for n in names:
-        val = valuesdict.get(n)
-        if val:
-            values.append(val)
+    orders = Order.objects.filter(
+        delivery_date=delivery_date
+    ).exclude(status=ORDER_STATUS_CANCELLED)
+    client_ids = orders.values('client_id')
+
+    items = collections.defaultdict(list)
+    for order_id, component_group, total_quantity, size in \
+            Order_item.objects.filter(
+                order__in=orders, component_group__isnull=False
+            ).order_by('id').values_list(
+                'order_id', 'component_group', 'total_quantity', 'size'):
+        items[order_id].append((component_group, total_quantity, size))
+
+    kitchen_orders = []
+    for order_id, client_id, lastname, firstname, routename in \
+            orders.order_by('client_id', 'id').values_list(
+                'id', 'client_id', 'client__member__lastname',
+                'client__member__firstname', 'client__route__name'):
+        groups = [group for group, _, _ in items[order_id]]
+        main_dish_items = groups.count(COMPONENT_GROUP_CHOICES_MAIN_DISH)
+        kitchen_orders.append(KitchenOrder(
+            client_id, lastname, firstname, routename, items[order_id],
+            main_dish_items,
+            main_dish_items + groups.count(COMPONENT_GROUP_CHOICES_SIDES)))
+
+    # A component counts once for every menu of the day including it.
+    menu_ids = list(
+        Menu.objects.filter(date=delivery_date).values_list('id', flat=True))
+    menu_components = collections.defaultdict(list)
+    in_menus = collections.Counter()
+    for component_id, name, component_group in \
+            Menu_component.objects.filter(
+                menu__date=delivery_date
+            ).order_by('menu_id', 'id').values_list(
+                'component_id', 'component__name',
+                'component__component_group'):
+        menu_components[component_group].append((component_id, name))
+        in_menus[component_id, component_group] += 1
+
+    main_dish_clashes = collections.Counter()
+    sides_clashes = set()
+    for ingredient_id, component_id, component_group in \
+            Component_ingredient.objects.filter(
+                date=delivery_date
+            ).values_list(
+                'ingredient_id', 'component_id',
+                'component__component_group'):
+        if component_group == COMPONENT_GROUP_CHOICES_MAIN_DISH:
+            main_dish_clashes[ingredient_id] += \
+                in_menus[component_id, component_group]
+        elif (component_group == COMPONENT_GROUP_CHOICES_SIDES and
+                in_menus[component_id, component_group]):
+            sides_clashes.add(ingredient_id)
+
+    # The clients' forbidden ingredients are materialized, see
+    # Client_forbidden_ingredient.
+    forbidden_ingredients = collections.defaultdict(set)
+    avoid_ingredients = collections.defaultdict(list)
+    incompatibilities = collections.defaultdict(list)
+    for client_id, ingredient_id, name, avoid_ingredient_id, \
+            restriction_id, incompatibility_id in sorted(
+                Client_forbidden_ingredient.objects.filter(
+                    client__in=client_ids
+                ).values_list(
+                    'client_id', 'ingredient_id', 'ingredient__name',
+                    'avoid_ingredient_id', 'restriction_id',
+                    'incompatibility_id'),
+                key=lambda row: (row[3] or 0, row[5] or 0)):
+        forbidden_ingredients[client_id].add(ingredient_id)
+        if avoid_ingredient_id:
+            avoid_ingredients[client_id].append((ingredient_id, name))
         else:
-            raise Exception(
-                "Query parameter '{}' not found in values".format(n))
-    return ''.join(mod), values
-
-
-def sql_exec(query, values, heading=''):
-    """Execute SQL 'query' passing to it the given 'values'.
-
-    Args:
-        query: A string, the SQL query containing parameters like %(name)s.
-        values: A dictionary of parameter values : {'name': value, ...}.
-        heading: A string that if we debug, will be printed once before
-            all the result rows.
-
-    Returns:
-        A list of named tuples, each one is a row returned by the database
-        as the result of the SQL query.
-    """
-    with connection.cursor() as cursor:
-        cursor.execute(*sql_prep(query, values))
-        rows = named_tuple_fetchall(cursor)
-    # UNCOMMENT THESE LINES FOR DEBUGGING; DO NOT REMOVE
-    # print("\n-----------------------------------------------------\n",
-    #       heading, "\n")
-    # for row in rows:
-    #     print(row)
-    #
-    return rows
-
-
-def day_avoid_ingredient(delivery_date):
-    """ Get day's avoid ingredients clashes.
-
-    For each client that has ordered a meal for 'delivery_date', find all
-    the ingredients that he avoids and identify which of those
-    ingredients are included in the main dish for 'delivery_date'.
-    Note that the 'avoid ingredients' are the ones that the client specified
-    explicitly.
-
-    Args:
-        delivery_date: A datetime.date object, the date on which the meals will
-            be delivered to the clients.
-
-    Returns:
-        A list of named tuples, each one containing the columns specified
-        in the SELECT clause.
-    """
-    query = """
-    SELECT member_client.id AS cid,
-      member_member.firstname, member_member.lastname,
-      order_order.id AS oid,
-      order_order.delivery_date,
-      meal_menu.id AS menuid,
-      meal_menu_component.id AS menucompid,
-      meal_ingredient.name AS ingredient,
-      meal_component.name AS compname,
-      meal_component.component_group,
-      order_order_item.id AS oiid,
-      order_order_item.order_id AS oiorderid
-    FROM member_member
-      JOIN member_client ON member_client.member_id = member_member.id
-      JOIN order_order ON order_order.client_id = member_client.id
-      JOIN meal_menu ON meal_menu.date =                      %(delivery_date)s
-      JOIN member_client_avoid_ingredient ON
-        member_client_avoid_ingredient.client_id = member_client.id
-      JOIN meal_ingredient ON
-        meal_ingredient.id = member_client_avoid_ingredient.ingredient_id
-      LEFT OUTER JOIN meal_component_ingredient ON
-        meal_component_ingredient.ingredient_id = meal_ingredient.id AND
-          meal_component_ingredient.date =                    %(delivery_date)s
-      LEFT OUTER JOIN meal_component ON
-        meal_component.id = meal_component_ingredient.component_id
-      LEFT OUTER JOIN order_order_item ON
-        order_order_item.order_id = order_order.id AND
-          (order_order_item.component_group = meal_component.component_group OR
-            (order_order_item.component_group = %(comp_grp_main_dish)s AND
-             meal_component.component_group = %(comp_grp_sides)s))
-      LEFT OUTER JOIN meal_menu_component ON
-        meal_menu_component.component_id = meal_component.id AND
-          meal_menu_component.menu_id = meal_menu.id
-    WHERE order_order.delivery_date =                     %(delivery_date)s AND
-      order_order.status !=                                 %(order_cancelled)s
-    ORDER BY member_client.id
-    """
-    values = {
-        'delivery_date': delivery_date,
-        'comp_grp_sides': COMPONENT_GROUP_CHOICES_SIDES,
-        'comp_grp_main_dish': COMPONENT_GROUP_CHOICES_MAIN_DISH,
-        'order_cancelled': ORDER_STATUS_CANCELLED,
-    }
-    return sql_exec(query, values, "****** Avoid ingredients ******")
-
-
-def day_restrictions(delivery_date):
-    """ Get day's restrictions.
-
-    For each client that has ordered a meal for 'delivery_date', find all
-    the ingredients that correspond to the restricted items that he specified
-    and identify which of those ingredients are included in the main dish
-    for 'delivery_date'.
-
-    Args:
-        delivery_date: A datetime.date object, the date on which the meals will
-            be delivered to the clients.
-
-    Returns:
-        A list of named tuples, each one containing the columns specified
-        in the SELECT clause.
-    """
-    query = """
-    SELECT member_client.id AS cid,
-      member_member.firstname, member_member.lastname,
-      order_order.id AS oid,
-      order_order.delivery_date,
-      meal_menu.id AS menuid,
-      meal_menu_component.id AS menucompid,
-      meal_restricted_item.name AS restricted_item,
-      meal_ingredient.name AS ingredient,
-      meal_component.name AS compname,
-      meal_component.component_group,
-      order_order_item.id AS oiid,
-      order_order_item.order_id AS oiorderid
-    FROM member_member
-      JOIN member_client ON member_client.member_id = member_member.id
-      JOIN order_order ON order_order.client_id = member_client.id
-      JOIN meal_menu ON meal_menu.date =                      %(delivery_date)s
-      JOIN member_restriction ON
-        member_restriction.client_id = member_client.id
-      JOIN meal_restricted_item ON
-        meal_restricted_item.id = member_restriction.restricted_item_id
-      LEFT OUTER JOIN meal_incompatibility ON
-        meal_incompatibility.restricted_item_id =
-          member_restriction.restricted_item_id
-      LEFT OUTER JOIN meal_ingredient ON
-        meal_incompatibility.ingredient_id = meal_ingredient.id
-      LEFT OUTER JOIN meal_component_ingredient ON
-        meal_component_ingredient.ingredient_id = meal_ingredient.id AND
-          meal_component_ingredient.date =                    %(delivery_date)s
-      LEFT OUTER JOIN meal_component ON
-        meal_component_ingredient.component_id = meal_component.id
-      LEFT OUTER JOIN order_order_item ON
-        order_order_item.order_id = order_order.id AND
-          (order_order_item.component_group = meal_component.component_group OR
-            (order_order_item.component_group = %(comp_grp_main_dish)s AND
-             meal_component.component_group = %(comp_grp_sides)s))
-      LEFT OUTER JOIN meal_menu_component ON
-        meal_menu_component.component_id = meal_component.id AND
-          meal_menu_component.menu_id = meal_menu.id
-    WHERE order_order.delivery_date =                     %(delivery_date)s AND
-      order_order.status !=                                 %(order_cancelled)s
-    ORDER BY member_client.id
-    """
-    values = {
-        'delivery_date': delivery_date,
-        'comp_grp_sides': COMPONENT_GROUP_CHOICES_SIDES,
-        'comp_grp_main_dish': COMPONENT_GROUP_CHOICES_MAIN_DISH,
-        'order_cancelled': ORDER_STATUS_CANCELLED,
-    }
-    return sql_exec(query, values, "****** Restrictions ******")
-
-
-def day_preparations(delivery_date):
-    """ Get day's preparations.
-
-    For each client that has ordered a meal for 'delivery_date', find all
-    the food preparations that he specified.
-
-    Args:
-        delivery_date: A datetime.date object, the date on which the meals will
-            be delivered to the clients.
-
-    Returns:
-        A list of named tuples, each one containing the columns specified
-        in the SELECT clause.
-    """
-    query = """
-    SELECT member_client.id AS cid,
-      member_member.firstname, member_member.lastname,
-      member_option.name AS food_prep,
-      order_order.id AS oid,
-      order_order.delivery_date
-    FROM member_member
-      JOIN member_client ON member_client.member_id = member_member.id
-      JOIN member_client_option ON
-        member_client_option.client_id = member_client.id
-      JOIN member_option ON member_option.id = member_client_option.option_id
-      JOIN order_order ON order_order.client_id = member_client.id
-      JOIN order_order_item ON
-        order_order_item.component_group =           %(comp_grp_main_dish)s AND
-          order_order_item.order_id = order_order.id
-    WHERE order_order.delivery_date =                     %(delivery_date)s AND
-      order_order.status !=                             %(order_cancelled)s AND
-      member_option.option_group =                             %(option_group)s
-    ORDER BY member_member.lastname, member_member.firstname
-    """
-    values = {
-        'delivery_date': delivery_date,
-        'option_group': OPTION_GROUP_CHOICES_PREPARATION,
-        'comp_grp_main_dish': COMPONENT_GROUP_CHOICES_MAIN_DISH,
-        'order_cancelled': ORDER_STATUS_CANCELLED,
-    }
-    return sql_exec(query, values, "****** Preparations ******")
-
-
-def day_delivery_items(delivery_date):
-    """ Get day's Delivery Items.
-
-    For each client that has ordered something for 'delivery_date', find his
-    route and all the details and quantities for the items that have to
-    be delivered.
-
-    Args:
-        delivery_date: A datetime.date object, the date on which the meals will
-            be delivered to the clients.
-
-    Returns:
-        A list of named tuples, each one containing the columns specified
-        in the SELECT clause.
-    """
-    query = """
-    SELECT member_client.id AS cid,
-      member_member.firstname, member_member.lastname,
-      member_route.name AS routename,
-      order_order_item.total_quantity, order_order_item.size,
-      meal_menu.id AS menuid,
-      meal_menu_component.id AS mencomid,
-      meal_component.id AS component_id, meal_component.component_group,
-      meal_component.name AS component_name
-    FROM member_member
-      JOIN member_client ON member_client.member_id = member_member.id
-      JOIN member_route ON member_route.id = member_client.route_id
-      JOIN meal_menu ON meal_menu.date =                      %(delivery_date)s
-      JOIN order_order ON order_order.client_id = member_client.id
-      JOIN order_order_item ON order_order_item.order_id = order_order.id
-      JOIN meal_menu_component ON meal_menu_component.menu_id = meal_menu.id
-      JOIN meal_component ON
-        meal_component.id = meal_menu_component.component_id AND
-          meal_component.component_group = order_order_item.component_group
-    WHERE order_order.delivery_date =                     %(delivery_date)s AND
-      order_order.status !=                                 %(order_cancelled)s
-    ORDER BY member_member.lastname, member_member.firstname
-    """
-    values = {
-        'delivery_date': delivery_date,
-        'order_cancelled': ORDER_STATUS_CANCELLED,
-    }
-    return sql_exec(query, values, "****** Delivery List ******")
+            incompatibilities[restriction_id].append((ingredient_id, name))
+
+    restrictions = collections.defaultdict(list)
+    for restriction_id, client_id, name in Restriction.objects.filter(
+            client__in=client_ids
+    ).order_by('id').values_list('id', 'client_id', 'restricted_item__name'):
+        restrictions[client_id].append((restriction_id, name))
+
+    preparations = collections.defaultdict(list)
+    for client_id, name in Client_option.objects.filter(
+            client__in=client_ids,
+            option__option_group=OPTION_GROUP_CHOICES_PREPARATION
+    ).order_by('id').values_list('client_id', 'option__name'):
+        preparations[client_id].append(name)
+
+    return KitchenDay(
+        orders=kitchen_orders,
+        menu_ids=menu_ids,
+        menu_components=menu_components,
+        main_dish_clashes=main_dish_clashes,
+        sides_clashes=sides_clashes,
+        clashing_ingredients=(
+            {ingredient_id for ingredient_id, count in
+             main_dish_clashes.items() if count} | sides_clashes),
+        forbidden_ingredients=forbidden_ingredients,
+        avoid_ingredients=avoid_ingredients,
+        restrictions=restrictions,
+        incompatibilities=incompatibilities,
+        preparations=preparations)
 
 
 KitchenItem = collections.namedtuple(         # Meal specifics for an order.
@@ -989,31 +999,53 @@ MealComponent = collections.namedtuple(       # Component specifics for a meal.
      'qty'])                         # Quantity of this component in the order
 
 
-def check_for_new_client(kitchen_list, row):
-    """ Add KitchenItem entry when client is found the first time.
+class KitchenRecord(object):
+    """Mutable KitchenItem, filled while reading the day's orders.
 
-    Modifies kitchen_list by adding an entry.
+    Its meal components are lists [id, name, qty] updated in place.
+    """
+    __slots__ = KitchenItem._fields
+
+    def __init__(self, lastname, firstname):
+        self.lastname = lastname
+        self.firstname = firstname
+        self.routename = None
+        self.meal_qty = 0
+        self.meal_size = ''
+        self.incompatible_ingredients = []
+        self.sides_clashes = []
+        self.avoid_ingredients = []
+        self.restricted_items = []
+        self.preparation = []
+        self.meal_components = {}
+
+    def kitchen_item(self):
+        """Returns the KitchenItem named tuple of this record."""
+        values = {field: getattr(self, field) for field in self.__slots__}
+        values['meal_components'] = {
+            component_group: MealComponent(*component)
+            for component_group, component in self.meal_components.items()
+        }
+        return KitchenItem(**values)
+
+
+def kitchen_record(kitchen_list, order):
+    """ Add KitchenRecord entry when client is found the first time.
 
     Args:
         kitchen_list: A dictionary where the key is an Integer 'client id'
-            and the value is a KitchenItem named tuple.
-        row: An object having an attribute 'cid' that represents
-            an Integer 'client id'.
+            and the value is a KitchenRecord.
+        order: A KitchenOrder of the client.
+
+    Returns:
+        The KitchenRecord of the client.
     """
-    if not kitchen_list.get(row.cid):
+    item = kitchen_list.get(order.client_id)
+    if item is None:
         # found new client
-        kitchen_list[row.cid] = KitchenItem(
-            lastname=row.lastname,
-            firstname=row.firstname,
-            routename=None,
-            meal_qty=0,
-            meal_size='',
-            incompatible_ingredients=[],
-            sides_clashes=[],
-            avoid_ingredients=[],
-            restricted_items=[],
-            preparation=[],
-            meal_components={})
+        item = kitchen_list[order.client_id] = KitchenRecord(
+            order.lastname, order.firstname)
+    return item
 
 # End Order.kitchen items helpers
 
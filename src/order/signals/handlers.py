@@ -0,0 +1,149 @@
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from meal.models import (Component, Component_ingredient, Incompatibility,
+                         Ingredient, Menu, Menu_component, Restricted_item)
+from member.models import (Address, Client, Client_avoid_ingredient,
+                           Client_option, Member, Option, Restriction, Route)
+from ..cache import invalidate_kitchen_count
+from ..models import Order, Order_item
+
+
+# Changes to the data of a delivery date.
+
+@receiver(
+    pre_save,
+    sender=Order,
+    dispatch_uid="pre_save.order_kitchen_count_moved"
+)
+def order_moved(sender, instance, raw, **kwargs):
+    if instance.pk is None or raw:
+        return
+    previous_date = Order.objects.filter(
+        pk=instance.pk).values_list('delivery_date', flat=True).first()
+    if previous_date and previous_date != instance.delivery_date:
+        invalidate_kitchen_count(previous_date)
+
+
+@receiver(post_save, sender=Order,
+          dispatch_uid="post_save.order_kitchen_count")
+@receiver(post_delete, sender=Order,
+          dispatch_uid="post_delete.order_kitchen_count")
+def order_changed(sender, instance, **kwargs):
+    invalidate_kitchen_count(instance.delivery_date)
+
+
+@receiver(post_save, sender=Order_item,
+          dispatch_uid="post_save.order_item_kitchen_count")
+@receiver(post_delete, sender=Order_item,
+          dispatch_uid="post_delete.order_item_kitchen_count")
+def order_item_changed(sender, instance, **kwargs):
+    delivery_date = Order.objects.filter(
+        pk=instance.order_id).values_list('delivery_date', flat=True).first()
+    if delivery_date:
+        invalidate_kitchen_count(delivery_date)
+
+
+@receiver(post_save, sender=Menu,
+          dispatch_uid="post_save.menu_kitchen_count")
+@receiver(post_delete, sender=Menu,
+          dispatch_uid="post_delete.menu_kitchen_count")
+def menu_changed(sender, instance, **kwargs):
+    invalidate_kitchen_count(instance.date)
+
+
+@receiver(post_save, sender=Menu_component,
+          dispatch_uid="post_save.menu_component_kitchen_count")
+@receiver(post_delete, sender=Menu_component,
+          dispatch_uid="post_delete.menu_component_kitchen_count")
+def menu_component_changed(sender, instance, **kwargs):
+    menu_date = Menu.objects.filter(
+        pk=instance.menu_id).values_list('date', flat=True).first()
+    if menu_date:
+        invalidate_kitchen_count(menu_date)
+
+
+@receiver(post_save, sender=Component_ingredient,
+          dispatch_uid="post_save.component_ingredient_kitchen_count")
+@receiver(post_delete, sender=Component_ingredient,
+          dispatch_uid="post_delete.component_ingredient_kitchen_count")
+def day_ingredient_changed(sender, instance, **kwargs):
+    if instance.date:  # recipe ingredients have no date
+        invalidate_kitchen_count(instance.date)
+
+
+# Changes to what the kitchen count shows about a client: the dates of
+# the client's orders from today on are invalidated. The clients are
+# found before a deletion, while the deleted row still links them.
+
+KITCHEN_COUNT_CLIENT_SENDERS = {
+    # model: (fields shown by the kitchen count, or None for all fields,
+    #         function giving the clients concerned by an instance)
+    Address: (('latitude', 'longitude'),
+              lambda address: Client.objects.filter(member__address=address)),
+    Client: (('member', 'route'), lambda client: [client.pk]),
+    Client_avoid_ingredient: (None, lambda row: [row.client_id]),
+    Client_option: (None, lambda row: [row.client_id]),
+    Member: (('firstname', 'lastname', 'address'),
+             lambda member: Client.objects.filter(member=member)),
+    Restriction: (None, lambda row: [row.client_id]),
+    Route: (('name',), lambda route: Client.objects.filter(route=route)),
+}
+
+
+# Changes to the dishes, ingredients and options, shown on every date.
+
+KITCHEN_COUNT_SENDERS = {
+    # model: fields shown by the kitchen count, or None for all fields
+    Component: ('name', 'component_group'),
+    Incompatibility: None,
+    Ingredient: ('name',),
+    Option: ('name', 'option_group'),
+    Restricted_item: ('name',),
+}
+
+
+def shown_fields_changed(instance, update_fields, shown_fields):
+    """
+    Returns False if the save of `instance` is limited by `update_fields`
+    to fields that the kitchen count does not show.
+    """
+    if update_fields is None or shown_fields is None:
+        return True
+    return any(instance._meta.get_field(name).name in shown_fields
+               for name in update_fields)
+
+
+def kitchen_count_client_changed(sender, instance, update_fields=None,
+                                 **kwargs):
+    shown_fields, get_clients = KITCHEN_COUNT_CLIENT_SENDERS[sender]
+    if not shown_fields_changed(instance, update_fields, shown_fields):
+        return
+    for delivery_date in Order.objects.get_upcoming_delivery_dates(
+            get_clients(instance)):
+        invalidate_kitchen_count(delivery_date)
+
+
+def kitchen_count_data_changed(sender, instance, update_fields=None,
+                               **kwargs):
+    if shown_fields_changed(
+            instance, update_fields, KITCHEN_COUNT_SENDERS[sender]):
+        invalidate_kitchen_count()
+
+
+for model in KITCHEN_COUNT_CLIENT_SENDERS:
+    for signal in (post_save, pre_delete):
+        signal.connect(
+            kitchen_count_client_changed, sender=model,
+            dispatch_uid="{}.{}_kitchen_count".format(
+                'post_save' if signal is post_save else 'pre_delete',
+                model.__name__.lower()))
+
+for model in KITCHEN_COUNT_SENDERS:
+    for signal in (post_save, post_delete):
+        signal.connect(
+            kitchen_count_data_changed, sender=model,
+            dispatch_uid="{}.{}_kitchen_count".format(
+                'post_save' if signal is post_save else 'post_delete',
+                model.__name__.lower()))
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import io
 import random
 import urllib.parse
 import importlib
@@ -14,11 +15,17 @@ from django.utils import timezone
 from django.utils.translation import ugettext as _
 from django.core.exceptions import ValidationError
 from django.core.management import call_command
+from django.db import connection
 from django.db.models import Q, Sum
+from django.test.utils import CaptureQueriesContext
 
-from member.models import (Client, Address, Member, Route, DAYS_OF_WEEK)
+from member.models import (Client, Address, Member, Route, DAYS_OF_WEEK,
+                           Option, Client_option, Restriction,
+                           Client_avoid_ingredient)
 from member.factories import RouteFactory, ClientFactory
 from meal.factories import ComponentFactory
+from meal.models import (Component, Component_ingredient, Incompatibility,
+                         Ingredient, Menu, Menu_component, Restricted_item)
 from order.models import Order, Order_item, MAIN_PRICE_DEFAULT, \
     OrderStatusChange, COMPONENT_GROUP_CHOICES_MAIN_DISH, \
     ORDER_ITEM_TYPE_CHOICES_COMPONENT, \
@@ -419,6 +426,92 @@ class OrderAutoCreateOnDefaultsTestCase(TestCase):
         self.assertEqual(fruit_salad_item.total_quantity, 1)
         self.assertEqual(items.filter(component_group='compote').count(), 0)
 
+    def test_bulk_auto_create_orders_same_as_per_client(self):
+        """
+        The bulk mode must create the same orders, items and prices as the
+        per-client mode.
+        """
+        def snapshot():
+            return {
+                order.client_id: (
+                    order.price,
+                    sorted(order.orders.values_list(
+                        'component_group', 'order_item_type', 'size',
+                        'total_quantity', 'price', 'billable_flag'),
+                        key=str)
+                )
+                for order in Order.objects.filter(
+                    delivery_date=self.delivery_date)
+            }
+
+        Order.objects.auto_create_orders(
+            self.delivery_date, self.ongoing_clients)
+        expected = snapshot()
+        Order.objects.filter(delivery_date=self.delivery_date).delete()
+
+        created_orders = Order.objects.auto_create_orders(
+            self.delivery_date, self.ongoing_clients, bulk=True)
+        self.assertEqual(
+            [o.client_id for o in created_orders],
+            [c.pk for c in self.ongoing_clients])
+        self.assertTrue(all(o.pk for o in created_orders))
+        self.assertEqual(snapshot(), expected)
+
+    def test_bulk_auto_create_orders_existing_order(self):
+        """
+        Existing orders are returned and not duplicated in bulk mode.
+        """
+        client = random.choice(self.ongoing_clients)
+        order = OrderFactory(
+            delivery_date=self.delivery_date,
+            client=client,
+        )
+        created_orders = Order.objects.bulk_auto_create_orders(
+            self.delivery_date, self.ongoing_clients)
+        self.assertEqual(len(created_orders), len(self.ongoing_clients))
+        self.assertIn(order, created_orders)
+        self.assertEqual(Order.objects.filter(client=client).count(), 1)
+
+    def test_bulk_auto_create_orders_duplicates_same_as_per_client(self):
+        """
+        A client listed twice gets a single order, returned twice, and a
+        client with several orders on the date is an error, in both modes.
+        """
+        client = self.ongoing_clients[0]
+        clients = list(self.ongoing_clients) + [client]
+        for bulk in (False, True):
+            Order.objects.filter(delivery_date=self.delivery_date).delete()
+            created_orders = Order.objects.auto_create_orders(
+                self.delivery_date, clients, bulk=bulk)
+            self.assertEqual(
+                [o.client_id for o in created_orders],
+                [c.pk for c in clients])
+            self.assertEqual(created_orders[0].pk, created_orders[-1].pk)
+            self.assertEqual(
+                Order.objects.filter(client=client).count(), 1)
+
+        for bulk in (False, True):
+            Order.objects.filter(delivery_date=self.delivery_date).delete()
+            OrderFactory.create_batch(
+                2, delivery_date=self.delivery_date, client=client)
+            with self.assertRaises(Order.MultipleObjectsReturned):
+                Order.objects.auto_create_orders(
+                    self.delivery_date, [client], bulk=bulk)
+
+    def test_bulk_auto_create_orders_num_queries(self):
+        """
+        The number of queries doesn't depend on the number of clients.
+        """
+        clients = Client.objects.filter(
+            pk__in=[c.pk for c in self.ongoing_clients])
+        with CaptureQueriesContext(connection) as queries:
+            Order.objects.bulk_auto_create_orders(
+                self.delivery_date, clients)
+        self.assertLessEqual(len(queries), 10)
+        self.assertEqual(
+            Order.objects.filter(delivery_date=self.delivery_date).count(),
+            len(self.ongoing_clients))
+
 
 class OrderManualCreateTestCase(SousChefTestMixin, TestCase):
 
@@ -1623,6 +1716,79 @@ class RedirectAnonymousUserTestCase(SousChefTestMixin, TestCase):
         check(reverse('order:delete', kwargs={'pk': 1}))
 
 
+class KitchenItemsTestCase(TestCase):
+
+    fixtures = ['routes.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.delivery_date = date(2017, 11, 23)
+        pork = Ingredient.objects.create(name='Pork')
+        nuts = Ingredient.objects.create(name='Nuts')
+        main_dish = Component.objects.create(
+            name='Ginger pork', component_group='main_dish')
+        sides = Component.objects.create(
+            name='Sides', component_group='sides')
+        menu = Menu.objects.create(date=cls.delivery_date)
+        Menu_component.objects.create(menu=menu, component=main_dish)
+        Menu_component.objects.create(menu=menu, component=sides)
+        Component_ingredient.objects.create(
+            component=main_dish, ingredient=pork, date=cls.delivery_date)
+        Component_ingredient.objects.create(
+            component=sides, ingredient=nuts, date=cls.delivery_date)
+        allergy = Restricted_item.objects.create(
+            name='Nuts allergy', restricted_item_group='allergies')
+        Incompatibility.objects.create(
+            restricted_item=allergy, ingredient=nuts)
+        puree = Option.objects.create(
+            name='Puree all', option_group='preparation')
+
+        cls.clients = ClientFactory.create_batch(
+            3, route=Route.objects.first())
+        Client_avoid_ingredient.objects.create(
+            client=cls.clients[0], ingredient=pork)
+        Restriction.objects.create(
+            client=cls.clients[1], restricted_item=allergy)
+        Client_option.objects.create(client=cls.clients[2], option=puree)
+        for client in cls.clients:
+            order = Order.objects.create(
+                client=client, delivery_date=cls.delivery_date)
+            for group in ('main_dish', 'sides'):
+                Order_item.objects.create(
+                    order=order, price=1, billable_flag=True, size='L',
+                    order_item_type=ORDER_ITEM_TYPE_CHOICES_COMPONENT,
+                    total_quantity=2, component_group=group)
+
+    def test_get_kitchen_items(self):
+        kitchen_list = Order.get_kitchen_items(self.delivery_date)
+        avoid, restricted, prepared = (
+            kitchen_list[client.id] for client in self.clients)
+        self.assertEqual(avoid.incompatible_ingredients, ['Pork'])
+        self.assertEqual(avoid.avoid_ingredients, ['Pork'])
+        self.assertEqual(avoid.sides_clashes, [])
+        self.assertEqual(restricted.incompatible_ingredients, [])
+        self.assertEqual(restricted.restricted_items, ['Nuts allergy'])
+        self.assertEqual(restricted.sides_clashes, ['Nuts allergy'])
+        self.assertEqual(prepared.preparation, ['Puree all'])
+        self.assertEqual(prepared.meal_qty, 2)
+        self.assertEqual(prepared.meal_size, 'L')
+        self.assertEqual(
+            prepared.meal_components['main_dish'].name, 'Ginger pork')
+        self.assertEqual(prepared.meal_components['sides'].qty, 2)
+        self.assertEqual(
+            prepared.routename, self.clients[2].route.name)
+
+    def test_get_kitchen_items_num_queries(self):
+        """The number of queries does not depend on the orders."""
+        with self.assertNumQueries(8):
+            Order.get_kitchen_items(self.delivery_date)
+        for client in ClientFactory.create_batch(5):
+            Order.objects.create(
+                client=client, delivery_date=self.delivery_date)
+        with self.assertNumQueries(8):
+            Order.get_kitchen_items(self.delivery_date)
+
+
 class CommandsTestCase(TestCase):
     "Test custom manage.py commands"
 
@@ -1704,6 +1870,72 @@ class CommandsTestCase(TestCase):
             len(self.ongoing_clients) * 2
         )
 
+    def test_generateorders_summary(self):
+        """Report the orders created per date and in total"""
+
+        out = io.StringIO()
+        call_command('generateorders', "2016-11-25", days=4, stdout=out)
+        output = out.getvalue()
+        # Friday and Monday are the only days with meals defaults
+        self.assertIn(
+            "{} orders created on 2016-11-25: to be delivered on "
+            "2016-11-28".format(len(self.ongoing_clients)), output)
+        self.assertIn(
+            "0 orders created on 2016-11-25: to be delivered on "
+            "2016-11-26", output)
+        self.assertIn(
+            "{} orders created for 4 day(s)".format(
+                len(self.ongoing_clients) * 2), output)
+
+    def test_generateorders_processes(self):
+        """Generate the orders of several days in a pool of processes"""
+
+        class FakePool:
+            """Runs the tasks of a multiprocessing.Pool in this process."""
+            created = []
+
+            def __init__(self, processes, initializer, initargs):
+                self.created.append(processes)
+                initializer(*initargs)
+
+            def map(self, func, iterable):
+                return [func(item) for item in iterable]
+
+            def close(self):
+                pass
+
+            def join(self):
+                pass
+
+        command = 'order.management.commands.generateorders'
+        out = io.StringIO()
+        with patch(command + '.connection') as connection, \
+                patch(command + '.connections') as connections, \
+                patch(command + '.multiprocessing.Pool', FakePool):
+            # SQLite is kept to one process
+            connection.vendor = 'postgresql'
+            call_command('generateorders', "2016-11-25", days=4,
+                         processes=3, stdout=out)
+        self.assertEqual(FakePool.created, [3])
+        self.assertTrue(connections.close_all.called)
+        self.assertIn(
+            "{} orders created for 4 day(s)".format(
+                len(self.ongoing_clients) * 2), out.getvalue())
+        self.assertEqual(
+            Order.objects.filter(
+                delivery_date=datetime.date(2016, 11, 28)).count(),
+            len(self.ongoing_clients))
+
+    def test_benchmarkkitchenitems(self):
+        out = io.StringIO()
+        orders_count = Order.objects.count()
+        call_command('benchmarkkitchenitems', 5, 20, stdout=out)
+        output = out.getvalue()
+        self.assertIn("5 orders: 5 kitchen items, 8 queries", output)
+        self.assertIn("20 orders: 20 kitchen items, 8 queries", output)
+        # The generated data is rolled back.
+        self.assertEqual(Order.objects.count(), orders_count)
+
     def test_generateorders_create_only_if_scheduled_today(self):
         """
         Refs bug #734.
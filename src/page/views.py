@@ -9,11 +9,17 @@ from django.contrib.auth.mixins import PermissionRequiredMixin
 from django.urls import reverse_lazy
 from django.db.models import Prefetch
 from django.views.generic import TemplateView
-from member.models import Client, Route, Client_option, DAYS_OF_WEEK
+from meal.models import COMPONENT_GROUP_CHOICES_MAIN_DISH
+from member.models import (Client, Route, Client_option, DAYS_OF_WEEK,
+                           MEALS_DEFAULT_COMPONENTS)
 from order.models import Order
 from datetime import datetime
 
 
+MAIN_DISH_INDEX = MEALS_DEFAULT_COMPONENTS.index(
+    COMPONENT_GROUP_CHOICES_MAIN_DISH)
+
+
 class HomeView(LoginRequiredMixin, PermissionRequiredMixin, TemplateView):
     permission_required = 'sous_chef.read'
     template_name = 'pages/home.html'
@@ -66,18 +72,17 @@ class HomeView(LoginRequiredMixin, PermissionRequiredMixin, TemplateView):
             defaults = collections.defaultdict(int)
             schedules = collections.defaultdict(int)
             for client in route.selected_clients:
-                meals_schedule = dict(client.meals_schedule)
-                meals_default = dict(client.meals_default)
+                compiled = client.compiled_meals_schedule
 
                 # For each day, if there's a schedule, count schedule.
                 # Otherwise, count default.
-                for day, _ in DAYS_OF_WEEK:
-                    if day in meals_schedule:
-                        schedules[day] += meals_schedule[day].get(
-                            'main_dish') or 0
+                for weekday, (day, _) in enumerate(DAYS_OF_WEEK):
+                    main_dish = compiled.quantities[weekday][
+                        MAIN_DISH_INDEX] or 0
+                    if client.is_scheduled_on(weekday):
+                        schedules[day] += main_dish
                     else:
-                        defaults[day] += meals_default[day].get(
-                            'main_dish') or 0
+                        defaults[day] += main_dish
 
             route_table.append((route.name, defaults, schedules))
         return route_table
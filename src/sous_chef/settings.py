@@ -72,10 +72,10 @@ INSTALLED_APPS = [
     'sous_chef',
     'billing',
     'datamigration',
-    'delivery',
+    'delivery.apps.DeliveryConfig',
     'meal',
     'member.apps.MemberConfig',
-    'order',
+    'order.apps.OrderConfig',
     'notification',
     'page',
     'note',
@@ -202,6 +202,55 @@ FORMAT_MODULE_PATH = (
     'sous_chef.formats',
 )
 
+# Cache shared by the workers of the server (see order/cache.py), in the
+# directory SOUSCHEF_CACHE_DIR, src/cache by default
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get(
+            'SOUSCHEF_CACHE_DIR', os.path.join(BASE_DIR, 'cache')),
+    }
+}
+
+# Background rendering of the delivery reports (see delivery/jobs.py),
+# in the directory SOUSCHEF_REPORTS_ROOT, src/reports by default
+REPORTS_ROOT = os.environ.get(
+    'SOUSCHEF_REPORTS_ROOT', os.path.join(BASE_DIR, 'reports'))
+REPORT_JOBS_ASYNC = True
+REPORT_JOB_WORKERS = 2
+REPORT_JOB_TIMEOUT = 10 * 60  # seconds
+# Processes rendering the meal labels, None for one per CPU
+MEAL_LABELS_PROCESSES = None
+
+# Orders carried on a delivery by each vehicle of member.ROUTE_VEHICLES,
+# when the routes of a day are proposed (see delivery/vrp.py)
+ROUTE_VEHICLE_CAPACITIES = {
+    'cycling': 20,
+    'walking': 10,
+    'driving': 40,
+}
+
+# Processes optimizing the routes of a day, None for one per CPU
+ROUTE_OPTIMISATION_PROCESSES = None
+# Limits of the optimisation of the routes of a day requested from the
+# routes page (see delivery.views.OptimizeRoutes): the seconds allowed
+# to improve each route, and the most worker processes
+ROUTE_OPTIMISATION_REQUEST_BUDGET = 2
+ROUTE_OPTIMISATION_REQUEST_PROCESSES = 2
+
+# Travel costs between the stops of the routes (see delivery/cache.py):
+# straight-line distances by default, or travel times on an offline road
+# network file, e.g.
+# {
+#     'BACKEND': 'delivery.road_network.RoadNetworkProvider',
+#     'OPTIONS': {'path': '/path/to/montreal.npz'},
+# }
+ROUTE_COST_PROVIDER = {
+    'BACKEND': 'delivery.distances.EquirectangularProvider',
+    'OPTIONS': {},
+}
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/1.11/howto/static-files/
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
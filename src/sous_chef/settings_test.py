@@ -1,3 +1,5 @@
+import tempfile
+
 from .settings import *
 
 
@@ -12,3 +14,16 @@ DATABASES = {
         'NAME': ':memory:',
     }
 }
+
+# Test cases roll back their changes without changing the versions of
+# the cached kitchen counts: do not share them between tests.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    }
+}
+
+# The in-memory test database is not shared with other threads: render
+# the reports within the request.
+REPORT_JOBS_ASYNC = False
+REPORTS_ROOT = os.path.join(tempfile.gettempdir(), 'souschef-reports')